@@ -2,6 +2,6 @@
 # This runs the worker on periodic burst mode so that changes made to taskse
 # during development will be applied when the worker executes them
 while true; do
-    python /app/manage.py rqworker --burst
+    python /app/manage.py rqworker --burst --worker-class coordinator.worker.Worker
     sleep 10
 done
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from coordinator import scheduler
+
+
+class Command(BaseCommand):
+    help = "Run the scheduler for status and health sweeps"
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS("Starting scheduler"))
+        scheduler.run()
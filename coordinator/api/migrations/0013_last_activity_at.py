@@ -0,0 +1,42 @@
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+import django.utils.timezone
+
+
+def backfill(apps, schema_editor):
+    """
+    Set the last activity of existing releases and tasks from their events
+    """
+    Event = apps.get_model('api', 'Event')
+    for model_name, field in [('Release', 'release'), ('Task', 'task')]:
+        model = apps.get_model('api', model_name)
+        latest = (
+            Event.objects.filter(**{field: OuterRef('pk')})
+            .values(field)
+            .annotate(latest=Max('created_at'))
+            .values('latest')
+        )
+        model.objects.filter(events__isnull=False).update(
+            last_activity_at=Subquery(latest)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_extend_event_message'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='release',
+            name='last_activity_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='Time of the latest event for the release'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='last_activity_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='Time of the latest event for the task'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_last_activity_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxMessage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message', models.TextField(help_text='The body of the SNS message')),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='Time the message was written')),
+                ('attempts', models.IntegerField(default=0, help_text='Number of failed attempts to publish the message')),
+            ],
+        ),
+    ]
@@ -0,0 +1,83 @@
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+STATES = ['waiting', 'initialized', 'running', 'staged', 'publishing', 'published', 'rejected', 'failed', 'canceled']
+
+
+def backfill(apps, schema_editor):
+    """
+    Count the tasks of existing releases
+    """
+    Release = apps.get_model('api', 'Release')
+    counts = {
+        f'{state}_tasks': Count('tasks', filter=Q(tasks__state=state))
+        for state in STATES
+    }
+    for release in Release.objects.annotate(
+        n_tasks=Count('tasks'), **{f'n_{k}': v for k, v in counts.items()}
+    ):
+        Release.objects.filter(pk=release.pk).update(
+            task_count=release.n_tasks,
+            **{k: getattr(release, f'n_{k}') for k in counts}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='release',
+            name='task_count',
+            field=models.IntegerField(default=0, help_text='Number of tasks in the release'),
+        ),
+        migrations.AddField(
+            model_name='release',
+            name='waiting_tasks',
+            field=models.IntegerField(default=0, help_text='Number of waiting tasks'),
+        ),
+        migrations.AddField(
+            model_name='release',
+            name='initialized_tasks',
+            field=models.IntegerField(default=0, help_text='Number of initialized tasks'),
+        ),
+        migrations.AddField(
+            model_name='release',
+            name='running_tasks',
+            field=models.IntegerField(default=0, help_text='Number of running tasks'),
+        ),
+        migrations.AddField(
+            model_name='release',
+            name='staged_tasks',
+            field=models.IntegerField(default=0, help_text='Number of staged tasks'),
+        ),
+        migrations.AddField(
+            model_name='release',
+            name='publishing_tasks',
+            field=models.IntegerField(default=0, help_text='Number of publishing tasks'),
+        ),
+        migrations.AddField(
+            model_name='release',
+            name='published_tasks',
+            field=models.IntegerField(default=0, help_text='Number of published tasks'),
+        ),
+        migrations.AddField(
+            model_name='release',
+            name='rejected_tasks',
+            field=models.IntegerField(default=0, help_text='Number of rejected tasks'),
+        ),
+        migrations.AddField(
+            model_name='release',
+            name='failed_tasks',
+            field=models.IntegerField(default=0, help_text='Number of failed tasks'),
+        ),
+        migrations.AddField(
+            model_name='release',
+            name='canceled_tasks',
+            field=models.IntegerField(default=0, help_text='Number of canceled tasks'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_release_task_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskservice',
+            name='health_checked_at',
+            field=models.DateTimeField(blank=True, help_text="Time of the last ping to the task's /status endpoint", null=True),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 2.2.13 on 2026-10-18 20:55
+
+from django.db import migrations, models
+
+
+def add_index_concurrently(model_name, index, sql):
+    """
+    Add an index without locking the table against writes while it builds,
+    which CREATE INDEX CONCURRENTLY can't do inside a transaction
+    """
+    return migrations.SeparateDatabaseAndState(
+        state_operations=[
+            migrations.AddIndex(model_name=model_name, index=index),
+        ],
+        database_operations=[
+            migrations.RunSQL(
+                'CREATE INDEX CONCURRENTLY IF NOT EXISTS {}'.format(sql),
+                'DROP INDEX CONCURRENTLY IF EXISTS "{}"'.format(index.name),
+            ),
+        ],
+    )
+
+
+class Migration(migrations.Migration):
+
+    # Events and tasks are large and written to constantly
+    atomic = False
+
+    dependencies = [
+        ('api', '0017_event_created_at_kf_id'),
+    ]
+
+    operations = [
+        add_index_concurrently(
+            'event',
+            models.Index(fields=['release', 'created_at'], name='event_release_created_at'),
+            '"event_release_created_at" ON "api_event" ("release_id", "created_at")',
+        ),
+        add_index_concurrently(
+            'event',
+            models.Index(fields=['task', 'created_at'], name='event_task_created_at'),
+            '"event_task_created_at" ON "api_event" ("task_id", "created_at")',
+        ),
+        add_index_concurrently(
+            'event',
+            models.Index(fields=['task_service', 'created_at'], name='event_service_created_at'),
+            '"event_service_created_at" ON "api_event" ("task_service_id", "created_at")',
+        ),
+        migrations.AddIndex(
+            model_name='release',
+            index=models.Index(fields=['created_at'], name='release_created_at'),
+        ),
+        migrations.AddIndex(
+            model_name='release',
+            index=models.Index(fields=['state', 'created_at'], name='release_state_created_at'),
+        ),
+        migrations.AddIndex(
+            model_name='release',
+            index=models.Index(condition=models.Q(state__in=['initializing', 'running', 'publishing', 'canceling']), fields=['state'], name='release_active_state'),
+        ),
+        migrations.AddIndex(
+            model_name='releasenote',
+            index=models.Index(fields=['created_at'], name='releasenote_created_at'),
+        ),
+        add_index_concurrently(
+            'task',
+            models.Index(fields=['created_at'], name='task_created_at'),
+            '"task_created_at" ON "api_task" ("created_at")',
+        ),
+        add_index_concurrently(
+            'task',
+            models.Index(condition=models.Q(state__in=['running', 'publishing']), fields=['state'], name='task_active_state'),
+            '"task_active_state" ON "api_task" ("state") '
+            'WHERE "state" IN (\'running\', \'publishing\')',
+        ),
+        migrations.AddIndex(
+            model_name='taskservice',
+            index=models.Index(fields=['created_at'], name='taskservice_created_at'),
+        ),
+    ]
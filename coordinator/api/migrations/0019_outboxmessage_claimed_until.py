@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outboxmessage',
+            name='attempts',
+            field=models.IntegerField(default=0, help_text='Number of attempts to publish the message'),
+        ),
+        migrations.AddField(
+            model_name='outboxmessage',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, help_text='Time the claim of the publisher expires', null=True),
+        ),
+    ]
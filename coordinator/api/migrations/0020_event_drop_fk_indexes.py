@@ -0,0 +1,58 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def drop_fk_index(name, field, index, column):
+    """
+    Drop the index of a foreign key that's covered by the leading column of
+    one of the event's (fk, created_at) indexes
+    """
+    return migrations.SeparateDatabaseAndState(
+        state_operations=[
+            migrations.AlterField(model_name='event', name=name, field=field),
+        ],
+        database_operations=[
+            migrations.RunSQL(
+                'DROP INDEX CONCURRENTLY IF EXISTS "{}"'.format(index),
+                'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{}" '
+                'ON "api_event" ("{}")'.format(index, column),
+            ),
+            # The kf_id keys are varchars, which also get an index for LIKE
+            migrations.RunSQL(
+                'DROP INDEX CONCURRENTLY IF EXISTS "{}_like"'.format(index),
+                'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{}_like" '
+                'ON "api_event" ("{}" varchar_pattern_ops)'.format(
+                    index, column),
+            ),
+        ],
+    )
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('api', '0019_outboxmessage_claimed_until'),
+    ]
+
+    operations = [
+        drop_fk_index(
+            'release',
+            models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='events', to='api.Release'),
+            'api_event_release_id_9f0208b9',
+            'release_id',
+        ),
+        drop_fk_index(
+            'task',
+            models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='events', to='api.Task'),
+            'api_event_task_id_24131ecc',
+            'task_id',
+        ),
+        drop_fk_index(
+            'task_service',
+            models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='events', to='api.TaskService'),
+            'api_event_task_service_id_bcf2ecd8',
+            'task_service_id',
+        ),
+    ]
@@ -1,17 +1,20 @@
-import boto3
-import json
+import django_rq
 
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django_fsm.signals import post_transition
 
+from coordinator import deadlines, response_cache, scheduler, sns
 from coordinator.api.models.task import Task, task_id
 from coordinator.api.models.taskservice import TaskService, task_service_id
 from coordinator.api.models.release import Release, release_id
 from coordinator.api.models.event import Event, event_id
 from coordinator.api.models.study import Study
 from coordinator.api.models.release_note import ReleaseNote
+from coordinator.api.models.outbox import OutboxMessage
 
 
 @receiver(post_transition, sender=Release)
@@ -23,6 +26,8 @@ def create_release_event(sender, instance, name, source, target, **kwargs):
                                source, target),
                release=instance)
     ev.save()
+    instance.last_activity_at = ev.created_at
+    deadlines.update(instance)
 
 
 @receiver(post_transition, sender=Task)
@@ -35,30 +40,68 @@ def create_task_event(sender, instance, name, source, target, **kwargs):
                task=instance,
                task_service=instance.task_service)
     ev.save()
+    instance.last_activity_at = ev.created_at
+    deadlines.update(instance)
+    # Watch the task closely again now that it's in a new state
+    scheduler.reset(instance.kf_id)
+
+
+@receiver(post_delete, sender=Task)
+def uncount_task(sender, instance, **kwargs):
+    """ Remove a deleted task from its release's task counters """
+    state = getattr(instance, '_saved_state', instance.state)
+    Release.count_task(instance.release_id, state, None)
+
+
+@receiver(post_save, sender=Event)
+def update_last_activity(sender, instance, created, **kwargs):
+    """
+    Record the event as the latest activity on its release and task so that
+    timeouts can be checked without searching through events
+    """
+    if not created:
+        return
+
+    for model, field in [(Release, 'release'), (Task, 'task')]:
+        pk = getattr(instance, f'{field}_id')
+        if pk is None:
+            continue
+        # Only ever move forward in case events are saved out of order
+        (model.objects
+         .filter(pk=pk, last_activity_at__lt=instance.created_at)
+         .update(last_activity_at=instance.created_at))
+        deadlines.touch(model, pk, instance.created_at)
+        # Keep an instance that's already loaded in step with the database so
+        # it doesn't write back its old time when it's next saved
+        descriptor = getattr(Event, field)
+        if descriptor.is_cached(instance):
+            related = getattr(instance, field)
+            related.last_activity_at = max(related.last_activity_at,
+                                           instance.created_at)
 
 
 @receiver(post_save, sender=Event)
 def send_sns(sender, instance, **kwargs):
+    """
+    Queue the event to be published to SNS once it has been committed
+    """
     if settings.SNS_ARN is not None:
-        client = boto3.client('sns')
-        message = {
-            'default': {
-                'event_type': instance.event_type,
-                'message': instance.message,
-                'task_service': None,
-                'task': None,
-                'release': None
-            }
-        }
-        if instance.task_service:
-            message['default']['task_service'] = instance.task_service.kf_id
-        if instance.task:
-            message['default']['task'] = instance.task.kf_id
-        if instance.release:
-            message['default']['release'] = instance.release.kf_id
-
-        message['default'] = json.dumps(message['default'])
-
-        client.publish(TopicArn=settings.SNS_ARN,
-                       MessageStructure='json',
-                       Message=json.dumps(message))
+        OutboxMessage(message=sns.message(instance)).save()
+        transaction.on_commit(queue_publish)
+
+
+def queue_publish():
+    """
+    Enqueue a job to drain the outbox unless one is already waiting to run
+    """
+    from coordinator.tasks import publish_events
+    if cache.add('PUBLISH_EVENTS_QUEUED', True,
+                 settings.OUTBOX_SWEEP_INTERVAL):
+        django_rq.enqueue(publish_events)
+
+
+@receiver(post_save, sender=ReleaseNote)
+@receiver(post_delete, sender=ReleaseNote)
+def invalidate_notes(sender, instance, **kwargs):
+    """ Stop serving cached responses with the old notes """
+    transaction.on_commit(response_cache.bump)
@@ -1,6 +1,6 @@
 import uuid
 
-from django.db import models
+from django.db import models, transaction
 
 from coordinator.utils import kf_id_generator
 from coordinator.api.models.task import Task
@@ -42,16 +42,43 @@ class Event(models.Model):
                                       help_text='Time the event was created')
     release = models.ForeignKey(Release,
                                 on_delete=models.SET_NULL,
+                                db_index=False,
                                 null=True,
                                 blank=True,
                                 related_name='events')
     task_service = models.ForeignKey(TaskService,
                                      on_delete=models.SET_NULL,
+                                     db_index=False,
                                      null=True,
                                      blank=True,
                                      related_name='events')
     task = models.ForeignKey(Task,
                              on_delete=models.SET_NULL,
+                             db_index=False,
                              null=True,
                              blank=True,
                              related_name='events')
+
+    class Meta:
+        indexes = [
+            # For paging through events with a cursor
+            models.Index(fields=['created_at', 'kf_id'],
+                         name='event_created_at_kf_id'),
+            # For the events of a release, task, or service, newest first.
+            # These also serve lookups by the foreign key alone, so the
+            # foreign keys aren't indexed on their own.
+            models.Index(fields=['release', 'created_at'],
+                         name='event_release_created_at'),
+            models.Index(fields=['task', 'created_at'],
+                         name='event_task_created_at'),
+            models.Index(fields=['task_service', 'created_at'],
+                         name='event_service_created_at'),
+        ]
+
+    def save(self, *args, **kwargs):
+        """
+        Save the event in a transaction so that its outbox message is only
+        written along with it
+        """
+        with transaction.atomic():
+            super().save(*args, **kwargs)
@@ -0,0 +1,27 @@
+from django.db import models
+
+
+class OutboxMessage(models.Model):
+    """
+    A message waiting to be published to SNS.
+
+    Messages are written in the same transaction as the event they describe
+    and are deleted once they have been published.
+
+    :param message: The body of the SNS message
+    :param created_at: The time the message was written
+    :param attempts: The number of times the message has been claimed for
+        publishing
+    :param claimed_until: When the publisher that claimed the message gives
+        up its claim
+    """
+    message = models.TextField(help_text='The body of the SNS message')
+    created_at = models.DateTimeField(auto_now_add=True,
+                                      help_text='Time the message was '
+                                      'written')
+    attempts = models.IntegerField(default=0,
+                                   help_text='Number of attempts to '
+                                   'publish the message')
+    claimed_until = models.DateTimeField(null=True, blank=True,
+                                         help_text='Time the claim of the '
+                                         'publisher expires')
@@ -1,14 +1,17 @@
-import datetime
 import uuid
 import django_rq
 import logging
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
 from django.contrib.postgres.fields import ArrayField
 from django_fsm import FSMField, transition
 from semantic_version import Version
 from semantic_version.django_fields import VersionField
 
+from coordinator import response_cache
 from coordinator.utils import kf_id_generator
 from coordinator.api.models.study import Study
 
@@ -22,6 +25,20 @@ FAIL_SOURCES = [
     'canceling',
 ]
 
+# States a task may be in, each is counted on the task's release
+TASK_STATES = [
+    'waiting',
+    'initialized',
+    'running',
+    'staged',
+    'publishing',
+    'published',
+    'rejected',
+    'failed',
+    'canceled',
+]
+COUNTER_FIELDS = ['task_count'] + [f'{state}_tasks' for state in TASK_STATES]
+
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -36,8 +53,10 @@ def next_version(major=False, minor=False, patch=True):
     Assign the next version by taking the version of the last release and
     bumping the patch number by one
     """
+    # Only load the version as this is also the default in migrations made
+    # before every column of the release existed
     try:
-        r = Release.objects.latest()
+        r = Release.objects.only('version').latest()
     except Release.DoesNotExist:
         return Version('0.0.0')
 
@@ -58,6 +77,17 @@ class Release(models.Model):
     """
     class Meta:
         get_latest_by = 'created_at'
+        indexes = [
+            models.Index(fields=['created_at'], name='release_created_at'),
+            models.Index(fields=['state', 'created_at'],
+                         name='release_state_created_at'),
+            # Only the few active releases are checked by the status sweep
+            models.Index(fields=['state'], name='release_active_state',
+                         condition=models.Q(state__in=['initializing',
+                                                       'running',
+                                                       'publishing',
+                                                       'canceling'])),
+        ]
 
     kf_id = models.CharField(max_length=11, primary_key=True,
                              default=release_id,
@@ -87,6 +117,152 @@ class Release(models.Model):
                                    ' version change or not')
     created_at = models.DateTimeField(auto_now_add=True,
                                       help_text='Date created')
+    last_activity_at = models.DateTimeField(default=timezone.now,
+                                            help_text='Time of the latest '
+                                            'event for the release')
+    task_count = models.IntegerField(default=0,
+                                     help_text='Number of tasks in the '
+                                     'release')
+    waiting_tasks = models.IntegerField(default=0,
+                                        help_text='Number of waiting tasks')
+    initialized_tasks = models.IntegerField(default=0,
+                                            help_text='Number of initialized '
+                                            'tasks')
+    running_tasks = models.IntegerField(default=0,
+                                        help_text='Number of running tasks')
+    staged_tasks = models.IntegerField(default=0,
+                                       help_text='Number of staged tasks')
+    publishing_tasks = models.IntegerField(default=0,
+                                           help_text='Number of publishing '
+                                           'tasks')
+    published_tasks = models.IntegerField(default=0,
+                                          help_text='Number of published '
+                                          'tasks')
+    rejected_tasks = models.IntegerField(default=0,
+                                         help_text='Number of rejected tasks')
+    failed_tasks = models.IntegerField(default=0,
+                                       help_text='Number of failed tasks')
+    canceled_tasks = models.IntegerField(default=0,
+                                         help_text='Number of canceled tasks')
+
+    def save(self, *args, **kwargs):
+        """
+        Save the release without writing back its task counters, which are
+        only changed by its tasks
+        """
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def count_task(cls, release_id, source, target):
+        """
+        Update the task counters of a release for a task changing state
+
+        :param release_id: The kf_id of the task's release
+        :param source: The task's previous state, None for a new task
+        :param target: The task's new state, None for a deleted task
+
+        Tasks in a state that isn't in TASK_STATES are counted in the
+        release's task_count, but not in any state's counter.
+        """
+        changes = {}
+        if source is None:
+            changes['task_count'] = F('task_count') + 1
+        elif source in TASK_STATES:
+            changes[f'{source}_tasks'] = F(f'{source}_tasks') - 1
+        if target is None:
+            changes['task_count'] = F('task_count') - 1
+        elif target in TASK_STATES:
+            changes[f'{target}_tasks'] = F(f'{target}_tasks') + 1
+        if changes:
+            cls.objects.filter(pk=release_id).update(**changes)
+
+    @property
+    def task_counts(self):
+        """ The number of tasks in each state """
+        return {
+            state: getattr(self, f'{state}_tasks') for state in TASK_STATES
+        }
+
+    def all_tasks(self, state):
+        """
+        Check whether every task in the release is in the given state, from
+        the task counters rather than the tasks themselves
+
+        :param state: The task state to check for
+        """
+        return getattr(self, f'{state}_tasks') == self.task_count
+
+    @classmethod
+    def advance(cls, kf_id):
+        """
+        Move a release on to its next state once all of its tasks are ready
+        for it.
+
+        The release is locked while it's checked, so however many tasks
+        report at once, exactly one caller sees the final counts and
+        advances the release.
+
+        :param kf_id: The kf_id of the release
+        :returns: The new state of the release if it was advanced
+        """
+        from coordinator.tasks import start_release
+        with transaction.atomic():
+            release = cls.objects.select_for_update().get(kf_id=kf_id)
+            if (release.state == 'initializing' and
+                    release.all_tasks('initialized')):
+                release.start()
+            elif release.state == 'running' and release.all_tasks('staged'):
+                release.staged()
+            elif (release.state == 'publishing' and
+                    release.all_tasks('published')):
+                release.complete()
+            else:
+                return None
+            release.save()
+
+        if release.state == 'running':
+            django_rq.enqueue(start_release, kf_id)
+        return release.state
+
+    @classmethod
+    def abort(cls, kf_id, fail=False):
+        """
+        Cancel a release, eg: because one of its tasks failed.
+
+        The release is locked and read fresh while it's checked, so however
+        many of its tasks report at once it's only canceled once, and never
+        from a state that another caller has already moved it out of.
+        A release that is already canceling has its cancel_release job
+        enqueued again, in case the last one died, unless one is waiting.
+
+        :param kf_id: The kf_id of the release
+        :param fail: Whether the release should end up failed rather than
+            canceled
+        :returns: True if the release was canceled
+        """
+        from coordinator.tasks import cancel_release
+        with transaction.atomic():
+            release = cls.objects.select_for_update().get(kf_id=kf_id)
+            if release.state not in FAIL_SOURCES:
+                return False
+            canceled = release.state != 'canceling'
+            if canceled:
+                release.cancel()
+                release.save()
+
+        if not cache.add(f'CANCEL_RELEASE_QUEUED_{kf_id}', True,
+                         settings.RELEASE_SWEEP_INTERVAL):
+            return canceled
+        if fail:
+            django_rq.enqueue(cancel_release, kf_id, fail=True)
+        else:
+            django_rq.enqueue(cancel_release, kf_id)
+        return canceled
 
     @transition(field=state, source='waiting', target='initializing')
     def initialize(self):
@@ -116,6 +292,8 @@ class Release(models.Model):
         else:
             self.version = self.version.next_minor()
         self.save()
+        # Anonymous users may now see the release
+        transaction.on_commit(response_cache.bump)
         return
 
     @transition(field=state, source=FAIL_SOURCES, target='canceling')
@@ -133,34 +311,36 @@ class Release(models.Model):
         """ The release failed """
         return
 
+    def time_out(self, reason='time out'):
+        """
+        Cancel the release for taking too long, unless it's already finished
+        or being canceled
+        """
+        if self.state not in FAIL_SOURCES or self.state == 'canceling':
+            return
+        if Release.abort(self.kf_id):
+            logger.error(f'canceling release {self.kf_id} for {reason}.')
+        self.refresh_from_db(fields=['state'])
+
     def status_check(self):
         """
         Check if the release has timed out and the state of all tasks in
         the release
         """
-        from coordinator.tasks import cancel_release
         # Check if we hit the time limit
-        last_update = self.events.order_by('-created_at')\
-                                 .first().created_at
-        diff = datetime.datetime.utcnow() - last_update.replace(tzinfo=None)
+        diff = timezone.now() - self.last_activity_at
 
         if diff.total_seconds() > settings.RELEASE_TIMEOUT:
-            if self.state == 'canceling':
-                return
-            logger.error(f'canceling release {self.kf_id} for time out.')
-            self.cancel()
-            self.save()
-            django_rq.enqueue(cancel_release, self.kf_id)
+            self.time_out()
             return
 
         # Check if any contained tasks have failed/canceled
-        for task in self.tasks.all():
-            if task.state in ['failed', 'canceled', 'rejected']:
+        for state in ['failed', 'canceled', 'rejected']:
+            if getattr(self, f'{state}_tasks') > 0:
                 if self.state == 'canceling':
                     return
-                logger.error(f'canceling release: {self.kf_id} task is ' +
-                             f'{task.state}')
-                self.cancel()
-                self.save()
-                django_rq.enqueue(cancel_release, self.kf_id)
+                if Release.abort(self.kf_id):
+                    logger.error(f'canceling release: {self.kf_id} task is ' +
+                                 f'{state}')
+                self.refresh_from_db(fields=['state'])
                 return
@@ -41,3 +41,9 @@ class ReleaseNote(models.Model):
                               on_delete=models.SET_NULL,
                               null=True,
                               related_name='notes')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'],
+                         name='releasenote_created_at'),
+        ]
@@ -1,4 +1,25 @@
 from django.db import models
+from django.db.models import OuterRef, Subquery
+
+
+class StudyQuerySet(models.QuerySet):
+    def with_versions(self):
+        """
+        Annotate studies with the versions of the last releases they were
+        in so that listing them doesn't take more queries for every study
+        """
+        from coordinator.api.models.release import Release
+
+        releases = (Release.objects.filter(studies=OuterRef('pk'))
+                                   .order_by('-created_at'))
+        published = releases.filter(state='published')
+        return self.annotate(
+            _latest_version=Subquery(releases.values('version')[:1]),
+            _last_published_version=Subquery(
+                published.values('version')[:1]),
+            _last_published_date=Subquery(
+                published.values('created_at')[:1]),
+        )
 
 
 class Study(models.Model):
@@ -22,11 +43,15 @@ class Study(models.Model):
                                       null=True,
                                       help_text='Time the task was created')
 
+    objects = StudyQuerySet.as_manager()
+
     def latest_version(self):
         """
         Gets the latest version from the last release this study was in.
         """
         from coordinator.api.models.release import Release
+        if hasattr(self, '_latest_version'):
+            return self._latest_version
         try:
             return self.releases.latest('created_at').version
         except Release.DoesNotExist:
@@ -60,10 +85,14 @@ class Study(models.Model):
         Gets the version number of the last published release that this
         study was in.
         """
+        if hasattr(self, '_last_published_version'):
+            return self._last_published_version
         return getattr(self.last_published_release, 'version', None)
 
     def last_published_date(self):
         """
         Gets the date of the last published release that this study was in.
         """
+        if hasattr(self, '_last_published_date'):
+            return self._last_published_date
         return getattr(self.last_published_release, 'created_at', None)
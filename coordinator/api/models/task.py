@@ -1,13 +1,12 @@
-import datetime
 import uuid
-import requests
 from requests.exceptions import ConnectionError, HTTPError
 
-import django_rq
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from django.utils import timezone
 from django_fsm import FSMField, transition
 from django.core.cache import cache
+from coordinator import client
 from coordinator.authentication import headers
 from coordinator.utils import kf_id_generator
 from coordinator.api.models.release import Release
@@ -27,6 +26,8 @@ class Task(models.Model):
     :param state: The state of the task
     :param created_at: The time that the task was registered with the
         coordinator.
+    :param last_activity_at: The time of the latest event for the task, used
+        to tell when the task has timed out
     """
     kf_id = models.CharField(max_length=11, primary_key=True,
                              default=task_id)
@@ -49,6 +50,42 @@ class Task(models.Model):
                                      related_name='tasks')
     created_at = models.DateTimeField(auto_now_add=True,
                                       help_text='Time the task was created')
+    last_activity_at = models.DateTimeField(default=timezone.now,
+                                            help_text='Time of the latest '
+                                            'event for the task')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='task_created_at'),
+            # Only the few active tasks are polled by the status sweep
+            models.Index(fields=['state'], name='task_active_state',
+                         condition=models.Q(state__in=['running',
+                                                       'publishing'])),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the state in the database to keep the release's counters
+        instance._saved_state = instance.__dict__.get('state')
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Save the task and count any change in its state on its release
+        """
+        adding = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        counted = update_fields is None or 'state' in update_fields
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                Release.count_task(self.release_id, None, self.state)
+            elif counted and self._saved_state != self.state:
+                Release.count_task(self.release_id, self._saved_state,
+                                   self.state)
+        if counted:
+            self._saved_state = self.state
 
     @transition(field=state, source='waiting', target='initialized')
     def initialize(self):
@@ -86,14 +123,13 @@ class Task(models.Model):
         """
         Update the task's status by pinging the Task Service for its status
         """
-        from coordinator.tasks import cancel_release
         body = {
             'task_id': self.kf_id,
             'release_id': self.release_id,
             'action': 'get_status'
         }
         try:
-            resp = requests.post(
+            resp = client.post(
                 self.task_service.url + "/tasks",
                 headers=headers(),
                 json=body,
@@ -101,64 +137,59 @@ class Task(models.Model):
             )
             resp.raise_for_status()
         except (ConnectionError, HTTPError):
+            self.update_status(None)
+            return
+
+        if self.update_status(resp.json()):
+            self.save()
+
+    def update_status(self, resp):
+        """
+        Update the task from the status reported by its Task Service.
+
+        Any change of state is saved immediately, but a change in progress
+        is only made on the object so that many tasks may be saved at once.
+
+        :param resp: The body of the Task Service's status response, or None
+            if the Task Service could not be reached
+        :returns: True if the task still needs to be saved
+        """
+        if resp is None:
             # Cancel release if there is a problem
-            if self.release.state not in ['canceling', 'canceled']:
-                self.release.cancel()
-                self.release.save()
-                django_rq.enqueue(cancel_release, self.release.kf_id,
-                                  fail=True)
             self.failed()
             self.save()
-            return
-
-        resp = resp.json()
+            Release.abort(self.release_id, fail=True)
+            return False
 
         if 'state' in resp and resp['state'] != self.state:
             if resp['state'] == 'canceled':
                 self.cancel()
-                self.release.cancel()
-                self.release.save()
-                django_rq.enqueue(cancel_release, self.release.kf_id)
-                return
+                self.save()
+                Release.abort(self.release_id)
+                return False
             elif resp['state'] == 'failed':
-                from coordinator.tasks import cancel_release
                 self.failed()
-                self.release.cancel()
-                self.release.save()
-                django_rq.enqueue(cancel_release,
-                                  self.release.kf_id,
-                                  fail=True)
-                return
+                self.save()
+                Release.abort(self.release_id, fail=True)
+                return False
             elif resp['state'] == 'staged' and self.state != 'staged':
                 self.stage()
                 self.save()
-                # Check all tasks in release
-                release = self.release
-                if all([t.state == 'staged' for t in release.tasks.all()]):
-                    release.staged()
-                    release.save()
-                return
+                Release.advance(self.release_id)
+                return False
             elif resp['state'] == 'published' and self.state != 'published':
                 self.complete()
                 self.save()
-                # Check all tasks in release
-                release = self.release
-                if all([t.state == 'published' for t in release.tasks.all()]):
-                    release.complete()
-                    release.save()
-                return
+                Release.advance(self.release_id)
+                return False
 
         # Check if the task has timed out
         if self.state not in ['staged', 'published', 'canceled', 'failed']:
-            last_update = self.events.order_by('-created_at')\
-                                     .first().created_at.replace(tzinfo=None)
-            diff = datetime.datetime.utcnow() - last_update
+            diff = timezone.now() - self.last_activity_at
 
             if diff.total_seconds() > settings.TASK_TIMEOUT:
-                self.release.cancel()
-                self.release.save()
-                django_rq.enqueue(cancel_release, self.kf_id)
-                return
+                self.release.time_out(f'task {self.kf_id} time out')
+                return False
 
         if 'progress' in resp and resp['progress'] != self.progress:
             if isinstance(resp['progress'], str):
@@ -167,4 +198,4 @@ class Task(models.Model):
         if not self.progress:
             self.progress = 0
 
-        self.save()
+        return True
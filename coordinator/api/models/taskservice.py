@@ -1,12 +1,13 @@
 import uuid
-import requests
 from requests.exceptions import RequestException
 
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from coordinator.utils import kf_id_generator
 from coordinator.api.validators import validate_endpoint
 from django.core.cache import cache
+from coordinator import client
 from coordinator.authentication import headers
 
 
@@ -28,6 +29,8 @@ class TaskService(models.Model):
         from the /status endpoint on the task service
     :param health_status: The status of the service. 'ok' if one of the last
         3 pings to the /status endpoint returned 200, 'down' otherwise
+    :param health_checked_at: The time of the last ping to the /status
+        endpoint
     :param enabled: Only enabled tasks will be run in a release
     :param created_at: The time that the task service was registered with the
         coordinator.
@@ -50,33 +53,78 @@ class TaskService(models.Model):
                                          help_text='number of pings since last'
                                          ' 200 response from the task\'s '
                                          ' /status endpoint')
+    health_checked_at = models.DateTimeField(null=True, blank=True,
+                                             help_text='Time of the last '
+                                             'ping to the task\'s /status '
+                                             'endpoint')
     enabled = models.BooleanField(default=True,
                                   help_text='Whether to run the task as part '
                                   'of a release.')
     created_at = models.DateTimeField(auto_now_add=True,
                                       help_text='Time the task was created')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'],
+                         name='taskservice_created_at'),
+        ]
+
     @property
     def health_status(self):
         return 'ok' if self.last_ok_status <= 3 else 'down'
 
+    def known_down(self, now=None):
+        """
+        Whether the service was found to be down in the last
+        HEALTH_SWEEP_INTERVAL seconds. A service that was marked down longer
+        ago than that may have recovered since.
+        """
+        if self.health_status == 'ok' or self.health_checked_at is None:
+            return False
+        now = now or timezone.now()
+        age = (now - self.health_checked_at).total_seconds()
+        return age < settings.HEALTH_SWEEP_INTERVAL
+
+    def health_check_due(self, now=None):
+        """
+        Whether the service should be pinged again. Services that are down
+        are pinged less and less often, from every HEALTH_SWEEP_INTERVAL up
+        to every HEALTH_BACKOFF_MAX seconds.
+        """
+        if self.health_status == 'ok' or self.health_checked_at is None:
+            return True
+        now = now or timezone.now()
+        backoff = min(
+            settings.HEALTH_SWEEP_INTERVAL * 2 ** (self.last_ok_status - 4),
+            settings.HEALTH_BACKOFF_MAX,
+        )
+        return (now - self.health_checked_at).total_seconds() >= backoff
+
+    def record_health(self, ok):
+        """
+        Record the result of a ping to the /status endpoint without saving
+
+        :param ok: Whether the service responded successfully
+        """
+        self.last_ok_status = 0 if ok else self.last_ok_status + 1
+        self.health_checked_at = timezone.now()
+
     def health_check(self):
         """
         Ping the TaskService /status endpoint to check that the service is
         healthy.
         """
         try:
-            resp = requests.get(
+            resp = client.get(
                 self.url + "/status",
                 headers=headers(),
                 timeout=settings.REQUEST_TIMEOUT,
             )
             resp.raise_for_status()
         except RequestException:
-            self.last_ok_status += 1
+            self.record_health(False)
             self.save()
             return
 
-        if self.last_ok_status > 0:
-            self.last_ok_status = 0
-            self.save()
+        self.record_health(True)
+        self.save()
@@ -1,5 +1,6 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
-from coordinator.api.models import Release, Study
+from coordinator.api.models import Release, Study, Task, ReleaseNote
 from .task import TaskSerializer
 from .release_note import ReleaseNoteSerializer
 
@@ -22,11 +23,28 @@ class ReleaseSerializer(serializers.HyperlinkedModelSerializer):
 
     tasks = TaskSerializer(read_only=True, many=True)
     notes = ReleaseNoteSerializer(read_only=True, many=True)
+    task_counts = serializers.DictField(child=serializers.IntegerField(),
+                                        read_only=True)
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Load the studies, tasks with their services, and notes for a
+        queryset of releases so that serializing them takes a fixed number
+        of queries however many releases there are
+        """
+        return queryset.prefetch_related(
+            'studies',
+            Prefetch('tasks',
+                     queryset=Task.objects.select_related('task_service')),
+            Prefetch('notes',
+                     queryset=ReleaseNote.objects.select_related('study')),
+        )
 
     class Meta:
         model = Release
         fields = ('kf_id', 'name', 'description', 'notes', 'state', 'studies',
                   'tasks', 'version', 'created_at', 'tags', 'author',
-                  'is_major')
+                  'is_major', 'task_counts')
         read_only_fields = ('kf_id', 'state', 'tasks', 'version', 'created_at',
-                            'version', 'notes')
+                            'version', 'notes', 'task_counts')
@@ -1,5 +1,6 @@
 import requests
 from django.conf import settings
+from coordinator import client
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 
@@ -22,7 +23,7 @@ def validate_endpoint(url):
         )
 
     try:
-        resp = requests.get(url+'/status', timeout=settings.REQUEST_TIMEOUT)
+        resp = client.get(url+'/status', timeout=settings.REQUEST_TIMEOUT)
         resp.raise_for_status()
         if resp.status_code != 200:
             raise ValueError('response did not return with 200')
@@ -10,8 +10,9 @@ from coordinator.tasks import (
     init_release,
     publish_release,
     cancel_release,
-    release_status_check
+    release_status_sweep
 )
+from coordinator import response_cache
 from coordinator.permissions import GroupPermission
 from coordinator.api.models import Release
 from coordinator.api.serializers import ReleaseSerializer
@@ -40,11 +41,22 @@ class ReleaseViewSet(viewsets.ModelViewSet, UpdateModelMixin):
     """
     permission_classes = (GroupPermission,)
     lookup_field = 'kf_id'
-    queryset = Release.objects.order_by('-created_at').all()
+    queryset = ReleaseSerializer.setup_eager_loading(
+        Release.objects.order_by('-created_at')
+    )
     serializer_class = ReleaseSerializer
     filter_backends = (django_filters.rest_framework.DjangoFilterBackend,)
     filterset_class = ReleaseFilter
 
+    def list(self, request, *args, **kwargs):
+        """
+        Return a page of releases, from the response cache if only published
+        releases are asked for
+        """
+        if request.query_params.get('state') == 'published':
+            return response_cache.rest(request, super().list, *args, **kwargs)
+        return super().list(request, *args, **kwargs)
+
     def create(self, *args, **kwargs):
         """
         Create a new release given an array of study ids. This will trigger
@@ -92,13 +104,13 @@ class ReleaseViewSet(viewsets.ModelViewSet, UpdateModelMixin):
     @action(methods=['post'], detail=False)
     def status_checks(self, request):
         """
-        Trigger jobs to check each release's status
+        Trigger a job to check the status of all active releases
         """
         # States to check for
         to_check = ['initializing', 'running', 'publishing', 'canceling']
         releases = Release.objects.filter(state__in=to_check)
-        for release in releases:
-            django_rq.enqueue(release_status_check, release.kf_id)
+        django_rq.enqueue(release_status_sweep)
 
         return Response({'status': 'ok',
-                         'message': f'{len(releases)} releases to check'}, 200)
+                         'message': f'{releases.count()} releases to check'},
+                        200)
@@ -1,6 +1,7 @@
 from rest_framework import viewsets
 import django_filters.rest_framework
 
+from coordinator import response_cache
 from coordinator.permissions import AdminOrReadOnlyPermission
 from coordinator.api.serializers import ReleaseNoteSerializer
 from coordinator.api.models import ReleaseNote
@@ -40,3 +41,9 @@ class ReleaseNoteViewSet(viewsets.ModelViewSet):
     serializer_class = ReleaseNoteSerializer
     filter_backends = (django_filters.rest_framework.DjangoFilterBackend,)
     filterset_class = ReleaseNoteFilter
+
+    def list(self, request, *args, **kwargs):
+        return response_cache.rest(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return response_cache.rest(request, super().retrieve, *args, **kwargs)
@@ -1,12 +1,13 @@
-import requests
 from django.conf import settings
 from rest_framework import viewsets
 from rest_framework.decorators import action
+from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.response import Response
 
 from coordinator.api.models import Study, Release
 from coordinator.api.serializers import StudySerializer, ReleaseSerializer
-from coordinator.dataservice import sync
+from coordinator import dataservice
+from coordinator.permissions import SyncPermission
 
 
 class StudiesViewSet(viewsets.ReadOnlyModelViewSet):
@@ -17,39 +18,25 @@ class StudiesViewSet(viewsets.ReadOnlyModelViewSet):
     Returns a page of studies
     """
     lookup_field = 'kf_id'
-    queryset = Study.objects.order_by('-created_at').all()
+    queryset = Study.objects.with_versions().order_by('-created_at')
     serializer_class = StudySerializer
+    # Studies may not have a created_at to page by with a cursor
+    pagination_class = LimitOffsetPagination
 
-    @action(methods=['post'], detail=False)
+    @action(methods=['get', 'post'], detail=False,
+            permission_classes=(SyncPermission,))
     def sync(self, request):
         """
         Synchronize studies with the dataservice
 
-        Currently done within a request with the intent that the user sync
-        manually from the ui and recieve fresh studies on the response
-
-        If the process for syncing studies becomes automated, then this
-        may be moved to a task
+        The sync runs in the background. POST starts a sync, unless one is
+        already waiting or running, and GET returns its progress or the
+        result of the last sync. Studies are also synced on a schedule.
+        Only admins and developers may sync studies.
         """
-
-        try:
-            new, deleted = sync()
-        except requests.exceptions.RequestException as err:
-            message = "There was an error getting studies from the dataservice"
-            return Response(
-                {"status": "error", "message": f"{message}"},
-                err.response.status_code,
-            )
-
-        return Response(
-            {
-                "status": "ok",
-                "new": len(new),
-                "deleted": len(deleted),
-                "message": f"Synchronized with dataservice",
-            },
-            200,
-        )
+        if request.method == 'POST':
+            return Response(dataservice.enqueue_sync(), 202)
+        return Response(dataservice.status(), 200)
 
 
 class StudyReleasesViewSet(viewsets.ReadOnlyModelViewSet):
@@ -61,5 +48,6 @@ class StudyReleasesViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = ReleaseSerializer
 
     def get_queryset(self):
-        return Study.objects.get(kf_id=self.kwargs['study_kf_id']) \
-                            .releases.order_by('-created_at')
+        releases = Study.objects.get(kf_id=self.kwargs['study_kf_id']) \
+                                .releases.order_by('-created_at')
+        return ReleaseSerializer.setup_eager_loading(releases)
@@ -5,8 +5,8 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 
 from coordinator.permissions import AdminOrReadOnlyPermission
-from coordinator.tasks import status_check, cancel_release
-from coordinator.api.models import Task
+from coordinator.tasks import status_sweep
+from coordinator.api.models import Task, Release
 from coordinator.api.serializers import TaskSerializer
 
 
@@ -51,43 +51,24 @@ class TaskViewSet(viewsets.ModelViewSet):
         resp = super(TaskViewSet, self).partial_update(request, kf_id)
         # If the task is failed
         if resp.data['state'] == 'failed':
-            release = Task.objects.get(kf_id=kf_id).release
-            django_rq.enqueue(cancel_release, release.kf_id, True)
+            Release.abort(Task.objects.get(kf_id=kf_id).release_id, fail=True)
         # If the task is canceled
         if resp.data['state'] == 'canceled':
-            release = Task.objects.get(kf_id=kf_id).release
-            release.cancel()
-            release.save()
-            django_rq.enqueue(cancel_release, release.kf_id, False)
-        # If the task is being updated to staged
-        if resp.data['state'] == 'staged':
-            kf_id = resp.data['kf_id']
-            task = Task.objects.select_related().get(kf_id=kf_id)
-            # Check if all the release's tasks have been staged
-            release = task.release
-            if all([t.state == 'staged' for t in release.tasks.all()]):
-                release.staged()
-                release.save()
-
-        # If the task is being updated to published
-        elif resp.data['state'] == 'published':
-            kf_id = resp.data['kf_id']
-            task = Task.objects.select_related().get(kf_id=kf_id)
-            # Check if all the release's tasks have been published
-            release = task.release
-            if all([t.state == 'published' for t in release.tasks.all()]):
-                release.complete()
-                release.save()
+            Release.abort(Task.objects.get(kf_id=kf_id).release_id)
+        # If the task is being updated to staged or published, the release
+        # may be ready to move on as well
+        if resp.data['state'] in ['staged', 'published']:
+            Release.advance(Task.objects.get(kf_id=kf_id).release_id)
         return resp
 
     @action(methods=['post'], detail=False)
     def status_checks(self, request):
         """
-        Trigger jobs to check each task's status
+        Trigger a job to check the status of running tasks that are due for
+        a check
         """
         tasks = Task.objects.filter(state__in=['running', 'publishing'])
-        for task in tasks:
-            django_rq.enqueue(status_check, task.kf_id)
+        django_rq.enqueue(status_sweep)
 
         return Response({'status': 'ok',
-                         'message': f'{len(tasks)} task to check'}, 200)
+                         'message': f'{tasks.count()} task to check'}, 200)
@@ -4,7 +4,7 @@ import django_filters.rest_framework
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from coordinator.permissions import DevPermission
-from coordinator.tasks import health_check
+from coordinator.tasks import health_sweep
 from coordinator.api.models import TaskService
 from coordinator.api.serializers import TaskServiceSerializer
 
@@ -48,10 +48,8 @@ class TaskServiceViewSet(viewsets.ModelViewSet):
     @action(methods=['post'], detail=False)
     def health_checks(self, request):
         """
-        Trigger tasks to check each task service's health status
+        Trigger a job to check every task service's health status
         """
-        task_services = TaskService.objects.all()
-        for service in task_services:
-            django_rq.enqueue(health_check, service.kf_id)
+        django_rq.enqueue(health_sweep, force=True)
 
         return Response({'status': 'ok'}, 200)
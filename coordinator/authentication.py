@@ -1,10 +1,14 @@
 import datetime
 import jwt
 import json
+import os
 import re
 import textwrap
+import threading
+import time
 import requests
 import logging
+from urllib.parse import quote
 from django.conf import settings
 from django.core.cache import cache
 from rest_framework import authentication
@@ -13,14 +17,155 @@ from rest_framework import exceptions
 
 logger = logging.getLogger(__name__)
 
+# Least time between attempts to refresh the service token in the background
+REFRESH_RETRY_INTERVAL = 10
+
+
+class ServiceToken:
+    """
+    The coordinator's own Auth0 token, held in the process until it expires.
+
+    The token is shared between processes in the cache under
+    CACHE_AUTH0_SERVICE_KEY. Once the token is within
+    SERVICE_TOKEN_REFRESH_MARGIN seconds of expiring, the first request
+    for it starts a thread to replace it and every request keeps being given
+    the current token in the meantime, so requests only ever wait on the
+    cache or Auth0 when the process has no usable token at all. Only one
+    process at a time fetches a new token from Auth0, the others pick it up
+    from the cache.
+
+    :param audience: The name of the setting with the audience to get the
+        token for
+    """
+
+    def __init__(self, audience="AUTH0_AUD"):
+        self.audience = audience
+        self._token = None
+        self._exp = 0
+        self._next_refresh = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Get the service token
+
+        :returns: The token, or None if there is no unexpired token and a new
+            one could not be retrieved
+        """
+        now = time.time()
+        token, exp = self._token, self._exp
+        if token is not None and now < exp:
+            margin = settings.SERVICE_TOKEN_REFRESH_MARGIN
+            if now >= max(exp - margin, self._next_refresh):
+                self._refresh_in_background()
+            return token
+
+        with self._lock:
+            if self._token is None or time.time() >= self._exp:
+                self._refresh(wait=True)
+            return self._token if time.time() < self._exp else None
+
+    def _refresh_in_background(self):
+        """
+        Start a thread to replace the token, unless one is already running
+        """
+        if not self._lock.acquire(blocking=False):
+            return
+        self._next_refresh = time.time() + REFRESH_RETRY_INTERVAL
+
+        def refresh():
+            try:
+                self._refresh()
+            except Exception as err:
+                logger.error(f"Problem refreshing the service token: {err}")
+            finally:
+                self._lock.release()
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def _refresh(self, wait=False):
+        """
+        Replace the token with a newer one from the cache, or from Auth0 if
+        the one in the cache is also due to be refreshed
+
+        :param wait: Wait for another process that is already fetching a new
+            token to put it in the cache
+        """
+        margin = settings.SERVICE_TOKEN_REFRESH_MARGIN
+        key = self._cache_key()
+        token = cache.get(key)
+        if token is not None:
+            self._adopt(token)
+            if time.time() < self._exp - margin:
+                return
+
+        lock = f"{key}_REFRESH"
+        if cache.add(lock, True, settings.CACHE_AUTH0_REFETCH_INTERVAL):
+            try:
+                token = get_service_token(getattr(settings, self.audience))
+                if token is not None:
+                    exp = _expiry(token)
+                    timeout = min(exp - time.time(),
+                                  settings.CACHE_AUTH0_TIMEOUT)
+                    cache.set(key, token, max(int(timeout), 1))
+                    self._adopt(token)
+            finally:
+                cache.delete(lock)
+        elif wait:
+            # Another process is already fetching, give it time to finish
+            for _ in range(50):
+                time.sleep(0.1)
+                token = cache.get(key)
+                if token is not None:
+                    self._adopt(token)
+                    return
+
+    def _cache_key(self):
+        """ The cache key the token is shared between processes under """
+        if self.audience == "AUTH0_AUD":
+            return settings.CACHE_AUTH0_SERVICE_KEY
+        return f"{settings.CACHE_AUTH0_SERVICE_KEY}_{self.audience}"
+
+    def _adopt(self, token):
+        """ Use a token if it expires later than the current one """
+        exp = _expiry(token)
+        if exp > self._exp:
+            self._token = token
+            self._exp = exp
+
+    def _reset(self):
+        """
+        Forget any refresh that was running in a parent process, the token
+        itself is still good
+        """
+        self._next_refresh = 0
+        self._lock = threading.Lock()
+
+
+def _expiry(token):
+    """
+    Get the unix time that a token expires, assuming it's good for
+    CACHE_AUTH0_TIMEOUT seconds if it doesn't say
+    """
+    try:
+        exp = jwt.decode(token, verify=False).get("exp")
+    except jwt.InvalidTokenError:
+        exp = None
+    if exp is None:
+        exp = time.time() + settings.CACHE_AUTH0_TIMEOUT
+    return exp
+
+
+service_token = ServiceToken()
+os.register_at_fork(after_in_child=service_token._reset)
+# For reading user profiles from the Auth0 Management API
+management_token = ServiceToken("AUTH0_MANAGEMENT_AUD")
+os.register_at_fork(after_in_child=management_token._reset)
+
 
 def headers():
     """ Construct headers for requests to task services """
-    token = cache.get_or_set(
-        settings.CACHE_AUTH0_SERVICE_KEY,
-        get_service_token,
-        settings.CACHE_AUTH0_TIMEOUT,
-    )
+    token = service_token.get()
 
     if token:
         headers = {"Authorization": "Bearer " + token}
@@ -30,11 +175,16 @@ def headers():
         return {}
 
 
-def get_service_token():
-    """ Get a new token from Auth0 """
+def get_service_token(audience=None):
+    """
+    Get a new token from Auth0
+
+    :param audience: The audience of the token, AUTH0_AUD if not given
+    """
+    audience = audience or settings.AUTH0_AUD
     logger.info(f"Try to get token from auth0 with "
                 f"clientId={settings.AUTH0_CLIENT}, "
-                f"audience={settings.AUTH0_AUD}, "
+                f"audience={audience}, "
                 f"domain ={settings.AUTH0_DOMAIN}")
     url = f"{settings.AUTH0_DOMAIN}/oauth/token"
     headers = {"Content-Type": "application/json"}
@@ -42,7 +192,7 @@ def get_service_token():
         "grant_type": "client_credentials",
         "client_id": settings.AUTH0_CLIENT,
         "client_secret": settings.AUTH0_SECRET,
-        "audience": settings.AUTH0_AUD,
+        "audience": audience,
     }
 
     try:
@@ -53,8 +203,12 @@ def get_service_token():
         logger.info(f"Retrieved a new client_credentials token from Auth0")
     except requests.exceptions.RequestException as err:
         logger.error(f"Problem retrieving access token from Auth0: {err}")
+        return
 
-    content = resp.json()
+    try:
+        content = resp.json()
+    except ValueError:
+        content = {}
 
     if "access_token" not in content:
         logger.error(f"Access token response malformed: {resp.content}")
@@ -62,3 +216,34 @@ def get_service_token():
 
     token = content["access_token"]
     return token
+
+
+def get_profile(sub):
+    """
+    Get a user's profile from the Auth0 Management API
+
+    :param sub: The user's Auth0 id, the sub of their token
+    :returns: The profile, or None if it could not be retrieved
+    """
+    token = management_token.get()
+    if token is None:
+        logger.error("No token to fetch user profiles from Auth0 with")
+        return
+
+    url = f"{settings.AUTH0_DOMAIN}/api/v2/users/{quote(sub, safe='')}"
+    try:
+        resp = requests.get(
+            url,
+            headers={"Authorization": "Bearer " + token},
+            timeout=settings.REQUEST_TIMEOUT,
+        )
+        resp.raise_for_status()
+        profile = resp.json()
+    except (requests.exceptions.RequestException, ValueError) as err:
+        logger.error(f"Problem fetching user profile from Auth0: {err}")
+        return
+
+    if not isinstance(profile, dict):
+        logger.error(f"User profile response malformed: {resp.content}")
+        return
+    return profile
@@ -0,0 +1,80 @@
+"""
+Shared HTTP client for all traffic to task services and the dataservice.
+
+A single `requests.Session` is kept for the life of the process so that
+requests to the same task service reuse keep-alive connections from a
+per-host pool instead of paying for a new TCP and TLS handshake on every
+call.
+
+Connections are never shared across a fork. RQ's default worker forks a new
+work horse for every job, so workers are run with `coordinator.worker.Worker`
+instead, which runs jobs without forking so the pool outlives each job.
+"""
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+
+
+_session = None
+_lock = threading.Lock()
+
+
+def session():
+    """
+    Get the process's session, creating it on first use.
+    """
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = _new_session()
+    return _session
+
+
+def _new_session():
+    """
+    Create a session with connection pools sized by the REQUESTS_POOL_*
+    settings. Failures to connect are retried for any request. Responses
+    from an overloaded service are only retried for idempotent methods,
+    urllib3's default `method_whitelist`, so a POST to a task service that
+    got a response is never resent.
+    """
+    retries = Retry(
+        total=settings.REQUESTS_RETRIES,
+        read=0,
+        backoff_factor=settings.REQUESTS_BACKOFF,
+        status_forcelist=(502, 503, 504),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=settings.REQUESTS_POOL_CONNECTIONS,
+        pool_maxsize=settings.REQUESTS_POOL_MAXSIZE,
+        max_retries=retries,
+    )
+    s = requests.Session()
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+
+def _reset():
+    """ Drop any connections inherited from a parent process """
+    global _session, _lock
+    _session = None
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset)
+
+
+def get(url, **kwargs):
+    """ Make a GET request using the shared session """
+    return session().get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    """ Make a POST request using the shared session """
+    return session().post(url, **kwargs)
@@ -1,48 +1,201 @@
-import requests
+"""
+Syncing studies with the dataservice.
+
+Syncs run in the background as the `sync_studies` job, which the scheduler
+enqueues every `STUDY_SYNC_INTERVAL` seconds and users may enqueue through
+the API. The job's progress and the result of the last sync are kept in the
+cache for clients to poll, see `status()`.
+
+Each page of studies is fetched with the ETag it had on the last sync, if
+the dataservice gives one. A page that hasn't changed is answered with a
+304 and read from the cache instead, and if no page has changed there is
+nothing to compare or write.
+"""
+import logging
+import django_rq
 from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from coordinator import client, response_cache
 from coordinator.api.models import Study
 
+logger = logging.getLogger(__name__)
+
+# Fields of a study that are copied from the dataservice
+FIELDS = ["name", "visible"]
+
+STATUS_KEY = "STUDY_SYNC_STATUS"
+QUEUED_KEY = "STUDY_SYNC_QUEUED"
+
+
+def _page_key(url):
+    return f"DATASERVICE_PAGE_{url}"
+
+
+def fetch_page(url):
+    """
+    Get a page of studies, or its cached copy if it hasn't changed since
+    the last sync
+
+    :returns: The body of the page, and the page to cache if it has changed
+        or None if it hasn't
+    """
+    cached = cache.get(_page_key(url))
+    if cached is not None:
+        resp = client.get(
+            url,
+            headers={"If-None-Match": cached["etag"]},
+            timeout=settings.REQUEST_TIMEOUT,
+        )
+        if resp.status_code == 304:
+            return cached["body"], None
+    else:
+        resp = client.get(url, timeout=settings.REQUEST_TIMEOUT)
+    resp.raise_for_status()
+    body = resp.json()
+
+    etag = resp.headers.get("ETag")
+    if not etag:
+        return body, {}
+    return body, {_page_key(url): {"etag": etag, "body": body}}
+
+
+def fetch_studies(progress=None):
+    """
+    Get every study from the dataservice, following the `next` link of each
+    page until the last one
+
+    :param progress: Called with the number of pages and studies fetched
+        so far after each page
+    :returns: The studies, and the pages to cache once they are synced or
+        None if no page has changed since the last sync
+    """
+    studies = []
+    changed = None
+    pages = 0
+    url = settings.DATASERVICE_URL + "/studies?limit=100"
+    while url:
+        body, page = fetch_page(url)
+        studies.extend(body["results"])
+        if page is not None:
+            changed = changed or {}
+            changed.update(page)
+        pages += 1
+        if progress:
+            progress(pages, len(studies))
+
+        url = (body.get("_links") or {}).get("next")
+        if url and url.startswith("/"):
+            url = settings.DATASERVICE_URL + url
+    return studies, changed
+
 
-def sync():
+def sync(progress=None):
+    """
+    Update the coordinator's studies to match the dataservice's
+
+    Every page of studies is fetched before anything is changed, then the
+    differences are written together in one transaction.
+
+    :param progress: Called with the number of pages and studies fetched
+        so far after each page
+    :returns: The studies that were created and the kf_ids of those that
+        were marked deleted
+    """
     if not settings.DATASERVICE_URL:
         return [], []
 
-    resp = requests.get(settings.DATASERVICE_URL + "/studies?limit=100")
-    resp.raise_for_status()
+    studies, pages = fetch_studies(progress)
+    if pages is None:
+        logger.info("Studies have not changed in the dataservice")
+        return [], []
 
-    studies = Study.objects.all()
-    new = []
-    deleted = []
+    remote = {study["kf_id"]: study for study in studies}
+    existing = Study.objects.in_bulk()
 
-    for study in resp.json()["results"]:
-        try:
-            s = Study.objects.get(kf_id=study["kf_id"])
+    new = []
+    updated = []
+    for kf_id, study in remote.items():
+        s = existing.get(kf_id)
         # We don't know about the study, create it
-        except Study.DoesNotExist:
-            s = Study(
-                kf_id=study["kf_id"],
-                name=study["name"],
-                visible=study["visible"],
-                created_at=study["created_at"],
+        if s is None:
+            new.append(
+                Study(
+                    kf_id=kf_id,
+                    name=study["name"],
+                    visible=study["visible"],
+                    created_at=study["created_at"],
+                )
             )
-            s.save()
-            new.append(s)
             continue
 
         # Check for updated fields
-        for field in ["name", "visible"]:
+        changed = False
+        for field in FIELDS:
             if getattr(s, field) != study[field]:
                 setattr(s, field, study[field])
-        s.save()
+                changed = True
+        if changed:
+            updated.append(s)
 
     # Check if any studies were deleted from the dataservice
-    coord_studies = set(s.kf_id for s in studies)
-    ds_studies = set(s["kf_id"] for s in resp.json()["results"])
-    missing_studies = coord_studies - ds_studies
-    deleted = list(missing_studies)
-    for study in missing_studies:
-        s = Study.objects.get(kf_id=study)
-        s.deleted = True
-        s.save()
+    deleted = [
+        kf_id
+        for kf_id, s in existing.items()
+        if kf_id not in remote and not s.deleted
+    ]
 
+    with transaction.atomic():
+        Study.objects.bulk_create(new)
+        Study.objects.bulk_update(updated, FIELDS, batch_size=500)
+        Study.objects.filter(kf_id__in=deleted).update(deleted=True)
+
+    # Only skip pages that have been synced
+    cache.set_many(pages, None)
+    response_cache.bump()
     return new, deleted
+
+
+def status():
+    """
+    The progress of the sync that is running, or the result of the last one
+
+    :returns: A dict with the `status` of the sync, one of `none`, `queued`,
+        `running`, `ok`, or `error`, along with the numbers of pages and
+        studies fetched, studies created and deleted, and when it started
+        and finished
+    """
+    return cache.get(STATUS_KEY) or {
+        "status": "none",
+        "message": "Studies have not been synced",
+    }
+
+
+def set_status(**fields):
+    """ Update the status of the sync """
+    current = cache.get(STATUS_KEY) or {}
+    current.update(fields)
+    cache.set(STATUS_KEY, current, None)
+
+
+def enqueue_sync():
+    """
+    Enqueue a sync unless one is already waiting to run or running
+
+    :returns: The status of the sync
+    """
+    from coordinator.tasks import sync_studies
+
+    if cache.add(QUEUED_KEY, True, settings.STUDY_SYNC_TIMEOUT):
+        cache.set(
+            STATUS_KEY,
+            {
+                "status": "queued",
+                "message": "Waiting to sync with the dataservice",
+                "queued_at": timezone.now().isoformat(),
+            },
+            None,
+        )
+        django_rq.enqueue(sync_studies)
+    return status()
@@ -0,0 +1,140 @@
+"""
+An index of when each active task and release will time out.
+
+Deadlines are kept in a Redis sorted set for each of tasks and releases,
+scored by the unix time that the object times out. An object is added when
+it transitions into a state that can time out, its deadline is pushed back
+whenever it has new activity, and it is removed when it leaves those states.
+The `reap_timeouts` job then only has to read the entries that have
+already expired instead of checking every active object, and removes each
+one once it has been handled.
+
+The index is only ever a hint. Anything read from it is checked against
+the database before being timed out, and problems reaching Redis are logged
+rather than allowed to fail a transition.
+"""
+import time
+import logging
+import django_rq
+from redis.exceptions import RedisError
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+# Remove members from an index, but only those whose deadline is still at or
+# before ARGV[1]. Anything whose deadline was pushed back in the meantime
+# stays in the index.
+REMOVE_EXPIRED = """
+local removed = 0
+for i = 2, #ARGV do
+    local deadline = redis.call('zscore', KEYS[1], ARGV[i])
+    if deadline and tonumber(deadline) <= tonumber(ARGV[1]) then
+        removed = removed + redis.call('zrem', KEYS[1], ARGV[i])
+    end
+end
+return removed
+"""
+
+TASKS = "coordinator:deadlines:tasks"
+RELEASES = "coordinator:deadlines:releases"
+
+# The states in which tasks and releases may time out
+TASK_STATES = ["running", "publishing"]
+RELEASE_STATES = ["initializing", "running", "publishing"]
+
+
+def _index(model):
+    """
+    Get the index, timeout, and states that can time out for a task or
+    release, or their model
+    """
+    if model._meta.model_name == "task":
+        return TASKS, settings.TASK_TIMEOUT, TASK_STATES
+    return RELEASES, settings.RELEASE_TIMEOUT, RELEASE_STATES
+
+
+def _connection():
+    return django_rq.get_connection("default")
+
+
+def update(instance):
+    """
+    Add or remove an instance from the index after it changes state
+
+    :param instance: The task or release that changed state
+    """
+    key, timeout, states = _index(instance)
+    try:
+        if instance.state in states:
+            deadline = instance.last_activity_at.timestamp() + timeout
+            _connection().zadd(key, {instance.kf_id: deadline})
+        else:
+            _connection().zrem(key, instance.kf_id)
+    except RedisError as err:
+        logger.error(f"problem updating deadline of {instance.kf_id}: {err}")
+
+
+def touch(model, kf_id, at):
+    """
+    Push back the deadline of a task or release that has had new activity,
+    if it is in the index
+
+    :param model: Task or Release
+    :param kf_id: The kf_id of the task or release
+    :param at: The time of the activity
+    """
+    key, timeout, _ = _index(model)
+    try:
+        _connection().zadd(key, {kf_id: at.timestamp() + timeout}, xx=True)
+    except RedisError as err:
+        logger.error(f"problem updating deadline of {kf_id}: {err}")
+
+
+def expired(key, now=None):
+    """
+    Get everything in an index that has passed its deadline. Entries are
+    left in the index until they are `remove`d once they've been handled.
+
+    :param key: The index, TASKS or RELEASES
+    :param now: The current unix time
+    :returns: The kf_ids of the expired objects
+    """
+    now = time.time() if now is None else now
+    try:
+        kf_ids = _connection().zrangebyscore(key, "-inf", now)
+    except RedisError as err:
+        logger.error(f"problem reading deadlines: {err}")
+        return []
+    return [kf_id.decode() for kf_id in kf_ids]
+
+
+def remove(key, kf_ids, now):
+    """
+    Remove expired entries that have been handled from an index, unless
+    their deadline has been pushed back since they were read
+
+    :param key: The index, TASKS or RELEASES
+    :param kf_ids: The kf_ids to remove
+    :param now: The unix time the entries were read as expired at
+    """
+    if not kf_ids:
+        return
+    try:
+        _connection().eval(REMOVE_EXPIRED, 1, key, now, *kf_ids)
+    except RedisError as err:
+        logger.error(f"problem removing deadlines: {err}")
+
+
+def rebuild():
+    """
+    Add every task and release that can time out to the index, eg: if the
+    index was lost
+    """
+    from coordinator.api.models import Task, Release
+
+    for model, states in [(Task, TASK_STATES), (Release, RELEASE_STATES)]:
+        for instance in model.objects.filter(state__in=states).only(
+            "kf_id", "state", "last_activity_at"
+        ):
+            update(instance)
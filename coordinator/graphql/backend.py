@@ -0,0 +1,280 @@
+"""
+A GraphQL backend that limits how much work a single query may ask for.
+
+Before a query is executed it's given a cost: one for every object it
+selects, times the number of nodes that may be returned by each connection
+it is nested in. A connection is assumed to return as many nodes as its
+`first` or `last` argument. graphene-django would return the whole list for
+a connection with neither, so `PageSizeMiddleware` gives those a `first` of
+graphene's `RELAY_CONNECTION_MAX_LIMIT`, the most a client may ask for, and
+they are costed the same. Queries that cost more than `GRAPHQL_MAX_COST`, or
+that nest objects deeper than `GRAPHQL_MAX_DEPTH`, are rejected without
+being run. Relay's edges and node wrappers and introspection fields are
+free.
+
+Parsed and validated documents are kept in an LRU keyed by the sha256 of
+their query so that the queries that clients send over and over are only
+parsed and validated once in each process.
+"""
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from functools import partial
+from django.conf import settings
+from graphene_django.settings import graphene_settings
+from graphql import GraphQLError
+from graphql.backend.core import GraphQLCoreBackend
+from graphql.execution import execute, ExecutionResult
+from graphql.language import ast
+from graphql.type.definition import get_named_type
+from graphql.validation import validate
+
+
+logger = logging.getLogger(__name__)
+
+
+def measure(schema, document_ast, operation_name=None, variables=None):
+    """
+    Find the cost and depth of a query
+
+    :param schema: The schema the query is for
+    :param document_ast: The parsed and validated query
+    :param operation_name: The operation to be run, if the query has more
+        than one
+    :param variables: The query's variables
+    :returns: The cost and depth of the operation
+    """
+    fragments = {}
+    operations = []
+    for definition in document_ast.definitions:
+        if isinstance(definition, ast.FragmentDefinition):
+            fragments[definition.name.value] = definition
+        elif isinstance(definition, ast.OperationDefinition):
+            if operation_name is None or (
+                definition.name and definition.name.value == operation_name
+            ):
+                operations.append(definition)
+
+    roots = {
+        "query": schema.get_query_type(),
+        "mutation": schema.get_mutation_type(),
+        "subscription": schema.get_subscription_type(),
+    }
+    cost, depth = 0, 0
+    for operation in operations:
+        c, d = _measure_selections(
+            schema,
+            fragments,
+            variables or {},
+            roots[operation.operation],
+            operation.selection_set,
+            1,
+        )
+        cost += c
+        depth = max(depth, d)
+    return cost, depth
+
+
+def _measure_selections(
+    schema, fragments, variables, parent_type, selection_set, multiplier
+):
+    """
+    Find the cost and depth of the selections on an object
+
+    :param multiplier: The number of times the object may be returned
+    """
+    cost, depth = 0, 0
+    for selection in selection_set.selections:
+        if isinstance(selection, ast.FragmentSpread):
+            fragment = fragments[selection.name.value]
+            c, d = _measure_selections(
+                schema,
+                fragments,
+                variables,
+                schema.get_type(fragment.type_condition.name.value),
+                fragment.selection_set,
+                multiplier,
+            )
+        elif isinstance(selection, ast.InlineFragment):
+            fragment_type = parent_type
+            if selection.type_condition:
+                fragment_type = schema.get_type(
+                    selection.type_condition.name.value
+                )
+            c, d = _measure_selections(
+                schema,
+                fragments,
+                variables,
+                fragment_type,
+                selection.selection_set,
+                multiplier,
+            )
+        else:
+            name = selection.name.value
+            if name.startswith("__") or selection.selection_set is None:
+                continue
+            field = getattr(parent_type, "fields", {}).get(name)
+            if field is None:
+                raise GraphQLError(
+                    f"Cannot query field {name} on type {parent_type}"
+                )
+            field_type = get_named_type(field.type)
+            returned = multiplier
+            if field_type.name.endswith("Connection"):
+                returned *= _page_size(selection, variables)
+                c, d = returned, 1
+            elif parent_type.name.endswith(("Connection", "Edge")):
+                c, d = 0, 0
+            else:
+                c, d = returned, 1
+            sub_cost, sub_depth = _measure_selections(
+                schema,
+                fragments,
+                variables,
+                field_type,
+                selection.selection_set,
+                returned,
+            )
+            c, d = c + sub_cost, d + sub_depth
+        cost += c
+        depth = max(depth, d)
+    return cost, depth
+
+
+def _page_size(field, variables):
+    """
+    The most nodes a connection may return, from its `first` or `last`
+    argument. Negative sizes count as none, and anything that isn't a
+    number counts as if it wasn't given.
+    """
+    limit = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+    sizes = []
+    for argument in field.arguments:
+        if argument.name.value not in ("first", "last"):
+            continue
+        value = argument.value
+        if isinstance(value, ast.Variable):
+            value = variables.get(value.name.value)
+        elif isinstance(value, ast.IntValue):
+            value = value.value
+        else:
+            value = None
+        try:
+            sizes.append(min(max(int(value), 0), limit))
+        except (TypeError, ValueError):
+            continue
+    return min(sizes) if sizes else limit
+
+
+class PageSizeMiddleware:
+    """
+    Gives connections asked for without a `first` or `last` a `first` of
+    `RELAY_CONNECTION_MAX_LIMIT`, so that they never return more nodes than
+    they were costed at
+    """
+
+    def resolve(self, next, root, info, **args):
+        if (
+            args.get("first") is None
+            and args.get("last") is None
+            and get_named_type(info.return_type).name.endswith("Connection")
+        ):
+            args["first"] = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+        return next(root, info, **args)
+
+
+def query_hash(query):
+    """ The sha256 hex digest that a query is known by """
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+def execute_measured(schema, document_ast, *args, **kwargs):
+    """
+    Check that a valid query is within the limits, and run it
+    """
+    try:
+        cost, depth = measure(
+            schema,
+            document_ast,
+            kwargs.get("operation_name"),
+            kwargs.get("variables"),
+        )
+    except GraphQLError as error:
+        return ExecutionResult(errors=[error], invalid=True)
+    if depth > settings.GRAPHQL_MAX_DEPTH:
+        logger.warning(f"Rejected query with depth {depth} and cost {cost}")
+        error = GraphQLError(
+            f"Query depth of {depth} is over the limit of "
+            f"{settings.GRAPHQL_MAX_DEPTH}"
+        )
+        return ExecutionResult(errors=[error], invalid=True)
+    if cost > settings.GRAPHQL_MAX_COST:
+        logger.warning(f"Rejected query with depth {depth} and cost {cost}")
+        error = GraphQLError(
+            f"Query cost of {cost} is over the limit of "
+            f"{settings.GRAPHQL_MAX_COST}"
+        )
+        return ExecutionResult(errors=[error], invalid=True)
+
+    logger.info(f"Running query with depth {depth} and cost {cost}")
+    return execute(schema, document_ast, *args, **kwargs)
+
+
+def invalid(errors, *args, **kwargs):
+    """ Return the errors found when validating a query """
+    return ExecutionResult(errors=errors, invalid=True)
+
+
+class CostLimitBackend(GraphQLCoreBackend):
+    """
+    Validates queries, keeping the most recently used valid documents, and
+    rejects any that are too expensive before they are executed
+    """
+
+    def __init__(self, executor=None, size=None):
+        super().__init__(executor)
+        self.size = size or settings.GRAPHQL_DOCUMENT_CACHE_SIZE
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Get a valid document that has already been parsed
+
+        :param key: The sha256 of the document's query
+        :returns: The document, or None if it isn't cached
+        """
+        with self._lock:
+            document = self._documents.get(key)
+            if document is not None:
+                self._documents.move_to_end(key)
+            return document
+
+    def document_from_string(self, schema, document_string):
+        key = None
+        if isinstance(document_string, str):
+            key = query_hash(document_string)
+            document = self.get(key)
+            if document is not None and document.schema is schema:
+                return document
+
+        document = super().document_from_string(schema, document_string)
+        errors = validate(schema, document.document_ast)
+        if errors:
+            document.execute = partial(invalid, errors)
+            return document
+
+        document.execute = partial(
+            execute_measured,
+            schema,
+            document.document_ast,
+            **self.execute_params,
+        )
+        if key is not None:
+            with self._lock:
+                self._documents[key] = document
+                self._documents.move_to_end(key)
+                while len(self._documents) > self.size:
+                    self._documents.popitem(last=False)
+        return document
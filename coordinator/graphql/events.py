@@ -4,11 +4,16 @@ from graphene_django.types import DjangoObjectType
 from graphene_django.filter import DjangoFilterConnectionField
 
 from coordinator.api.models.event import Event
+from .loaders import resolver
 
 
 class EventNode(DjangoObjectType):
     """ An event in the Release Coordinator """
 
+    resolve_release = resolver("release")
+    resolve_task_service = resolver("task_service")
+    resolve_task = resolver("task")
+
     class Meta:
         model = Event
         filter_fields = {}
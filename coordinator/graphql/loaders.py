@@ -0,0 +1,126 @@
+"""
+Batched loading of related objects for the GraphQL schema.
+
+Left to graphene-django, every node resolves each of its relations with its
+own query, so a page of releases with their tasks and each task's service
+takes queries for every release and every task. Resolvers made with
+`resolver()` instead collect the keys from every node at the same level of
+the query and load a relation for all of them with a single query.
+
+Loaders are kept on the request so that nothing is shared between requests.
+Connections that are given filter arguments are still resolved by
+graphene-django so that the filters are applied in the database.
+"""
+from collections import defaultdict
+from promise import Promise
+from promise.dataloader import DataLoader
+
+
+# Arguments to a connection that only page through the results
+PAGING_ARGS = {"first", "last", "before", "after"}
+
+
+class ForeignKeyLoader(DataLoader):
+    """ Load objects by their primary keys """
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def batch_load_fn(self, keys):
+        objects = self.model.objects.in_bulk(keys)
+        return Promise.resolve([objects.get(key) for key in keys])
+
+
+class ReverseLoader(DataLoader):
+    """ Load the objects that refer to each key by a foreign key """
+
+    def __init__(self, model, attname):
+        super().__init__()
+        self.model = model
+        self.attname = attname
+
+    def batch_load_fn(self, keys):
+        groups = defaultdict(list)
+        for obj in self.model.objects.filter(**{f"{self.attname}__in": keys}):
+            groups[getattr(obj, self.attname)].append(obj)
+        return Promise.resolve([groups[key] for key in keys])
+
+
+class ManyToManyLoader(DataLoader):
+    """ Load the objects related to each key through a many to many table """
+
+    def __init__(self, through, source, target):
+        super().__init__()
+        self.through = through
+        self.source = source
+        self.target = target
+
+    def batch_load_fn(self, keys):
+        groups = defaultdict(list)
+        rows = self.through.objects.filter(
+            **{f"{self.source}_id__in": keys}
+        ).select_related(self.target)
+        for row in rows:
+            groups[getattr(row, f"{self.source}_id")].append(
+                getattr(row, self.target)
+            )
+        return Promise.resolve([groups[key] for key in keys])
+
+
+def _loader(info, loader_class, *args):
+    """
+    Get the request's loader of a class for the given arguments, creating
+    it the first time it's needed
+    """
+    loaders = getattr(info.context, "loaders", None)
+    if loaders is None:
+        loaders = info.context.loaders = {}
+    key = (loader_class, *args)
+    if key not in loaders:
+        loaders[key] = loader_class(*args)
+    return loaders[key]
+
+
+def resolver(name):
+    """
+    Make a resolver for a node that loads one of its model's relations in
+    batches with the same relation of the other nodes in the query
+
+    :param name: The name of the relation on the model
+    :returns: A resolver to assign to `resolve_<name>` on the node
+    """
+
+    def resolve(root, info, **kwargs):
+        field = root._meta.get_field(name)
+        if any(
+            value is not None
+            for arg, value in kwargs.items()
+            if arg not in PAGING_ARGS
+        ):
+            return getattr(root, name).all()
+
+        if field.many_to_one:
+            if field.is_cached(root):
+                return getattr(root, name)
+            key = getattr(root, field.attname)
+            if key is None:
+                return None
+            loader = _loader(info, ForeignKeyLoader, field.related_model)
+        elif field.one_to_many:
+            loader = _loader(
+                info, ReverseLoader, field.related_model, field.field.attname
+            )
+            key = root.pk
+        else:
+            m2m = field if field.concrete else field.field
+            source, target = m2m.m2m_field_name(), m2m.m2m_reverse_field_name()
+            if not field.concrete:
+                source, target = target, source
+            through = m2m.remote_field.through
+            loader = _loader(info, ManyToManyLoader, through, source, target)
+            key = root.pk
+
+        return loader.load(key)
+
+    return resolve
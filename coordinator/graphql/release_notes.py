@@ -10,11 +10,15 @@ from coordinator.api.models.release import Release
 from coordinator.api.models.study import Study
 from .releases import ReleaseNode
 from .studies import StudyNode
+from .loaders import resolver
 
 
 class ReleaseNoteNode(DjangoObjectType):
     """ A release note for a release or a study within a release """
 
+    resolve_release = resolver("release")
+    resolve_study = resolver("study")
+
     class Meta:
         model = ReleaseNote
         filter_fields = {}
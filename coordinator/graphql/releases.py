@@ -4,20 +4,33 @@ import django_rq
 import django_fsm
 from graphql import GraphQLError
 from graphql_relay import from_global_id
+from graphene.types.generic import GenericScalar
 from graphene_django.types import DjangoObjectType
 from graphene_django.filter import DjangoFilterConnectionField
 from coordinator.tasks import init_release, cancel_release, publish_release
 
-from coordinator.api.models.release import Release
+from coordinator.api.models.release import Release, COUNTER_FIELDS
+from .loaders import resolver
 
 
 class ReleaseNode(DjangoObjectType):
     """ A data release in Kids First """
 
+    task_counts = GenericScalar(
+        description="The number of tasks in the release in each state"
+    )
+
+    resolve_tasks = resolver("tasks")
+    resolve_events = resolver("events")
+    resolve_notes = resolver("notes")
+    resolve_studies = resolver("studies")
+
     class Meta:
         model = Release
         filter_fields = {}
         interfaces = (graphene.relay.Node,)
+        # Counts by state are given in task_counts instead
+        exclude_fields = [f for f in COUNTER_FIELDS if f != "task_count"]
 
 
 class ReleaseFilter(FilterSet):
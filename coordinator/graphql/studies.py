@@ -1,11 +1,13 @@
 import graphene
+from graphql import GraphQLError
 from django_filters import CharFilter, FilterSet, NumberFilter, OrderingFilter
 from graphene_django.types import DjangoObjectType
 from graphene_django.filter import DjangoFilterConnectionField
 
 from coordinator.api.models.study import Study
-from coordinator.dataservice import sync
+from coordinator import dataservice
 from .releases import ReleaseNode, ReleaseFilter
+from .loaders import resolver
 
 
 class StudyNode(DjangoObjectType):
@@ -17,6 +19,9 @@ class StudyNode(DjangoObjectType):
         description="Get releases for a study",
     )
 
+    resolve_releases = resolver("releases")
+    resolve_notes = resolver("notes")
+
     class Meta:
         model = Study
         filter_fields = {}
@@ -35,29 +40,40 @@ class StudyFilter(FilterSet):
         fields = ["kf_id", "visible", "deleted"]
 
 
+class StudySync(graphene.ObjectType):
+    """ The progress of a study sync, or the result of the last one """
+
+    status = graphene.String(
+        description="One of none, queued, running, ok, or error"
+    )
+    message = graphene.String()
+    pages = graphene.Int(description="Pages of studies fetched so far")
+    studies = graphene.Int(description="Studies fetched so far")
+    new = graphene.Int(description="Number of studies created")
+    deleted = graphene.Int(description="Number of studies marked deleted")
+    queued_at = graphene.String()
+    started_at = graphene.String()
+    finished_at = graphene.String()
+
+
+def _can_sync(user):
+    return hasattr(user, "auth_roles") and (
+        "ADMIN" in user.auth_roles or "DEV" in user.auth_roles
+    )
+
+
 class SyncStudies(graphene.Mutation):
-    new = DjangoFilterConnectionField(StudyNode)
-    deleted = DjangoFilterConnectionField(StudyNode)
+    sync = graphene.Field(StudySync)
 
     @staticmethod
     def mutate(root, info):
         """
-        Synchronize studies with the dataservice
+        Start synchronizing studies with the dataservice in the background
         """
-        user = info.context.user
-        if not hasattr(user, "auth_roles") or (
-            "ADMIN" not in user.auth_roles and "DEV" not in user.auth_roles
-        ):
+        if not _can_sync(info.context.user):
             raise GraphQLError("Not authenticated to sync studies.")
 
-        try:
-            new, deleted = sync()
-        except requests.exceptions.RequestException as err:
-            raise GraphQLError(
-                "Problem getting studies from the Data Service: {err}"
-            )
-
-        return SyncStudies(new=new, deleted=deleted)
+        return SyncStudies(sync=StudySync(**dataservice.enqueue_sync()))
 
 
 class Query:
@@ -79,6 +95,16 @@ class Query:
 
         return Study.objects.filter(visible=True).filter(deleted=False).all()
 
+    study_sync = graphene.Field(
+        StudySync, description="Get the progress of the study sync"
+    )
+
+    def resolve_study_sync(self, info):
+        if not _can_sync(info.context.user):
+            raise GraphQLError("Not authenticated to view the study sync.")
+
+        return StudySync(**dataservice.status())
+
 
 class Mutation:
     sync_studies = SyncStudies.Field(
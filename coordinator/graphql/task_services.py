@@ -8,6 +8,7 @@ from graphene_django.filter import DjangoFilterConnectionField
 
 from coordinator.api.models.taskservice import TaskService
 from coordinator.api.validators import validate_endpoint
+from .loaders import resolver
 
 
 class TaskServiceNode(DjangoObjectType):
@@ -18,6 +19,9 @@ class TaskServiceNode(DjangoObjectType):
         description="Current status of the task service",
     )
 
+    resolve_tasks = resolver("tasks")
+    resolve_events = resolver("events")
+
     class Meta:
         model = TaskService
         interfaces = (graphene.relay.Node,)
@@ -10,11 +10,16 @@ from graphene_django.types import DjangoObjectType
 from graphene_django.filter import DjangoFilterConnectionField
 
 from coordinator.api.models.task import Task
+from .loaders import resolver
 
 
 class TaskNode(DjangoObjectType):
     """ A task run on a task service during a release """
 
+    resolve_events = resolver("events")
+    resolve_release = resolver("release")
+    resolve_task_service = resolver("task_service")
+
     class Meta:
         model = Task
         filter_fields = {}
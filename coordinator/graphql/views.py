@@ -0,0 +1,162 @@
+"""
+The GraphQL endpoint, with support for persisted queries.
+
+Clients may send the sha256 of a query in place of the query itself, in
+the same form as Apollo's automatic persisted queries:
+
+    {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": "..."}}}
+
+If the query isn't known to the server it responds with a
+`PersistedQueryNotFound` error and the client sends the hash again along
+with the full query.
+
+When `GRAPHQL_QUERY_ALLOWLIST` is the path to a JSON file of queries keyed
+by their sha256, only those queries may be run.
+
+Anonymous queries for only the lists of published data are served from the
+response cache, see `coordinator.response_cache`.
+"""
+import json
+import logging
+from functools import lru_cache
+from django.conf import settings
+from graphene_django.views import GraphQLView
+from graphql import GraphQLError
+from graphql.execution import ExecutionResult
+from graphql.language import ast
+from graphql.language.printer import print_ast
+
+from coordinator import response_cache
+from .backend import query_hash
+
+
+logger = logging.getLogger(__name__)
+
+# Fields that only return published data to anonymous users, queries for
+# nothing else may be cached
+CACHED_FIELDS = {
+    "allReleases",
+    "allTasks",
+    "allEvents",
+    "allReleaseNotes",
+    "allStudies",
+}
+
+
+@lru_cache(maxsize=None)
+def load_allowlist(path):
+    """
+    Load the queries that may be run
+
+    :param path: Path to a JSON file of queries keyed by their sha256
+    :returns: The queries keyed by their sha256
+    """
+    with open(path) as f:
+        return json.load(f)
+
+
+class PersistedQueryView(GraphQLView):
+    def execute_graphql_request(
+        self,
+        request,
+        data,
+        query,
+        variables,
+        operation_name,
+        show_graphiql=False,
+    ):
+        extensions = data.get("extensions") or {}
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                extensions = {}
+        key = (extensions.get("persistedQuery") or {}).get("sha256Hash")
+
+        allowlist = None
+        if settings.GRAPHQL_QUERY_ALLOWLIST:
+            allowlist = load_allowlist(settings.GRAPHQL_QUERY_ALLOWLIST)
+
+        if query:
+            if key and key != query_hash(query):
+                error = GraphQLError("provided sha does not match query")
+                return ExecutionResult(errors=[error], invalid=True)
+            key = query_hash(query)
+        elif key:
+            document = self.backend.get(key)
+            if document is not None:
+                query = document.document_string
+            elif allowlist is not None and key in allowlist:
+                query = allowlist[key]
+            else:
+                logger.info(f"Persisted query {key} not found")
+                error = GraphQLError("PersistedQueryNotFound")
+                return ExecutionResult(errors=[error])
+
+        if query and allowlist is not None and key not in allowlist:
+            logger.warning(f"Rejected query {key} not in the allow-list")
+            error = GraphQLError("Query is not in the allow-list")
+            return ExecutionResult(errors=[error], invalid=True)
+
+        if query and response_cache.is_anonymous(request):
+            return self.execute_cached(
+                request, data, query, variables, operation_name, show_graphiql
+            )
+
+        return super().execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+
+    def execute_cached(
+        self, request, data, query, variables, operation_name, show_graphiql
+    ):
+        """
+        Serve a query from the response cache if it only asks for lists of
+        published data
+        """
+        try:
+            document = self.backend.document_from_string(self.schema, query)
+        except Exception:
+            document = None
+        if document is None or not cacheable(document, operation_name):
+            return super().execute_graphql_request(
+                request, data, query, variables, operation_name, show_graphiql
+            )
+
+        normalized = getattr(document, "normalized", None)
+        if normalized is None:
+            normalized = query_hash(print_ast(document.document_ast))
+            document.normalized = normalized
+        response_key = response_cache.key(
+            "graphql", normalized, variables, operation_name
+        )
+        result = response_cache.load(response_key)
+        if result is not None:
+            return ExecutionResult(data=result)
+
+        result = super().execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        if result is not None and not result.errors and not result.invalid:
+            response_cache.store(response_key, result.data)
+        return result
+
+
+def cacheable(document, operation_name):
+    """
+    Whether the operation to be run is a query for only fields that may be
+    cached
+    """
+    for definition in document.document_ast.definitions:
+        if not isinstance(definition, ast.OperationDefinition):
+            continue
+        if operation_name is not None and (
+            definition.name is None or definition.name.value != operation_name
+        ):
+            continue
+        return definition.operation == "query" and all(
+            isinstance(selection, ast.Field)
+            and selection.name.value in CACHED_FIELDS
+            for selection in definition.selection_set.selections
+        )
+    return False
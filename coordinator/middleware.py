@@ -1,12 +1,18 @@
 import logging
 import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
 import jwt
 import requests
+import django_rq
 from dataclasses import dataclass, field
 from typing import List
 from django.conf import settings
 from django.core.cache import cache
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from django.utils.functional import SimpleLazyObject
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.auth.models import update_last_login
@@ -19,11 +25,188 @@ logger.setLevel(logging.INFO)
 User = get_user_model()
 
 
+class Auth0Keys:
+    """
+    Auth0's public keys, parsed and held in the process by kid.
+
+    The raw keys are shared between processes in the cache under
+    CACHE_AUTH0_KEY. Only one thread in a process, and one process at a time,
+    fetches new keys from Auth0. A process with no keys at all waits for
+    another that is already fetching them, without holding up its own other
+    threads. A token signed with an unknown kid will cause the keys to be
+    fetched again, but at most once every CACHE_AUTH0_REFETCH_INTERVAL
+    seconds, and in between such tokens are rejected without any work.
+    """
+
+    def __init__(self):
+        self._keys = {}
+        self._default = None
+        self._loaded_at = 0
+        self._next_fetch = 0
+        self._lock = threading.Lock()
+
+    def get(self, kid=None):
+        """
+        Get the public key for a kid, or the first of Auth0's keys if the
+        token did not give a kid
+
+        :param kid: The kid from the token's header
+        :returns: The public key, or None if there is no key for the kid
+        """
+        key = self._lookup(kid)
+        if key is not None and self._fresh():
+            return key
+
+        with self._lock:
+            key = self._lookup(kid)
+            fresh = self._fresh()
+            if key is not None and fresh:
+                return key
+            # Keys were fetched recently, make do with the ones we have
+            if self._keys and time.time() < self._next_fetch:
+                return key
+
+            jwks = None if fresh else cache.get(settings.CACHE_AUTH0_KEY)
+            if jwks is None:
+                self._next_fetch = (
+                    time.time() + settings.CACHE_AUTH0_REFETCH_INTERVAL
+                )
+                jwks = self._fetch()
+            if jwks is not None:
+                self._load(jwks)
+                return self._lookup(kid)
+            if self._keys:
+                return key
+
+        # Another process is fetching the keys, wait for them without
+        # holding up the process's other threads
+        jwks = self._wait()
+        if jwks is not None:
+            with self._lock:
+                self._load(jwks)
+        return self._lookup(kid)
+
+    def _lookup(self, kid):
+        return self._keys.get(kid) if kid else self._default
+
+    def _fresh(self):
+        return time.time() - self._loaded_at < settings.CACHE_AUTH0_TIMEOUT
+
+    def _load(self, jwks):
+        """
+        Parse keys and start using them
+
+        :param jwks: The keys from Auth0's jwks
+        """
+        # Older versions only stored the first key
+        if isinstance(jwks, dict):
+            jwks = [jwks]
+
+        keys = {}
+        for jwk in jwks:
+            keys[jwk.get("kid")] = jwt.algorithms.RSAAlgorithm.from_jwk(
+                json.dumps(jwk)
+            )
+        self._keys = keys
+        self._default = keys[jwks[0].get("kid")] if jwks else None
+        self._loaded_at = time.time()
+
+    def _fetch(self):
+        """
+        Fetch new keys from Auth0 and store them in the cache, unless another
+        process has fetched them recently.
+
+        :returns: The keys, or None if keys were fetched too recently or
+            could not be fetched
+        """
+        lock = f"{settings.CACHE_AUTH0_KEY}_REFETCH"
+        if not cache.add(lock, True, settings.CACHE_AUTH0_REFETCH_INTERVAL):
+            return None
+
+        jwks = Auth0AuthenticationMiddleware._get_new_keys()
+        if jwks is not None:
+            cache.set(
+                settings.CACHE_AUTH0_KEY, jwks, settings.CACHE_AUTH0_TIMEOUT
+            )
+        return jwks
+
+    def _wait(self):
+        """
+        Wait a few seconds for another process to put keys in the cache
+
+        :returns: The keys, or None if none turned up
+        """
+        for _ in range(50):
+            jwks = cache.get(settings.CACHE_AUTH0_KEY)
+            if jwks is not None:
+                return jwks
+            time.sleep(0.1)
+        return None
+
+
+class VerifiedTokens:
+    """
+    A bounded LRU of the claims of tokens that have already been verified,
+    keyed by a hash of the token.
+
+    Claims are only kept until the token expires, so a cached token is
+    never accepted after it would have failed verification.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._claims = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(encoded):
+        return hashlib.sha256(encoded.encode()).digest()
+
+    def get(self, encoded):
+        """
+        Get the claims of a verified token
+
+        :param encoded: The encoded token
+        :returns: The token's claims, or None if it hasn't been verified or
+            has expired
+        """
+        key = self._key(encoded)
+        with self._lock:
+            claims = self._claims.get(key)
+            if claims is None:
+                return None
+            if claims["exp"] <= time.time():
+                del self._claims[key]
+                return None
+            self._claims.move_to_end(key)
+            return claims
+
+    def set(self, encoded, claims):
+        """
+        Remember the claims of a token that was just verified. Tokens that
+        never expire are not kept.
+
+        :param encoded: The encoded token
+        :param claims: The token's verified claims
+        """
+        if not isinstance(claims.get("exp"), (int, float)):
+            return
+        key = self._key(encoded)
+        with self._lock:
+            self._claims[key] = claims
+            self._claims.move_to_end(key)
+            while len(self._claims) > self.size:
+                self._claims.popitem(last=False)
+
+
 class Auth0AuthenticationMiddleware:
     """
     Authentication middleware for validating a user's identity through Auth0
     """
 
+    keys = Auth0Keys()
+    tokens = VerifiedTokens(settings.CACHE_AUTH0_TOKENS_SIZE)
+
     def __init__(self, get_response):
         self.get_response = get_response
 
@@ -68,23 +251,34 @@ class Auth0AuthenticationMiddleware:
             return AnonymousUser()
         encoded = encoded.replace("Bearer ", "")
 
-        try:
-            # Validate JWT using the Auth0 key
-            public_key = Auth0AuthenticationMiddleware._get_auth0_key()
-
-            token = jwt.decode(
-                encoded,
-                public_key,
-                algorithms="RS256",
-                # audience=settings.AUTH0_AUD,
-                options={"verify_aud": False},
-            )
-        except jwt.exceptions.DecodeError as err:
-            logger.error(f"Problem authenticating request from Auth0: {err}")
-            return AnonymousUser()
-        except jwt.exceptions.InvalidTokenError as err:
-            logger.error(f"Token provided is not valid for Auth0: {err}")
-            return AnonymousUser()
+        # Skip verifying tokens that have already been verified
+        token = Auth0AuthenticationMiddleware.tokens.get(encoded)
+        if token is None:
+            try:
+                # Validate JWT using the Auth0 key
+                kid = jwt.get_unverified_header(encoded).get("kid")
+                public_key = Auth0AuthenticationMiddleware._get_auth0_key(kid)
+                if public_key is None:
+                    raise jwt.exceptions.InvalidTokenError(
+                        f"Unknown kid {kid}"
+                    )
+
+                token = jwt.decode(
+                    encoded,
+                    public_key,
+                    algorithms="RS256",
+                    # audience=settings.AUTH0_AUD,
+                    options={"verify_aud": False},
+                )
+            except jwt.exceptions.DecodeError as err:
+                logger.error(
+                    f"Problem authenticating request from Auth0: {err}"
+                )
+                return AnonymousUser()
+            except jwt.exceptions.InvalidTokenError as err:
+                logger.error(f"Token provided is not valid for Auth0: {err}")
+                return AnonymousUser()
+            Auth0AuthenticationMiddleware.tokens.set(encoded, token)
 
         sub = token.get("sub")
         groups = token.get("https://kidsfirstdrc.org/groups")
@@ -107,30 +301,17 @@ class Auth0AuthenticationMiddleware:
 
         # Now we know that the token is valid so we will try to see if the user
         # is in our database yet, if so, we will return that user, if not, we
-        # will create a new user by fetching more information from auth0 and
-        # saving it in the database
-        try:
-            user = User.objects.get(sub=token["sub"])
-            # The user is already in the database, update their last login
-            update_last_login(None, user)
-        except User.DoesNotExist:
-            profile = Auth0AuthenticationMiddleware._get_profile(encoded)
-            # Problem getting the profile, don't try to create the user now
-            if profile is None:
+        # will create a new user in the background by fetching more
+        # information from auth0 and saving it in the database
+        user = Auth0AuthenticationMiddleware._get_user(sub)
+        if user is None:
+            user = Auth0AuthenticationMiddleware._create_user(sub)
+            # The user will be created once their profile has been fetched
+            if user is None:
                 user = User(auth_groups=groups, auth_roles=roles)
                 return user
-            user = User(
-                username=profile.get("nickname", ""),
-                email=profile.get("email", ""),
-                first_name=profile.get("given_name", ""),
-                last_name=profile.get("family_name", ""),
-                picture=profile.get("picture", ""),
-                auth_groups=[],
-                auth_roles=[],
-                sub=token.get("sub"),
-            )
-            user.save()
-            update_last_login(None, user)
+
+        Auth0AuthenticationMiddleware._update_last_login(user)
 
         # NB: We ALWAYS use the JWT as the source of truth for authorization
         # fields. They will always be stored as empty arrays in the database
@@ -140,44 +321,85 @@ class Auth0AuthenticationMiddleware:
 
         return user
 
-    def _get_profile(encoded):
+    @staticmethod
+    def _get_user(sub):
         """
-        Retrives user's profile from Auth0 to populate fields such as email
+        Get a user by their sub, from the cache if they've been seen recently
 
-        :param token: The verified access token from the request
+        :param sub: The sub of the user's token
+        :returns: The user, or None if they are not in the database yet
         """
-        try:
-            resp = requests.get(
-                f"{settings.AUTH0_DOMAIN}/userinfo",
-                headers={"Authorization": "Bearer " + encoded},
-                timeout=5,
-            )
-        except requests.ConnectionError as err:
-            logger.error(f"Problem fetching user profile from Auth0: {err}")
+        key = User.cache_key(sub)
+        user = cache.get(key)
+        if user is None:
+            user = User.objects.filter(sub=sub).first()
+            if user is not None:
+                cache.set(key, user, settings.CACHE_AUTH0_USER_TIMEOUT)
+        return user
+
+    @staticmethod
+    def _create_user(sub):
+        """
+        Queue a job to fetch a new user's Auth0 profile and save them, unless
+        one has been queued for them in the last minute.
+
+        Only the user's sub is queued, the job fetches their profile from
+        the Auth0 Management API with the coordinator's own token.
+
+        :param sub: The sub of the user's token
+        :returns: The new user, if the job was run immediately
+        """
+        from coordinator.tasks import create_user
+
+        if not cache.add(f"AUTH0_PROFILE_{sub}", True, 60):
             return None
-        return resp.json()
+        job = django_rq.enqueue(create_user, sub)
+        # Only a synchronous queue will have run the job already
+        return job.result
 
     @staticmethod
-    def _get_auth0_key():
+    def _update_last_login(user):
         """
-        Attempts to retrieve the auth0 public key from the cache. If it's not
-        there or is expired, fetch a new one from auth0 and store it back in
-        the cache.
+        Update the user's last login, at most once every LAST_LOGIN_INTERVAL
+        seconds
         """
-        key = cache.get(settings.CACHE_AUTH0_KEY, None)
-        # If key is not set in cache (or has timed out), get a new one
-        if key is None:
-            key = Auth0AuthenticationMiddleware._get_new_key()
-            cache.set(
-                settings.CACHE_AUTH0_KEY, key, settings.CACHE_AUTH0_TIMEOUT
-            )
-        public_key = jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(key))
-        return public_key
+        now = timezone.now()
+        if user.last_login is not None and (
+            (now - user.last_login).total_seconds()
+            < settings.LAST_LOGIN_INTERVAL
+        ):
+            return
+        update_last_login(None, user)
+        cache.set(
+            User.cache_key(user.sub), user, settings.CACHE_AUTH0_USER_TIMEOUT
+        )
+
+    @staticmethod
+    def _get_auth0_key(kid=None):
+        """
+        Get the Auth0 public key that a token was signed with.
+
+        :param kid: The kid from the token's header
+        """
+        return Auth0AuthenticationMiddleware.keys.get(kid)
 
     @staticmethod
-    def _get_new_key():
+    def _get_new_keys():
         """
-        Get a public key from Auth0 jwks
+        Get the public keys from Auth0 jwks
+
+        :returns: The keys, or None if they could not be fetched
         """
-        resp = requests.get(settings.AUTH0_JWKS, timeout=10)
-        return resp.json()["keys"][0]
+        try:
+            resp = requests.get(settings.AUTH0_JWKS, timeout=10)
+        except requests.exceptions.RequestException as err:
+            logger.error(f"Problem fetching keys from Auth0: {err}")
+            return None
+        if not resp.ok:
+            logger.error(f"Problem fetching keys from Auth0: {resp.content}")
+            return None
+        try:
+            return resp.json()["keys"]
+        except (ValueError, KeyError, TypeError):
+            logger.error(f"Keys response from Auth0 malformed: {resp.content}")
+            return None
@@ -1,4 +1,7 @@
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.core.cache import cache
 from django.contrib.postgres.fields import ArrayField
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.utils.translation import gettext_lazy as _
@@ -74,3 +77,17 @@ class User(AbstractUser):
     @property
     def is_admin(self):
         return 'ADMIN' in self.auth_roles
+
+    @staticmethod
+    def cache_key(sub):
+        """ The key the auth middleware caches the user with this sub under """
+        return f"AUTH0_USER_{sub}"
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def uncache_user(sender, instance, **kwargs):
+    """
+    Drop the auth middleware's copy of a user when they change or are deleted
+    """
+    cache.delete(User.cache_key(instance.sub))
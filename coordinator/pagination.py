@@ -0,0 +1,235 @@
+"""
+Pagination for the REST API's list endpoints.
+
+Lists are paged by limit and offset as usual, which needs a count of the
+whole list and makes the database skip over every row before the offset.
+Sending a `cursor` parameter, even an empty one to start at the first page,
+switches to keyset pagination instead: results are ordered newest first by
+`(created_at, kf_id)` and each page starts right after the last row of the
+page before it, so every page costs the same as the first. Cursor pages
+have no count, only a link to the next page.
+
+Counting every row of a big table for each page is slow too, so once a
+table has more than `APPROXIMATE_COUNT_THRESHOLD` rows, the count given
+with limit and offset pages is Postgres' estimate of how many rows the
+query returns. Send `exact_count=true` for an exact count.
+"""
+import json
+import base64
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils.dateparse import parse_datetime
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+try:
+    import coreapi
+    import coreschema
+except ImportError:
+    coreapi = None
+    coreschema = None
+
+# Table sizes only change when postgres analyzes the table, so they're kept
+# for a while rather than read for every page
+TABLE_SIZE_TIMEOUT = 60
+
+
+class CursorOrLimitOffsetPagination(LimitOffsetPagination):
+    cursor_query_param = "cursor"
+    cursor_query_description = _(
+        "The page to start from, as given in the previous page's next link. "
+        "Send an empty cursor for the first page."
+    )
+    invalid_cursor_message = _("Invalid cursor")
+    exact_count_query_param = "exact_count"
+    exact_count_query_description = _(
+        "Count every result instead of estimating the count of long lists."
+    )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return self.paginate_counted(queryset, request, view)
+
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.cursor = self.decode_cursor(request)
+        self.display_page_controls = False
+
+        model = queryset.model
+        table = model._meta.db_table
+        created_at = model._meta.get_field("created_at").column
+        kf_id = model._meta.get_field("kf_id").column
+        queryset = queryset.order_by("-created_at", "-kf_id")
+        if self.cursor is not None:
+            # A row comparison is needed for postgres to start the scan of
+            # the (created_at, kf_id) index right at the cursor
+            queryset = queryset.extra(
+                where=[
+                    f'("{table}"."{created_at}", "{table}"."{kf_id}") '
+                    f"< (%s, %s)"
+                ],
+                params=list(self.cursor),
+            )
+
+        results = list(queryset[:self.limit + 1])
+        self.has_next = len(results) > self.limit
+        results = results[:self.limit]
+        self.last = results[-1] if results else None
+        return results
+
+    def paginate_counted(self, queryset, request, view=None):
+        """ Page by limit and offset, with an exact or estimated count """
+        self.estimated = False
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.offset = self.get_offset(request)
+        self.count = self.get_count(queryset)
+
+        if not self.estimated:
+            if self.count == 0 or self.offset > self.count:
+                results = []
+            else:
+                results = list(
+                    queryset[self.offset:self.offset + self.limit]
+                )
+        else:
+            # The estimate may be off either way, so the page is fetched
+            # with one row past its end to know whether there is a next
+            # one. If there isn't, the real count is known.
+            results = list(
+                queryset[self.offset:self.offset + self.limit + 1]
+            )
+            if len(results) > self.limit:
+                self.count = max(self.count, self.offset + self.limit + 1)
+            elif results:
+                self.count = self.offset + len(results)
+            results = results[:self.limit]
+
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+        return results
+
+    def get_count(self, queryset):
+        threshold = settings.APPROXIMATE_COUNT_THRESHOLD
+        exact = self.request.query_params.get(self.exact_count_query_param)
+        if (
+            not threshold
+            or exact in ("true", "True", "1")
+            or table_size(queryset) <= threshold
+        ):
+            return super().get_count(queryset)
+        self.estimated = True
+        return estimate_count(queryset)
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+
+        return Response(
+            OrderedDict([("next", self.get_next_link()), ("results", data)])
+        )
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        url = remove_query_param(url, self.offset_query_param)
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.last)
+        )
+
+    def encode_cursor(self, instance):
+        """ Make a cursor to start the next page after an instance """
+        position = [instance.created_at.isoformat(), instance.kf_id]
+        return base64.urlsafe_b64encode(
+            json.dumps(position).encode("utf-8")
+        ).decode("ascii")
+
+    def decode_cursor(self, request):
+        """
+        Read the position to start after from the request
+
+        :returns: The created_at and kf_id to start after, or None to start
+            at the first page
+        """
+        encoded = request.query_params[self.cursor_query_param]
+        if not encoded:
+            return None
+        try:
+            created_at, kf_id = json.loads(
+                base64.urlsafe_b64decode(encoded.encode("ascii"))
+            )
+            created_at = parse_datetime(created_at)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, kf_id
+
+    def get_schema_fields(self, view):
+        fields = super().get_schema_fields(view)
+        return fields + [
+            coreapi.Field(
+                name=self.cursor_query_param,
+                required=False,
+                location="query",
+                schema=coreschema.String(
+                    title="Cursor",
+                    description=str(self.cursor_query_description),
+                ),
+            ),
+            coreapi.Field(
+                name=self.exact_count_query_param,
+                required=False,
+                location="query",
+                schema=coreschema.Boolean(
+                    title="Exact count",
+                    description=str(self.exact_count_query_description),
+                ),
+            ),
+        ]
+
+
+def table_size(queryset):
+    """
+    The number of rows in a queryset's table as of the last time it was
+    analyzed, or -1 if it never has been. Kept in the cache for
+    `TABLE_SIZE_TIMEOUT` seconds.
+    """
+    table = queryset.model._meta.db_table
+    key = f"TABLE_SIZE_{table}"
+    size = cache.get(key)
+    if size is None:
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                [table],
+            )
+            row = cursor.fetchone()
+        size = row[0] if row else -1
+        cache.set(key, size, TABLE_SIZE_TIMEOUT)
+    return size
+
+
+def estimate_count(queryset):
+    """ The planner's estimate of how many rows a queryset returns """
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]["Plan Rows"]
@@ -39,6 +39,22 @@ class DevPermission(permissions.BasePermission):
             return True
 
 
+class SyncPermission(permissions.BasePermission):
+    """
+    Only allow admins and developers to sync studies or see the sync's
+    progress
+    """
+    message = 'Must be an admin or developer'
+
+    def has_permission(self, request, view):
+        if isinstance(request.user, AnonymousUser):
+            return False
+
+        roles = request.user.auth_roles
+
+        return "ADMIN" in roles or "DEV" in roles
+
+
 class AdminOrReadOnlyPermission(permissions.BasePermission):
     """
     Only allow admin, or read only to everyone else.
@@ -50,8 +66,8 @@ class AdminOrReadOnlyPermission(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True
 
-        # Allow anyone to trigger status checks, should be removed in favor
-        # of an internal scheduler and made an admin-only action
+        # Allow anyone to trigger status checks. Checks are normally run by
+        # the scheduler, these only force an immediate check
         if view.action == "status_checks":
             return True
 
@@ -80,8 +96,8 @@ class GroupPermission(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True
 
-        # Allow anyone to trigger status checks, should be removed in favor
-        # of an internal scheduler and made an admin-only action
+        # Allow anyone to trigger status checks. Checks are normally run by
+        # the scheduler, these only force an immediate check
         if view.action == "status_checks":
             return True
 
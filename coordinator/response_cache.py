@@ -0,0 +1,97 @@
+"""
+A cache of responses to anonymous reads of published data.
+
+Anonymous users are only shown published releases, their tasks, events and
+notes, and the studies that are visible, none of which change until a
+release finishes publishing, a note is edited, or studies are synced with
+the dataservice. Responses to their reads are cached, keyed by the request
+and a generation number. Each of those changes bumps the generation, so
+every response cached before it is ignored and left to expire.
+
+Responses are also only kept for `RESPONSE_CACHE_TIMEOUT` seconds, which
+bounds how stale anything that does change in between may become, eg:
+releases of a study that aren't published yet.
+"""
+import json
+import hashlib
+import logging
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+
+logger = logging.getLogger(__name__)
+
+GENERATION_KEY = "RESPONSE_CACHE_GENERATION"
+
+
+def generation():
+    """ The current generation of cached responses """
+    value = cache.get(GENERATION_KEY)
+    if value is None:
+        cache.add(GENERATION_KEY, 1, None)
+        value = cache.get(GENERATION_KEY, 1)
+    return value
+
+
+def bump():
+    """ Invalidate every cached response """
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, 1, None)
+
+
+def key(*parts):
+    """
+    Build the key of a response in the current generation
+
+    :param parts: Anything that identifies the request, they must be JSON
+        serializable
+    """
+    digest = hashlib.sha256(
+        json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+    return f"RESPONSE_{generation()}_{digest}"
+
+
+def load(response_key):
+    """ Get a cached response, or None if there isn't one """
+    return cache.get(response_key)
+
+
+def store(response_key, value):
+    """ Cache a response """
+    cache.set(response_key, value, settings.RESPONSE_CACHE_TIMEOUT)
+
+
+def is_anonymous(request):
+    """ Whether a request was made without a user """
+    return not request.user.is_authenticated
+
+
+def rest(request, respond, *args, **kwargs):
+    """
+    Serve a REST request from the cache if it's an anonymous read
+
+    :param request: The request
+    :param respond: The view's method that builds the response
+    :returns: The response
+    """
+    if request.method != "GET" or not is_anonymous(request):
+        return respond(request, *args, **kwargs)
+
+    response_key = key(
+        "rest",
+        request.get_host(),
+        request.path,
+        sorted(request.query_params.lists()),
+    )
+    data = load(response_key)
+    if data is not None:
+        return Response(data)
+
+    response = respond(request, *args, **kwargs)
+    if response.status_code == 200:
+        store(response_key, response.data)
+    return response
@@ -0,0 +1,130 @@
+"""
+The coordinator's own scheduler for status and health sweeps, timeouts,
+draining the SNS outbox, and syncing studies with the dataservice.
+
+The scheduler only enqueues sweep jobs, the work is still done by the RQ
+workers. Each sweep takes a lock in the cache for the length of its interval
+so that it's safe to run a scheduler alongside every worker.
+
+Tasks are not all polled on every status sweep. Each task has its own
+interval which starts at `STATUS_CHECK_MIN_INTERVAL` and doubles every time
+a poll finds no change in its state or progress, up to
+`STATUS_CHECK_MAX_INTERVAL`. Any change, or any transition made through the
+coordinator, brings the task back to the minimum interval.
+"""
+import time
+import logging
+from django.conf import settings
+from django.core.cache import cache
+
+
+logger = logging.getLogger(__name__)
+
+
+def _key(task_id):
+    return f"STATUS_CHECK_{task_id}"
+
+
+def due(tasks, now=None):
+    """
+    Filter tasks down to those that are due to have their status checked
+
+    :param tasks: A list of tasks
+    :param now: The current unix time
+    :returns: The tasks that should be polled now
+    """
+    now = time.time() if now is None else now
+    schedule = cache.get_many([_key(task.kf_id) for task in tasks])
+    return [
+        task
+        for task in tasks
+        if schedule.get(_key(task.kf_id), {}).get("next", 0) <= now
+    ]
+
+
+def reschedule(tasks, changed, now=None):
+    """
+    Set when each task should next be polled
+
+    :param tasks: The tasks that were just polled
+    :param changed: The kf_ids of the tasks whose state or progress changed
+    :param now: The current unix time
+    """
+    now = time.time() if now is None else now
+    schedule = cache.get_many([_key(task.kf_id) for task in tasks])
+    updates = {}
+    for task in tasks:
+        key = _key(task.kf_id)
+        if task.kf_id in changed or key not in schedule:
+            interval = settings.STATUS_CHECK_MIN_INTERVAL
+        else:
+            interval = min(
+                schedule[key]["interval"] * 2,
+                settings.STATUS_CHECK_MAX_INTERVAL,
+            )
+        updates[key] = {"interval": interval, "next": now + interval}
+
+    cache.set_many(updates, settings.STATUS_CHECK_MAX_INTERVAL * 2)
+
+
+def reset(task_id):
+    """
+    Poll a task at the minimum interval again, eg: after a transition
+    """
+    cache.delete(_key(task_id))
+
+
+def sweeps():
+    """
+    The sweeps to run and how often to run them, in seconds
+    """
+    from coordinator.tasks import (
+        status_sweep,
+        release_status_sweep,
+        health_sweep,
+        publish_events,
+        reap_timeouts,
+        sync_studies,
+    )
+
+    return [
+        (status_sweep, settings.STATUS_SWEEP_INTERVAL),
+        (release_status_sweep, settings.RELEASE_SWEEP_INTERVAL),
+        (health_sweep, settings.HEALTH_SWEEP_INTERVAL),
+        (publish_events, settings.OUTBOX_SWEEP_INTERVAL),
+        (reap_timeouts, settings.TIMEOUT_SWEEP_INTERVAL),
+        (sync_studies, settings.STUDY_SYNC_INTERVAL),
+    ]
+
+
+def tick():
+    """
+    Enqueue any sweeps that are due to run.
+
+    :returns: The names of the sweeps that were enqueued
+    """
+    import django_rq
+
+    enqueued = []
+    for job, interval in sweeps():
+        name = job.__name__
+        # Only one scheduler may enqueue a sweep in each interval
+        if cache.add(f"SCHEDULER_{name}", True, interval):
+            django_rq.enqueue(job)
+            enqueued.append(name)
+    return enqueued
+
+
+def run():
+    """
+    Run the scheduler forever
+    """
+    from coordinator import deadlines
+
+    logger.info("Starting scheduler")
+    # In case anything was missed while there was no scheduler
+    deadlines.rebuild()
+    while True:
+        for name in tick():
+            logger.info(f"Scheduled {name}")
+        time.sleep(settings.SCHEDULER_TICK)
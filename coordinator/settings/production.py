@@ -98,7 +98,7 @@ REST_FRAMEWORK = {
         'rest_framework.renderers.BrowsableAPIRenderer',
     ),
     'DEFAULT_PAGINATION_CLASS':
-        'rest_framework.pagination.LimitOffsetPagination',
+        'coordinator.pagination.CursorOrLimitOffsetPagination',
     'PAGE_SIZE': 10
 }
 
@@ -186,6 +186,10 @@ AUTH0_JWKS = os.environ.get(
 AUTH0_AUD = os.environ.get(
     "AUTH0_AUD", "https://kf-release-coord.kidsfirstdrc.org"
 )
+# Audience of the tokens used to read user profiles from Auth0
+AUTH0_MANAGEMENT_AUD = os.environ.get(
+    "AUTH0_MANAGEMENT_AUD", "https://kids-first.auth0.com/api/v2/"
+)
 AUTH0_CLIENT = os.environ.get("AUTH0_CLIENT")
 AUTH0_SECRET = os.environ.get("AUTH0_SECRET")
 CACHE_AUTH0_KEY = os.environ.get("CACHE_AUTH0_KEY", "AUTH0_PUBLIC_KEY")
@@ -193,10 +197,30 @@ CACHE_AUTH0_SERVICE_KEY = os.environ.get(
     "CACHE_AUTH0_SERVICE_KEY", "AUTH0_SERVICE_KEY"
 )
 CACHE_AUTH0_TIMEOUT = int(os.environ.get("CACHE_AUTH0_TIMEOUT", 86400))
+# Least time to wait before fetching keys again for a token with a new kid
+CACHE_AUTH0_REFETCH_INTERVAL = int(
+    os.environ.get("CACHE_AUTH0_REFETCH_INTERVAL", 60)
+)
+# Most verified tokens to keep in each process
+CACHE_AUTH0_TOKENS_SIZE = int(os.environ.get("CACHE_AUTH0_TOKENS_SIZE", 1024))
+# How long to cache users by their sub, and the least time between
+# updates to a user's last_login
+CACHE_AUTH0_USER_TIMEOUT = int(os.environ.get("CACHE_AUTH0_USER_TIMEOUT", 300))
+LAST_LOGIN_INTERVAL = int(os.environ.get("LAST_LOGIN_INTERVAL", 300))
+# How long before the service token expires to start refreshing it
+SERVICE_TOKEN_REFRESH_MARGIN = int(
+    os.environ.get("SERVICE_TOKEN_REFRESH_MARGIN", 600)
+)
 
 JWT_AUD = 'https://kf-release-coord.kidsfirstdrc.org'
 
 SNS_ARN = os.environ.get('SNS_ARN', None)
+# Most outbox messages to publish to SNS in one batch
+OUTBOX_BATCH_SIZE = 100
+# How long a publisher may hold a batch before others may retry it
+OUTBOX_CLAIM_TIMEOUT = 300
+# Attempts to publish a message before it is dropped
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", 10))
 
 DATASERVICE_URL = os.environ.get('DATASERVICE_URL', None)
 
@@ -250,6 +274,22 @@ STATICFILES_DIRS = [
 GRAPHENE = {
     'SCHEMA': 'coordinator.graphql.schema.schema'
 }
+# Largest cost and deepest nesting of objects allowed in a query
+GRAPHQL_MAX_COST = int(os.environ.get("GRAPHQL_MAX_COST", 50000))
+GRAPHQL_MAX_DEPTH = int(os.environ.get("GRAPHQL_MAX_DEPTH", 10))
+# Most parsed queries to keep in each process
+GRAPHQL_DOCUMENT_CACHE_SIZE = int(
+    os.environ.get("GRAPHQL_DOCUMENT_CACHE_SIZE", 256)
+)
+# Path to a JSON file of the only queries that may be run, by their sha256
+GRAPHQL_QUERY_ALLOWLIST = os.environ.get("GRAPHQL_QUERY_ALLOWLIST")
+# Longest time to serve a cached response to an anonymous read
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get("RESPONSE_CACHE_TIMEOUT", 60))
+# Tables with more rows than this are counted from the planner's estimate
+# in list responses unless an exact count is asked for, 0 always counts
+APPROXIMATE_COUNT_THRESHOLD = int(
+    os.environ.get("APPROXIMATE_COUNT_THRESHOLD", 100000)
+)
 
 # APIs
 EGO_API = os.environ.get('EGO_URL', None)
@@ -259,10 +299,42 @@ DATASERVICE_API = os.environ.get('DATASERVICE_URL', None)
 TASK_TIMEOUT = 160000
 RELEASE_TIMEOUT = 360000
 REQUEST_TIMEOUT = 15
+# Deadline for fanning out an action to all task services at once
+DISPATCH_TIMEOUT = 30
+DISPATCH_WORKERS = 16
+# Connection pools for requests to task services, kept for the life of the
+# process. POOL_CONNECTIONS is how many hosts to keep pools for and
+# POOL_MAXSIZE is how many connections to keep open to each host.
+REQUESTS_POOL_CONNECTIONS = int(
+    os.environ.get("REQUESTS_POOL_CONNECTIONS", 20)
+)
+REQUESTS_POOL_MAXSIZE = int(os.environ.get("REQUESTS_POOL_MAXSIZE", 16))
+REQUESTS_RETRIES = int(os.environ.get("REQUESTS_RETRIES", 2))
+REQUESTS_BACKOFF = float(os.environ.get("REQUESTS_BACKOFF", 0.1))
 REQUESTS_HEADERS = {
     "User-Agent": "ReleaseCoordinator/production (python-requests)"
 }
 
+# Scheduler, run with `manage.py scheduler`. Intervals are in seconds
+SCHEDULER_TICK = int(os.environ.get("SCHEDULER_TICK", 10))
+STATUS_SWEEP_INTERVAL = int(os.environ.get("STATUS_SWEEP_INTERVAL", 30))
+RELEASE_SWEEP_INTERVAL = int(os.environ.get("RELEASE_SWEEP_INTERVAL", 60))
+HEALTH_SWEEP_INTERVAL = int(os.environ.get("HEALTH_SWEEP_INTERVAL", 10))
+# Longest to wait between health checks of a task service that is down
+HEALTH_BACKOFF_MAX = 600
+OUTBOX_SWEEP_INTERVAL = int(os.environ.get("OUTBOX_SWEEP_INTERVAL", 60))
+TIMEOUT_SWEEP_INTERVAL = int(
+    os.environ.get("TIMEOUT_SWEEP_INTERVAL", 30)
+)
+# Studies are synced with the dataservice in the background this often, a
+# sync that runs longer than the timeout is assumed to have died
+STUDY_SYNC_INTERVAL = int(os.environ.get("STUDY_SYNC_INTERVAL", 600))
+STUDY_SYNC_TIMEOUT = int(os.environ.get("STUDY_SYNC_TIMEOUT", 600))
+# Each task is polled between the min and max interval, backing off while
+# its status doesn't change
+STATUS_CHECK_MIN_INTERVAL = 10
+STATUS_CHECK_MAX_INTERVAL = 600
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
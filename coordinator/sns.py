@@ -0,0 +1,86 @@
+"""
+Publishing of events to SNS.
+
+Events are never published from the request or job that creates them.
+Instead, a message is written to the outbox in the same transaction as the
+event and the `publish_events` job later drains the outbox in batches, so
+a slow or unavailable SNS never holds up or fails a state change.
+
+A single SNS client is kept for the life of the process and is rebuilt
+after a fork.
+"""
+import os
+import json
+import threading
+import boto3
+from django.conf import settings
+
+# The most messages SNS accepts in one PublishBatch request
+BATCH_SIZE = 10
+
+_client = None
+_lock = threading.Lock()
+
+
+def client():
+    """
+    Get the process's SNS client, creating it on first use.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = boto3.client("sns")
+    return _client
+
+
+def _reset():
+    """ Drop any client inherited from a parent process """
+    global _client, _lock
+    _client = None
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset)
+
+
+def message(event):
+    """
+    Build the SNS message for an event
+
+    :param event: The event to publish
+    :returns: The message body as a json string
+    """
+    default = {
+        "event_type": event.event_type,
+        "message": event.message,
+        "task_service": event.task_service_id,
+        "task": event.task_id,
+        "release": event.release_id,
+    }
+    return json.dumps({"default": json.dumps(default)})
+
+
+def publish(messages):
+    """
+    Publish messages to the SNS_ARN topic, up to BATCH_SIZE at a time.
+
+    :param messages: A list of (id, message) to publish
+    :returns: The ids of the messages that SNS did not accept
+    """
+    failed = []
+    for i in range(0, len(messages), BATCH_SIZE):
+        batch = messages[i:i + BATCH_SIZE]
+        resp = client().publish_batch(
+            TopicArn=settings.SNS_ARN,
+            PublishBatchRequestEntries=[
+                {
+                    "Id": str(message_id),
+                    "Message": body,
+                    "MessageStructure": "json",
+                }
+                for message_id, body in batch
+            ],
+        )
+        failed.extend(int(f["Id"]) for f in resp.get("Failed", []))
+    return failed
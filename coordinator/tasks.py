@@ -2,13 +2,28 @@ import django_rq
 import django_fsm
 import requests
 import logging
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, wait
 from django.conf import settings
 from django.core.cache import cache
-from coordinator.authentication import headers
-from coordinator.api.models import Task, TaskService, Release, Event
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django.db import transaction
+from django.db.models import F, Q
+from botocore.exceptions import BotoCoreError, ClientError
+from coordinator import client, dataservice, deadlines, scheduler, sns
+from coordinator.authentication import get_profile, headers
+from coordinator.api.models import (
+    Task,
+    TaskService,
+    Release,
+    Event,
+    OutboxMessage,
+)
 
 
 logger = logging.getLogger(__name__)
+User = get_user_model()
 
 
 @django_rq.job
@@ -48,6 +63,328 @@ def release_status_check(release_id):
     release.status_check()
 
 
+@django_rq.job
+def health_sweep(force=False):
+    """
+    Check the health of every task service at once.
+
+    Services that are down are only checked as often as their backoff
+    allows, unless forced.
+
+    :param force: Check every service, not only those that are due
+    """
+    services = list(TaskService.objects.all())
+    if not force:
+        services = [s for s in services if s.health_check_due()]
+    logger.info(f"Checking health of {len(services)} task services")
+
+    results = fan_out([(s.url + "/status", None) for s in services], "get")
+    for service, (resp, err) in zip(services, results):
+        service.record_health(err is None)
+        if service.health_status == "down":
+            logger.warning(f"task service {service.kf_id} is down: {err}")
+
+    TaskService.objects.bulk_update(
+        services, ["last_ok_status", "health_checked_at"]
+    )
+
+
+@django_rq.job
+def status_sweep(force=False):
+    """
+    Check the status of running and publishing tasks in a single pass.
+
+    All active tasks are loaded with their services and releases in one
+    query, their task services are polled concurrently, and any progress
+    updates are written back together.
+
+    :param force: Check every active task, not only those that are due
+    """
+    tasks = list(
+        Task.objects.filter(state__in=["running", "publishing"])
+        .select_related("task_service", "release")
+        .all()
+    )
+    if not force:
+        tasks = scheduler.due(tasks)
+    logger.info(f"Checking task status for {len(tasks)} tasks")
+
+    results = post_to_tasks(
+        tasks,
+        [
+            {
+                "task_id": task.kf_id,
+                "release_id": task.release_id,
+                "action": "get_status",
+            }
+            for task in tasks
+        ],
+    )
+
+    # Same as Task.status_check, a task is only failed if its service can't
+    # be reached or returns an error. Timed out checks, and tasks whose
+    # services are marked down and so weren't contacted, are tried in a
+    # later sweep.
+    unreachable = (
+        requests.exceptions.ConnectionError,
+        requests.exceptions.HTTPError,
+    )
+    updated = []
+    changed = set()
+    for task, (resp, err) in zip(tasks, results):
+        state, progress = task.state, task.progress
+        if isinstance(err, ServiceDown):
+            continue
+        # A bad response or transition only stops this task being checked
+        try:
+            if isinstance(err, unreachable):
+                task.update_status(None)
+            elif err is not None:
+                logger.error(
+                    f"problem checking status of {task.kf_id}: {err}"
+                )
+            elif (
+                task.update_status(resp.json())
+                and task.progress != progress
+            ):
+                updated.append(task)
+        except Exception:
+            logger.exception(f"problem updating status of {task.kf_id}")
+
+        if (task.state, task.progress) != (state, progress):
+            changed.add(task.kf_id)
+
+    Task.objects.bulk_update(updated, ["progress"])
+    scheduler.reschedule(tasks, changed)
+
+
+@django_rq.job
+def release_status_sweep():
+    """
+    Check the status of every active release in a single pass
+    """
+    to_check = ["initializing", "running", "publishing", "canceling"]
+    releases = Release.objects.filter(state__in=to_check)
+    for release in releases:
+        release.status_check()
+
+
+@django_rq.job
+def reap_timeouts():
+    """
+    Time out the releases of any tasks, and any releases, that have passed
+    their deadlines
+
+    Each entry is only removed from the index once it has been handled, so
+    anything that can't be handled now is tried again on the next run.
+    """
+    now = timezone.now()
+    task_ids = deadlines.expired(deadlines.TASKS, now.timestamp())
+    tasks = (
+        Task.objects.filter(
+            kf_id__in=task_ids, state__in=deadlines.TASK_STATES
+        )
+        .select_related("release")
+        .all()
+    )
+    release_ids = deadlines.expired(deadlines.RELEASES, now.timestamp())
+    releases = Release.objects.filter(
+        kf_id__in=release_ids, state__in=deadlines.RELEASE_STATES
+    ).all()
+
+    failed = set()
+    for task in tasks:
+        timeout = timedelta(seconds=settings.TASK_TIMEOUT)
+        try:
+            # The deadline may have moved since it was read from the index
+            if task.last_activity_at + timeout > now:
+                deadlines.update(task)
+                continue
+            task.release.time_out(f"task {task.kf_id} time out")
+        except Exception:
+            logger.exception(f"problem reaping task {task.kf_id}")
+            failed.add(task.kf_id)
+
+    for release in releases:
+        timeout = timedelta(seconds=settings.RELEASE_TIMEOUT)
+        try:
+            if release.last_activity_at + timeout > now:
+                deadlines.update(release)
+                continue
+            release.time_out()
+        except Exception:
+            logger.exception(f"problem reaping release {release.kf_id}")
+            failed.add(release.kf_id)
+
+    deadlines.remove(
+        deadlines.TASKS,
+        [kf_id for kf_id in task_ids if kf_id not in failed],
+        now.timestamp(),
+    )
+    deadlines.remove(
+        deadlines.RELEASES,
+        [kf_id for kf_id in release_ids if kf_id not in failed],
+        now.timestamp(),
+    )
+
+
+@django_rq.job
+def create_user(sub):
+    """
+    Create a new user from their Auth0 profile
+
+    :param sub: The sub of the user's token
+    :returns: The new user, or None if their profile couldn't be fetched
+    """
+    profile = get_profile(sub)
+    if profile is None:
+        return None
+
+    user, _ = User.objects.get_or_create(
+        sub=sub,
+        defaults={
+            "username": profile.get("nickname", ""),
+            "email": profile.get("email", ""),
+            "first_name": profile.get("given_name", ""),
+            "last_name": profile.get("family_name", ""),
+            "picture": profile.get("picture", ""),
+            "auth_groups": [],
+            "auth_roles": [],
+        },
+    )
+    return user
+
+
+@django_rq.job
+def publish_events():
+    """
+    Publish the messages waiting in the outbox to SNS.
+
+    Each batch is claimed for `OUTBOX_CLAIM_TIMEOUT` seconds and the claim
+    is committed before SNS is called, so no rows stay locked while waiting
+    on SNS and several publishers may run at once. A message is deleted once
+    SNS accepts it, so it may be sent more than once if the job is
+    interrupted. A message that still hasn't been published after
+    `OUTBOX_MAX_ATTEMPTS` attempts is logged and dropped.
+    """
+    cache.delete("PUBLISH_EVENTS_QUEUED")
+    if settings.SNS_ARN is None:
+        return
+
+    last = 0
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            messages = list(
+                OutboxMessage.objects.select_for_update(skip_locked=True)
+                .filter(id__gt=last)
+                .filter(
+                    Q(claimed_until__isnull=True)
+                    | Q(claimed_until__lt=now)
+                )
+                .order_by("id")[: settings.OUTBOX_BATCH_SIZE]
+            )
+            if not messages:
+                return
+            last = messages[-1].id
+
+            expired = [
+                m for m in messages
+                if m.attempts >= settings.OUTBOX_MAX_ATTEMPTS
+            ]
+            for m in expired:
+                logger.error(
+                    f"dropping outbox message {m.id} after {m.attempts} "
+                    f"attempts to publish it: {m.message}"
+                )
+            OutboxMessage.objects.filter(
+                id__in=[m.id for m in expired]
+            ).delete()
+
+            messages = [m for m in messages if m not in expired]
+            ids = [m.id for m in messages]
+            timeout = timedelta(seconds=settings.OUTBOX_CLAIM_TIMEOUT)
+            OutboxMessage.objects.filter(id__in=ids).update(
+                attempts=F("attempts") + 1, claimed_until=now + timeout
+            )
+
+        if not messages:
+            continue
+
+        try:
+            failed = sns.publish([(m.id, m.message) for m in messages])
+        except (BotoCoreError, ClientError) as err:
+            # Leave everything for the next run if SNS is unavailable
+            logger.error(f"problem publishing events to SNS: {err}")
+            OutboxMessage.objects.filter(id__in=ids).update(
+                claimed_until=None
+            )
+            return
+
+        if failed:
+            logger.error(f"SNS did not accept {len(failed)} messages")
+            OutboxMessage.objects.filter(id__in=failed).update(
+                claimed_until=None
+            )
+        OutboxMessage.objects.filter(id__in=ids).exclude(
+            id__in=failed
+        ).delete()
+
+
+@django_rq.job
+def sync_studies():
+    """
+    Sync studies with the dataservice, keeping the progress and result in
+    the sync's status.
+
+    Only one sync runs at a time, any others that are started meanwhile
+    return right away.
+    """
+    if not cache.add("STUDY_SYNC_RUNNING", True, settings.STUDY_SYNC_TIMEOUT):
+        logger.info("Studies are already being synced")
+        return
+
+    def progress(pages, studies):
+        dataservice.set_status(pages=pages, studies=studies)
+
+    dataservice.set_status(
+        status="running",
+        message="Syncing with the dataservice",
+        started_at=timezone.now().isoformat(),
+        pages=0,
+        studies=0,
+    )
+    try:
+        new, deleted = dataservice.sync(progress)
+    except requests.exceptions.RequestException as err:
+        logger.error(f"problem getting studies from the dataservice: {err}")
+        dataservice.set_status(
+            status="error",
+            message="There was an error getting studies from the "
+            f"dataservice: {err}",
+            finished_at=timezone.now().isoformat(),
+        )
+        return
+    except Exception:
+        dataservice.set_status(
+            status="error",
+            message="There was an error syncing studies",
+            finished_at=timezone.now().isoformat(),
+        )
+        raise
+    finally:
+        cache.delete_many([dataservice.QUEUED_KEY, "STUDY_SYNC_RUNNING"])
+
+    logger.info(f"Synced studies, {len(new)} new and {len(deleted)} deleted")
+    dataservice.set_status(
+        status="ok",
+        message="Synchronized with dataservice",
+        new=len(new),
+        deleted=len(deleted),
+        finished_at=timezone.now().isoformat(),
+    )
+
+
 @django_rq.job
 def init_release(release_id):
     """
@@ -105,7 +442,7 @@ def init_task(release_id, task_service_id, task_id):
     failed = False
     resp = None
     try:
-        resp = requests.post(
+        resp = client.post(
             service.url + "/tasks",
             headers=headers(),
             json=body,
@@ -139,9 +476,8 @@ def init_task(release_id, task_service_id, task_id):
         task.initialize()
         task.save()
 
-    # Check if we're ready to start running tasks
-    if all([t.state == "initialized" for t in release.tasks.all()]):
-        django_rq.enqueue(start_release, release_id)
+    # Start running tasks once they've all been initialized
+    Release.advance(release_id)
 
 
 @django_rq.job
@@ -153,30 +489,15 @@ def start_release(release_id):
     release = Release.objects.select_related().get(kf_id=release_id)
     studies = [study.kf_id for study in release.studies.all()]
 
-    release.start()
-    release.save()
-
-    for task in release.tasks.all():
-        body = {
-            "action": "start",
-            "task_id": task.kf_id,
-            "release_id": release.kf_id,
-            "studies": studies,
-        }
-        failed = False
-        resp = None
-        try:
-            resp = requests.post(
-                task.task_service.url + "/tasks",
-                headers=headers(),
-                json=body,
-                timeout=settings.REQUEST_TIMEOUT,
-            )
-            resp.raise_for_status()
-        except requests.exceptions.RequestException as err:
-            logger.error(f"problem requesting task for start: {resp.content}")
-            failed = True
+    # The release is already started if all of its tasks were initialized
+    if release.state == "initializing":
+        release.start()
+        release.save()
 
+    tasks = release.tasks.select_related("task_service").all()
+    failed = False
+    for task, resp, err in dispatch(release, tasks, "start", studies):
+        if err is not None:
             ev = Event(
                 event_type="error",
                 message=f"request to start task failed: {err}",
@@ -186,34 +507,17 @@ def start_release(release_id):
             )
             ev.save()
 
-        # Check that command was accepted
-        if resp and resp.status_code != 200:
-            logger.error(
-                f"invalid code from task for start: " + "{resp.status_code}"
-            )
-            failed = True
-
-        if (
-            resp
-            and "state" in resp.json()
-            and resp.json()["state"] != "running"
-        ):
-            logger.error(
-                f"invalid state returned from task for start: "
-                + "{resp.content}"
-            )
+        if accepted("start", resp, err, "running"):
+            task.start()
+        else:
+            task.failed()
             failed = True
+        task.save()
 
-        if failed:
-            release.cancel()
-            release.save()
-            task.failed()
-            task.save()
-            django_rq.enqueue(cancel_release, release_id, True)
-            break
-        else:
-            task.start()
-            task.save()
+    if failed:
+        release.cancel()
+        release.save()
+        django_rq.enqueue(cancel_release, release_id, True)
 
 
 @django_rq.job
@@ -226,7 +530,7 @@ def publish_release(release_id):
     release = Release.objects.select_related().get(kf_id=release_id)
     studies = [study.kf_id for study in release.studies.all()]
     release.publish()
-    tasks = release.tasks.all()
+    tasks = release.tasks.select_related("task_service").all()
 
     # Should always have at least one task service for a release, but if there
     # are none, publish skip to published
@@ -235,73 +539,37 @@ def publish_release(release_id):
 
     release.save()
 
-    for task in tasks:
-        body = {
-            "action": "publish",
-            "task_id": task.kf_id,
-            "release_id": release.kf_id,
-            "studies": studies,
-        }
-        failed = False
-        resp = None
-        try:
-            resp = requests.post(
-                task.task_service.url + "/tasks",
-                headers=headers(),
-                json=body,
-                timeout=settings.REQUEST_TIMEOUT,
-            )
-            resp.raise_for_status()
-        except requests.exceptions.RequestException as err:
-            logger.error(
-                f"problem requesting task for publish: " + f"{resp.content}"
-            )
-            failed = True
-
+    failed = False
+    for task, resp, err in dispatch(release, tasks, "publish", studies):
+        if err is not None:
             ev = Event(
                 event_type="error",
                 message=f"request to publish task failed: {err}",
                 release=release,
                 task=task,
-                task_service=task_service,
+                task_service=task.task_service,
             )
             ev.save()
 
-        # Check that command was accepted
-        if resp and resp.status_code != 200:
-            logger.error(
-                f"invalid code from task for publish: " + "{resp.status_code}"
-            )
-            failed = True
-
-        if (
-            resp
-            and "state" in resp.json()
-            and resp.json()["state"] != "publishing"
-        ):
-            logger.error(
-                f"invalid state returned from task for publish: "
-                + f"{resp.content}"
-            )
-            failed = True
-
-        if failed:
-            release.cancel()
-            release.save()
+        if accepted("publish", resp, err, "publishing"):
+            task.publish()
+        else:
             task.failed()
-            task.save()
-            django_rq.enqueue(cancel_release, release.kf_id, True)
-            break
-
-        task.publish()
+            failed = True
         task.save()
 
+    if failed:
+        release.cancel()
+        release.save()
+        django_rq.enqueue(cancel_release, release.kf_id, True)
+
 
 @django_rq.job
 def cancel_release(release_id, fail=False):
     """
     Cancels a release by sending 'cancel' action to all tasks
     """
+    cache.delete(f"CANCEL_RELEASE_QUEUED_{release_id}")
     logger.info(
         f"{'Canceling' if not fail else 'Failing'} release {release_id}"
     )
@@ -314,26 +582,18 @@ def cancel_release(release_id, fail=False):
         logger.warn(f"Release is already marked as {release.state}")
         return
 
-    for task in release.tasks.all():
-        # The task may have been the one to cause the cancel/fail
-        # Don't try to change its state if it's already canceled/failed
-        if task.state in ["canceled", "failed", "rejected"]:
-            continue
+    # The task may have been the one to cause the cancel/fail
+    # Don't try to change its state if it's already canceled/failed
+    tasks = release.tasks.select_related("task_service").exclude(
+        state__in=["canceled", "failed", "rejected"]
+    )
 
-        body = {
-            "action": "cancel",
-            "task_id": task.kf_id,
-            "release_id": release.kf_id,
-            "studies": studies,
-        }
-        try:
-            requests.post(
-                task.task_service.url + "/tasks",
-                headers=headers(),
-                json=body,
-                timeout=settings.REQUEST_TIMEOUT,
-            )
-        except requests.exceptions.RequestException as err:
+    # Cancel is always sent, even to services marked down, so that one that
+    # has recovered doesn't keep working on the release
+    for task, resp, err in dispatch(
+        release, tasks, "cancel", studies, skip_down=False
+    ):
+        if err is not None:
             ev = Event(
                 event_type="error",
                 message=f"request to cancel task failed: {err}",
@@ -354,3 +614,169 @@ def cancel_release(release_id, fail=False):
     except django_fsm.TransitionNotAllowed as err:
         logger.info(f"Tried to make an invalid transition: {err}")
     release.save()
+
+
+def dispatch(release, tasks, action, studies, skip_down=True):
+    """
+    Send an action to the task service of every task at once.
+
+    :param release: The release the tasks belong to
+    :param tasks: The tasks to send the action to
+    :param action: The action to send, eg: 'start'
+    :param studies: The kf_ids of the studies in the release
+    :param skip_down: Don't send to services that are known to be down,
+        see `post_to_tasks`
+    :returns: A list of (task, response, error) for every task, in order.
+        The error will be None if a response was received.
+    """
+    tasks = list(tasks)
+    results = post_to_tasks(
+        tasks,
+        [
+            {
+                "action": action,
+                "task_id": task.kf_id,
+                "release_id": release.kf_id,
+                "studies": studies,
+            }
+            for task in tasks
+        ],
+        skip_down,
+    )
+    return [(task, resp, err) for task, (resp, err) in zip(tasks, results)]
+
+
+class ServiceDown(Exception):
+    """
+    A task service was not contacted because it is down. This says nothing
+    about the task itself, the service may have recovered since its last
+    health check.
+    """
+
+
+def post_to_tasks(tasks, bodies, skip_down=True):
+    """
+    POST to the task service of every task at once, except for services that
+    are known to be down.
+
+    Services that were found down by the last health sweep fail straight
+    away with ServiceDown rather than waiting on a request that is unlikely
+    to succeed. They are brought back by the health sweep. Services that
+    were marked down longer ago are tried anyway, as they may have
+    recovered since.
+
+    :param tasks: The tasks to send to, with their task services loaded
+    :param bodies: The body to send for each task
+    :param skip_down: Skip services that are known to be down, otherwise
+        every service is sent to
+    :returns: A list of (response, error) for every task, in order.
+    """
+    results = [
+        (None, ServiceDown(f"task service {t.task_service_id} is down"))
+        for t in tasks
+    ]
+    now = timezone.now()
+    up = [
+        i
+        for i, task in enumerate(tasks)
+        if not (skip_down and task.task_service.known_down(now))
+    ]
+    sent = fan_out(
+        [(tasks[i].task_service.url + "/tasks", bodies[i]) for i in up]
+    )
+    for i, result in zip(up, sent):
+        results[i] = result
+    return results
+
+
+def fan_out(requests_to_send, method="post"):
+    """
+    Make requests to many task services at once.
+
+    Requests are made from a bounded pool of threads and all share a single
+    deadline of `DISPATCH_TIMEOUT` seconds, so the whole batch takes as long
+    as the slowest task service rather than the sum of all of them.
+    Only the requests are made in the pool, all database work is left to the
+    caller.
+
+    :param requests_to_send: A list of (url, body) to send. The body is
+        sent as json unless it is None
+    :param method: The request method, 'post' or 'get'
+    :returns: A list of (response, error) for every request, in order.
+        The error will be None if a response was received.
+    """
+    if not requests_to_send:
+        return []
+
+    # Resolve everything that touches the database or cache up front
+    request_headers = headers()
+
+    def send(url, body):
+        kwargs = {} if body is None else {"json": body}
+        resp = getattr(client, method)(
+            url,
+            headers=request_headers,
+            timeout=settings.REQUEST_TIMEOUT,
+            **kwargs,
+        )
+        resp.raise_for_status()
+        return resp
+
+    workers = min(settings.DISPATCH_WORKERS, len(requests_to_send))
+    executor = ThreadPoolExecutor(max_workers=workers)
+    futures = [executor.submit(send, *req) for req in requests_to_send]
+    wait(futures, timeout=settings.DISPATCH_TIMEOUT)
+    # Don't hold the job up on any requests that are still outstanding
+    executor.shutdown(wait=False)
+
+    results = []
+    for future in futures:
+        if not future.done():
+            future.cancel()
+            err = requests.exceptions.Timeout(
+                f"no response within {settings.DISPATCH_TIMEOUT}s"
+            )
+            results.append((None, err))
+            continue
+        try:
+            results.append((future.result(), None))
+        except (requests.exceptions.RequestException, ValueError) as err:
+            results.append((None, err))
+
+    return results
+
+
+def accepted(action, resp, err, state):
+    """
+    Check whether a task service accepted an action.
+
+    :param action: The action that was sent to the task service
+    :param resp: The response from the task service, if there was one
+    :param err: The error from the request, if there was one
+    :param state: The state the task is expected to report back
+    :returns: True if the task service accepted the action
+    """
+    if err is not None:
+        logger.error(f"problem requesting task for {action}: {err}")
+        return False
+
+    if resp.status_code != 200:
+        logger.error(
+            f"invalid code from task for {action}: {resp.status_code}"
+        )
+        return False
+
+    try:
+        content = resp.json()
+    except ValueError:
+        logger.error(
+            f"invalid response from task for {action}: {resp.content}"
+        )
+        return False
+    if "state" in content and content["state"] != state:
+        logger.error(
+            f"invalid state returned from task for {action}: {resp.content}"
+        )
+        return False
+
+    return True
@@ -9,9 +9,12 @@ from rest_framework_nested import routers
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
-from graphene_django.views import GraphQLView
-
 from coordinator.api import views
+from coordinator.graphql.backend import (
+    CostLimitBackend,
+    PageSizeMiddleware,
+)
+from coordinator.graphql.views import PersistedQueryView
 
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
@@ -55,5 +58,7 @@ urlpatterns = [
         name='schema-swagger-ui'),
     url(r'^redoc/$', schema_view.with_ui('redoc', cache_timeout=None),
         name='schema-redoc'),
-    path('graphql', csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path('graphql', csrf_exempt(PersistedQueryView.as_view(
+        graphiql=True, backend=CostLimitBackend(),
+        middleware=[PageSizeMiddleware()]))),
 ]
@@ -0,0 +1,24 @@
+"""
+The RQ worker that the coordinator is run with.
+
+RQ's default worker forks a new work horse for every job, which throws away
+the shared HTTP client's connections, see `coordinator.client`, after every
+job. This worker runs jobs in its own process instead so that keep-alive
+connections to task services are reused from one job to the next. Run it
+with `rqworker --worker-class coordinator.worker.Worker`.
+
+Database connections are checked before and after each job, as Django does
+around each request, so that a connection that has broken or outlived
+`CONN_MAX_AGE` isn't carried into the next job.
+"""
+from django.db import close_old_connections
+from rq import SimpleWorker
+
+
+class Worker(SimpleWorker):
+    def perform_job(self, *args, **kwargs):
+        close_old_connections()
+        try:
+            return super().perform_job(*args, **kwargs)
+        finally:
+            close_old_connections()
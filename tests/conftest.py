@@ -9,11 +9,40 @@ from coordinator.api.models import Release, TaskService, Study, Task
 from rest_framework.test import APIClient
 from unittest import mock
 import jwt
+from django.core.cache import cache
 
 
 BASE_URL = "http://testserver"
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """ Don't carry cached users or locks over from other tests """
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def sync_user_jobs():
+    """
+    Create new users as soon as they are seen rather than in the background
+    """
+    queue = django_rq.get_queue(is_async=False)
+    with mock.patch("coordinator.middleware.django_rq") as mock_rq:
+        mock_rq.enqueue.side_effect = queue.enqueue
+        yield mock_rq
+
+
+@pytest.fixture
+def sync_study_jobs():
+    """
+    Sync studies as soon as a sync is started rather than in the background
+    """
+    queue = django_rq.get_queue(is_async=False)
+    with mock.patch("coordinator.dataservice.django_rq") as mock_rq:
+        mock_rq.enqueue.side_effect = queue.enqueue
+        yield mock_rq
+
+
 @pytest.yield_fixture
 def client():
     """ Sets client to use json requests """
@@ -92,7 +121,7 @@ def task_service(admin_client, transactional_db):
         "description": "lorem ipsum",
         "enabled": True,
     }
-    with patch("coordinator.api.validators.requests") as mock_requests:
+    with patch("coordinator.api.validators.client") as mock_requests:
         mock_resp = Mock()
         mock_resp.content = str.encode('{"name": "test"}')
         mock_resp.status_code = 200
@@ -181,7 +210,7 @@ def releases(admin_client, studies):
 @pytest.yield_fixture
 def task_services(admin_client):
     ts = {}
-    with patch("coordinator.api.validators.requests") as mock_requests:
+    with patch("coordinator.api.validators.client") as mock_requests:
         mock_resp = Mock()
         mock_resp.content = str.encode('{"name": "test"}')
         mock_resp.status_code = 200
@@ -292,9 +321,9 @@ def auth0_key_mock():
     Mocks out the response from the /.well-known/jwks.json endpoint on auth0
     """
     middleware = "coordinator.middleware.Auth0AuthenticationMiddleware"
-    with mock.patch(f"{middleware}._get_new_key") as get_key:
+    with mock.patch(f"{middleware}._get_new_keys") as get_key:
         with open("tests/keys/jwks.json", "r") as f:
-            get_key.return_value = json.load(f)["keys"][0]
+            get_key.return_value = json.load(f)["keys"]
             yield get_key
 
 
@@ -312,10 +341,9 @@ def auth0_service_mock(service_token):
 @pytest.fixture(scope="module", autouse=True)
 def auth0_profile_mock():
     """
-    Mocks out the Auth0 profile response from /userinfo
+    Mocks out the Auth0 profile response from the Management API
     """
-    middleware = "coordinator.middleware.Auth0AuthenticationMiddleware"
-    with mock.patch(f"{middleware}._get_profile") as get_prof:
+    with mock.patch("coordinator.tasks.get_profile") as get_prof:
         profile = {
             "sub": "google-oauth2|999999999999999999999",
             "given_name": "Bobby",
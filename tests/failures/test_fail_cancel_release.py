@@ -16,7 +16,7 @@ def test_fail_cancel(admin_client, dev_client, client, transactional_db,
     """
     # Our task should respond 'failed' during status check, even though
     # it is 'running' internally
-    mock_task_requests = mocker.patch('coordinator.api.models.task.requests')
+    mock_task_requests = mocker.patch('coordinator.api.models.task.client')
     mock_task_action = mock.Mock()
     mock_task_action.status_code = 200
     mock_task_action.json.return_value = {'state': 'failed'}
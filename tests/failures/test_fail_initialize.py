@@ -26,9 +26,12 @@ def init_release(client, worker):
     return resp
 
 
-def check_common(client):
+def check_common(client, request_error=False):
     """
     Common checks
+
+    :param request_error: Whether the request to the task service raised an
+        error, which will be recorded in an extra error event
     """
     # Check task state
     resp = client.get(BASE_URL+'/tasks')
@@ -45,11 +48,11 @@ def check_common(client):
     # Check events
     task_id = task['kf_id']
     task = Task.objects.filter(kf_id=task_id).get()
-    assert Event.objects.filter(task_id=task_id).count() == 1
-    event = Event.objects.filter(task_id=task_id).get()
-    assert event.event_type == 'error'
+    events = Event.objects.filter(task_id=task_id)
+    assert events.count() == (2 if request_error else 1)
+    assert all(event.event_type == 'error' for event in events)
 
-    assert Event.objects.count() == 4
+    assert Event.objects.count() == (5 if request_error else 4)
 
 
 def test_fail_initialize_500(client, dev_client, transactional_db,
@@ -58,7 +61,7 @@ def test_fail_initialize_500(client, dev_client, transactional_db,
     Test case when a task is rejected from returning a non-200 repsonse
     when an `initialize` action is sent to it.
     """
-    mock_task_requests = mocker.patch('coordinator.tasks.requests')
+    mock_task_requests = mocker.patch('coordinator.tasks.client')
     mock_task_action = mock.Mock()
     mock_task_action.status_code = 500
     mock_task_action.json.return_value = {'message': 'internal server error'}
@@ -74,14 +77,13 @@ def test_fail_initialize_connection_err(client, dev_client, transactional_db,
     Test case when a task is rejected from returning a non-200 repsonse
     when an `initialize` action is sent to it.
     """
-    mock_task_requests = mocker.patch('coordinator.tasks.requests')
+    mock_task_requests = mocker.patch('coordinator.tasks.client')
     mock_task_action = mock.Mock()
-    # NB We must use the mocked exception class, not the requests exception
-    exc = mock_task_requests.exceptions.ConnectionError()
+    exc = requests.exceptions.ConnectionError()
     mock_task_requests.post.side_effect = exc
 
     release = init_release(dev_client, worker)
-    check_common(client)
+    check_common(client, request_error=True)
 
 
 def test_fail_initialize_timeout(client, dev_client, transactional_db,
@@ -89,11 +91,10 @@ def test_fail_initialize_timeout(client, dev_client, transactional_db,
     """
     Test case when a task is rejected from a timed-out request
     """
-    mock_task_requests = mocker.patch('coordinator.tasks.requests')
+    mock_task_requests = mocker.patch('coordinator.tasks.client')
     mock_task_action = mock.Mock()
-    # NB We must use the mocked exception class, not the requests exception
-    exc = mock_task_requests.exceptions.TimeoutError()
+    exc = requests.exceptions.Timeout()
     mock_task_requests.post.side_effect = exc
 
     release = init_release(dev_client, worker)
-    check_common(client)
+    check_common(client, request_error=True)
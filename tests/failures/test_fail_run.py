@@ -35,7 +35,7 @@ def test_fail_running(admin_client, dev_client, client, transactional_db,
     The other task should be in a canceled state after being canceled by coord
     The release should be in a failed state as one of its tasks have failed
     """
-    mock_task_requests = mocker.patch('coordinator.tasks.requests')
+    mock_task_requests = mocker.patch('coordinator.tasks.client')
     mock_task_action = mock.Mock()
     mock_task_action.status_code = 200
     mock_task_action.json.return_value = {'state': 'running'}
@@ -49,7 +49,7 @@ def test_fail_running(admin_client, dev_client, client, transactional_db,
         'description': 'lorem ipsum',
         'enabled': True
     }
-    with mock.patch('coordinator.api.validators.requests') as mock_requests:
+    with mock.patch('coordinator.api.validators.client') as mock_requests:
         mock_resp = mock.Mock()
         mock_resp.content = str.encode('{"name": "test"}')
         mock_resp.status_code = 200
@@ -95,7 +95,7 @@ def test_cancel_running(admin_client, dev_client, client, transactional_db,
     """
     Test when a release is canceled due to one of its tasks being canceled
     """
-    mock_task_requests = mocker.patch('coordinator.tasks.requests')
+    mock_task_requests = mocker.patch('coordinator.tasks.client')
     mock_task_action = mock.Mock()
     mock_task_action.status_code = 200
     mock_task_action.json.return_value = {'state': 'running'}
@@ -109,7 +109,7 @@ def test_cancel_running(admin_client, dev_client, client, transactional_db,
         'description': 'lorem ipsum',
         'enabled': True
     }
-    with mock.patch('coordinator.api.validators.requests') as mock_requests:
+    with mock.patch('coordinator.api.validators.client') as mock_requests:
         mock_resp = mock.Mock()
         mock_resp.content = str.encode('{"name": "test"}')
         mock_resp.status_code = 200
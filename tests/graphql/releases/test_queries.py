@@ -65,3 +65,59 @@ def test_list_all_permissions(db, test_client, user_type, expected):
     resp = client.post("/graphql", data={"query": ALL_RELEASES})
     # Test that the correct number of releases are returned
     assert len(resp.json()["data"]["allReleases"]["edges"]) == expected
+
+
+NESTED_RELEASES = """
+{
+    allReleases(first: 10) {
+        edges {
+            node {
+                kfId
+                studies(first: 10) { edges { node { kfId
+                    releases(first: 10) { edges { node { kfId } } }
+                } } }
+                notes(first: 10) { edges { node { kfId } } }
+                tasks(first: 10) { edges { node {
+                    kfId
+                    release { kfId }
+                    taskService {
+                        kfId
+                        events(first: 10) { edges { node { kfId } } }
+                    }
+                    events(first: 10) { edges { node { kfId } } }
+                } } }
+            }
+        }
+    }
+}
+"""
+
+
+def test_nested_relations_batched(db, admin_client):
+    """
+    Test that relations of every release in a page are loaded together so
+    that the query takes the same number of queries for any number of
+    releases
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    ReleaseFactory(state="published")
+    admin_client.post("/graphql", data={"query": NESTED_RELEASES})
+    with CaptureQueriesContext(connection) as queries:
+        resp = admin_client.post("/graphql", data={"query": NESTED_RELEASES})
+    assert len(resp.json()["data"]["allReleases"]["edges"]) == 1
+    expected = len(queries)
+
+    ReleaseFactory.create_batch(4, state="published")
+    with CaptureQueriesContext(connection) as queries:
+        resp = admin_client.post("/graphql", data={"query": NESTED_RELEASES})
+    releases = resp.json()["data"]["allReleases"]["edges"]
+    assert len(releases) == 5
+    for release in releases:
+        tasks = release["node"]["tasks"]["edges"]
+        assert len(tasks) == 1
+        assert tasks[0]["node"]["release"]["kfId"] == release["node"]["kfId"]
+        assert tasks[0]["node"]["taskService"]["kfId"]
+        assert len(release["node"]["studies"]["edges"]) == 1
+    assert len(queries) == expected
@@ -3,27 +3,28 @@ import pytest
 
 SYNC_STUDIES = """
 mutation {
-    syncStudies {
-    new {
-      edges {
-        node {
-          id
-          kfId
-        }
-      }
-    }
-    deleted {
-      edges {
-        node {
-          id
-          kfId
-        }
-      }
+  syncStudies {
+    sync {
+      status
+      new
+      deleted
     }
   }
 }
 """
 
+STUDY_SYNC = """
+query {
+  studySync {
+    status
+    pages
+    studies
+    new
+    deleted
+  }
+}
+"""
+
 
 @pytest.mark.parametrize(
     "user_type,expected",
@@ -36,11 +37,49 @@ def test_sync_permissions(db, test_client, mocker, user_type, expected):
     USER - Can not sync studies
     anonomous - Can not sync studies
     """
-    mock_sync = mocker.patch("coordinator.graphql.studies.sync")
-    mock_sync.return_value = [], []
+    mock_sync = mocker.patch("coordinator.dataservice.enqueue_sync")
+    mock_sync.return_value = {"status": "queued"}
 
     client = test_client(user_type)
     resp = client.post("/graphql", data={"query": SYNC_STUDIES})
 
     assert "errors" in resp.json() if not expected else "data" in resp.json()
     assert mock_sync.call_count == 1 if expected else mock_sync.call_count == 0
+
+
+def test_sync_in_background(db, test_client, mocker, sync_study_jobs):
+    """ Test that the sync runs as a job and its status can be polled """
+    mock_client = mocker.patch("coordinator.dataservice.client")
+    mock_resp = mocker.Mock(headers={})
+    mock_resp.json.return_value = {
+        "results": [
+            {
+                "kf_id": "SD_00000000",
+                "name": "Study 0",
+                "visible": True,
+                "created_at": "2019-06-06T00:00:00+00:00",
+            }
+        ]
+    }
+    mock_client.get.return_value = mock_resp
+
+    client = test_client("admin")
+    resp = client.post("/graphql", data={"query": STUDY_SYNC})
+    assert resp.json()["data"]["studySync"]["status"] == "none"
+
+    resp = client.post("/graphql", data={"query": SYNC_STUDIES})
+    sync = resp.json()["data"]["syncStudies"]["sync"]
+    assert sync == {"status": "ok", "new": 1, "deleted": 0}
+
+    resp = client.post("/graphql", data={"query": STUDY_SYNC})
+    assert resp.json()["data"]["studySync"] == {
+        "status": "ok",
+        "pages": 1,
+        "studies": 1,
+        "new": 1,
+        "deleted": 0,
+    }
+
+    client = test_client("user")
+    resp = client.post("/graphql", data={"query": STUDY_SYNC})
+    assert "errors" in resp.json()
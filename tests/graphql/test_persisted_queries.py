@@ -0,0 +1,99 @@
+import json
+import uuid
+import pytest
+from coordinator.graphql import backend
+from coordinator.graphql.backend import CostLimitBackend, query_hash
+from coordinator.graphql.schema import schema
+
+
+def persisted(key):
+    return {"persistedQuery": {"version": 1, "sha256Hash": key}}
+
+
+@pytest.fixture
+def query():
+    """ A query that hasn't been seen before """
+    return "{ %s: allStudies { edges { node { kfId } } } }" % (
+        "q" + uuid.uuid4().hex
+    )
+
+
+def test_persisted_query(db, client, query, mocker):
+    """
+    Test that a query is only sent and parsed the first time its hash is
+    seen
+    """
+    validate = mocker.spy(backend, "validate")
+    key = query_hash(query)
+
+    resp = client.post(
+        "/graphql", format="json", data={"extensions": persisted(key)}
+    )
+    assert resp.status_code == 200
+    assert resp.json()["errors"][0]["message"] == "PersistedQueryNotFound"
+
+    resp = client.post(
+        "/graphql",
+        format="json",
+        data={"query": query, "extensions": persisted(key)},
+    )
+    assert resp.status_code == 200
+    assert "errors" not in resp.json()
+
+    for _ in range(3):
+        resp = client.post(
+            "/graphql", format="json", data={"extensions": persisted(key)}
+        )
+        assert resp.status_code == 200
+        assert "errors" not in resp.json()
+    assert validate.call_count == 1
+
+
+def test_persisted_query_mismatch(db, client, query):
+    """ Test that a query must match the hash it's sent with """
+    resp = client.post(
+        "/graphql",
+        format="json",
+        data={"query": query, "extensions": persisted("abc")},
+    )
+    assert resp.status_code == 400
+    assert "does not match" in resp.json()["errors"][0]["message"]
+
+
+def test_allowlist(db, client, query, settings, tmpdir):
+    """ Test that only queries in the allow-list may be run """
+    allowed = "{ allReleases { edges { node { kfId } } } }"
+    path = tmpdir.join("queries.json")
+    path.write(json.dumps({query_hash(allowed): allowed}))
+    settings.GRAPHQL_QUERY_ALLOWLIST = str(path)
+
+    resp = client.post("/graphql", format="json", data={"query": query})
+    assert resp.status_code == 400
+    assert "allow-list" in resp.json()["errors"][0]["message"]
+
+    # Queries in the allow-list may be run by their hash alone
+    resp = client.post(
+        "/graphql",
+        format="json",
+        data={"extensions": persisted(query_hash(allowed))},
+    )
+    assert resp.status_code == 200
+    assert resp.json()["data"]["allReleases"]["edges"] == []
+
+
+def test_document_lru():
+    """ Test that only the most recently used documents are kept """
+    documents = CostLimitBackend(size=2)
+    queries = [
+        "{ allStudies { edges { node { kfId } } } }",
+        "{ allReleases { edges { node { kfId } } } }",
+        "{ allTasks { edges { node { kfId } } } }",
+    ]
+    parsed = [documents.document_from_string(schema, q) for q in queries]
+    assert documents.get(query_hash(queries[0])) is None
+    assert documents.get(query_hash(queries[1])) is parsed[1]
+    assert documents.document_from_string(schema, queries[2]) is parsed[2]
+
+    # Invalid documents are never kept
+    documents.document_from_string(schema, "{ allStudies { notAField } }")
+    assert len(documents._documents) == 2
@@ -0,0 +1,161 @@
+import graphene
+import pytest
+from graphql import GraphQLError, parse
+from graphql.utils.introspection_query import introspection_query
+from coordinator.api.models import Event
+from coordinator.graphql.backend import measure
+from coordinator.graphql.schema import schema
+
+
+NESTED = """
+query ($first: Int) {
+    allStudies(first: $first) {
+        edges { node {
+            kfId
+            releases(first: 10) {
+                edges { node {
+                    kfId
+                    tasks { edges { node { kfId } } }
+                } }
+            }
+        } }
+    }
+}
+"""
+
+
+def test_measure():
+    """
+    Test that connections multiply the cost of everything inside them and
+    that relay's wrappers don't count towards the depth
+    """
+    cost, depth = measure(schema, parse(NESTED), variables={"first": 5})
+    # 5 studies, 50 releases, and up to 100 tasks for each release
+    assert cost == 5 + 50 + 50 * 100
+    assert depth == 3
+
+    cost, _ = measure(schema, parse(NESTED))
+    assert cost == 100 + 1000 + 1000 * 100
+
+
+def test_measure_fragments():
+    """ Test that fragments are measured where they are spread """
+    query = """
+    { allReleases(first: 2) { edges { node { ...Release } } } }
+    fragment Release on ReleaseNode {
+        tasks(first: 3) { edges { node { kfId } } }
+    }
+    """
+    assert measure(schema, parse(query)) == (2 + 6, 2)
+
+
+def test_measure_union():
+    """ Test that selections that can't be measured are an error """
+
+    class Thing(graphene.ObjectType):
+        other = graphene.Field(lambda: Thing)
+
+    class Union(graphene.Union):
+        class Meta:
+            types = (Thing,)
+
+    class Query(graphene.ObjectType):
+        union = graphene.Field(Union)
+
+    union_schema = graphene.Schema(query=Query)
+    query = "{ union { other { __typename } } }"
+    with pytest.raises(GraphQLError):
+        measure(union_schema, parse(query))
+
+
+def test_measure_bad_sizes():
+    """
+    Test that negative page sizes can't offset the cost of the rest of a
+    query and that sizes that aren't numbers count as the default
+    """
+    query = """
+    query ($first: Int) {
+        x: allEvents(first: -100000) { edges { node { kfId } } }
+        y: allEvents(first: $first) { edges { node { kfId } } }
+    }
+    """
+    assert measure(schema, parse(query), variables={"first": 5}) == (5, 1)
+    assert measure(schema, parse(query), variables={"first": "abc"}) == (
+        100, 1
+    )
+
+
+def test_negative_size_rejected(db, client, settings):
+    """ Test that a negative page size doesn't get a query under the limit """
+    settings.GRAPHQL_MAX_COST = 2000
+    query = NESTED.replace(
+        "{", "{ x: allEvents(first: -100000) { edges { node { kfId } } }", 1
+    )
+    resp = client.post(
+        "/graphql",
+        format="json",
+        data={"query": query, "variables": {"first": 5}},
+    )
+    assert resp.status_code == 400
+    assert "over the limit" in resp.json()["errors"][0]["message"]
+
+
+def test_bad_variable(db, client):
+    """ Test that a page size that isn't a number is a client error """
+    resp = client.post(
+        "/graphql",
+        format="json",
+        data={"query": NESTED, "variables": {"first": "abc"}},
+    )
+    assert resp.status_code == 400
+
+
+@pytest.mark.parametrize(
+    "setting,value", [("GRAPHQL_MAX_COST", 2000), ("GRAPHQL_MAX_DEPTH", 2)]
+)
+def test_rejected(db, client, settings, setting, value):
+    """ Test that queries over the limits are not run """
+    setattr(settings, setting, value)
+    resp = client.post(
+        "/graphql",
+        format="json",
+        data={"query": NESTED, "variables": {"first": 5}},
+    )
+    assert resp.status_code == 400
+    assert "over the limit" in resp.json()["errors"][0]["message"]
+
+    resp = client.post(
+        "/graphql",
+        format="json",
+        data={"query": NESTED, "variables": {"first": 1}},
+    )
+    if setting == "GRAPHQL_MAX_COST":
+        assert resp.status_code == 200
+    else:
+        assert resp.status_code == 400
+
+
+def test_introspection(db, client, settings):
+    """ Test that the schema may always be introspected """
+    settings.GRAPHQL_MAX_DEPTH = 1
+    resp = client.post("/graphql", data={"query": introspection_query})
+    assert resp.status_code == 200
+
+
+def test_unpaginated_limited(db, admin_client):
+    """
+    Test that a connection without a page size returns no more nodes than
+    it was costed at
+    """
+    Event.objects.bulk_create(
+        [Event(event_type="info", message=f"event {i}") for i in range(101)]
+    )
+    query = """
+    { allEvents { edges { node { kfId } } pageInfo { hasNextPage } } }
+    """
+    resp = admin_client.post("/graphql", data={"query": query})
+
+    assert resp.status_code == 200
+    events = resp.json()["data"]["allEvents"]
+    assert len(events["edges"]) == 100
+    assert events["pageInfo"]["hasNextPage"]
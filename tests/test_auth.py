@@ -1,11 +1,26 @@
 import os
 import jwt
+import time
 import pytest
+import requests
 from mock import Mock, patch
 from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from coordinator.authentication import ServiceToken, get_profile
+from coordinator.middleware import (
+    Auth0AuthenticationMiddleware,
+    Auth0Keys,
+    VerifiedTokens,
+)
+from coordinator.models import User
 
 
 BASE_URL = 'http://testserver'
+# Auth0's keys are mocked for every test, keep the real fetch to test it
+get_new_keys = Auth0AuthenticationMiddleware._get_new_keys
 
 
 def test_invalid_jwt(client, db, fakes):
@@ -89,7 +104,7 @@ def test_new_service(client, db, fakes, mocker, user_headers, user_type,
     """
     headers = user_headers(user_type)
 
-    mock_service_requests = mocker.patch('coordinator.api.validators.requests')
+    mock_service_requests = mocker.patch('coordinator.api.validators.client')
     mock_service_resp = Mock()
     mock_service_resp.status_code = 200
     mock_service_resp.content = str.encode('{"name": "test"}')
@@ -141,3 +156,281 @@ def test_health_checks(client, db, fakes, user_headers, user_type,
     resp = client.post(BASE_URL+'/task-services/health_checks',
                        headers=headers)
     assert resp.status_code == response_code
+
+
+@pytest.fixture
+def auth_request():
+    """ Make a request with a bearer token for the auth middleware """
+    def make_request(encoded):
+        request = Mock()
+        request.user = AnonymousUser()
+        request.META = {'HTTP_AUTHORIZATION': f'Bearer {encoded}'}
+        return request
+
+    return make_request
+
+
+@pytest.fixture
+def auth0_keys(auth0_key_mock, monkeypatch):
+    """ Start with no Auth0 keys or verified tokens loaded or cached """
+    cache.delete(settings.CACHE_AUTH0_KEY)
+    cache.delete(f'{settings.CACHE_AUTH0_KEY}_REFETCH')
+    monkeypatch.setattr(Auth0AuthenticationMiddleware, 'keys', Auth0Keys())
+    monkeypatch.setattr(Auth0AuthenticationMiddleware, 'tokens',
+                        VerifiedTokens(2))
+    auth0_key_mock.reset_mock()
+    return auth0_key_mock
+
+
+def test_auth0_key_cache(db, token, auth_request, auth0_keys, mocker):
+    """
+    Test that Auth0 keys are fetched and parsed once for many requests
+    """
+    from_jwk = mocker.spy(jwt.algorithms.RSAAlgorithm, 'from_jwk')
+    request = auth_request(token(roles=['ADMIN']))
+
+    for _ in range(5):
+        user = Auth0AuthenticationMiddleware.get_jwt_user(request)
+        assert user.auth_roles == ['ADMIN']
+
+    assert auth0_keys.call_count == 1
+    assert from_jwk.call_count == 1
+
+
+def unknown_kid(token):
+    """ Sign a token with the right key but a kid that isn't known """
+    with open('tests/keys/private_key.pem') as f:
+        key = f.read()
+    decoded = jwt.decode(token(), verify=False)
+    return jwt.encode(decoded, key, algorithm='RS256',
+                      headers={'kid': 'unknown'}).decode('utf-8')
+
+
+def test_auth0_unknown_kid(db, token, auth_request, auth0_keys, mocker):
+    """
+    Test that a token with an unknown kid is rejected and only causes keys
+    to be fetched again once in a while
+    """
+    encoded = unknown_kid(token)
+    Auth0AuthenticationMiddleware.get_jwt_user(auth_request(token()))
+    assert auth0_keys.call_count == 1
+    # Keys were just fetched, so they can't be fetched again yet
+    Auth0AuthenticationMiddleware.get_jwt_user(auth_request(encoded))
+    assert auth0_keys.call_count == 1
+
+    later = time.time() + settings.CACHE_AUTH0_REFETCH_INTERVAL
+    mocker.patch('coordinator.middleware.time.time', return_value=later)
+    cache.delete(f'{settings.CACHE_AUTH0_KEY}_REFETCH')
+
+    for _ in range(3):
+        user = Auth0AuthenticationMiddleware.get_jwt_user(
+            auth_request(encoded))
+        assert not user.is_authenticated
+
+    # Keys were only fetched again for the first request
+    assert auth0_keys.call_count == 2
+
+
+def test_auth0_refetch_limited(db, token, auth_request, auth0_keys, mocker):
+    """
+    Test that unknown kids don't cause keys to be parsed again while
+    another process is fetching them
+    """
+    Auth0AuthenticationMiddleware.get_jwt_user(auth_request(token()))
+    from_jwk = mocker.spy(jwt.algorithms.RSAAlgorithm, 'from_jwk')
+    sleep = mocker.patch('coordinator.middleware.time.sleep')
+
+    later = time.time() + settings.CACHE_AUTH0_REFETCH_INTERVAL
+    mocker.patch('coordinator.middleware.time.time', return_value=later)
+    # Another process holds the lock to fetch the keys
+    cache.set(f'{settings.CACHE_AUTH0_KEY}_REFETCH', True)
+
+    encoded = unknown_kid(token)
+    for _ in range(3):
+        user = Auth0AuthenticationMiddleware.get_jwt_user(
+            auth_request(encoded))
+        assert not user.is_authenticated
+
+    assert auth0_keys.call_count == 1
+    assert from_jwk.call_count == 0
+    assert sleep.call_count == 0
+
+
+def test_auth0_keys_error(mocker):
+    """ Test that an error from Auth0's jwks gives no keys """
+    get = mocker.patch('coordinator.middleware.requests.get')
+    get.return_value = Mock(ok=False, content=b'error')
+    assert get_new_keys() is None
+
+    get.return_value = Mock(ok=True, content=b'{}')
+    get.return_value.json.return_value = {'error': 'oops'}
+    assert get_new_keys() is None
+
+
+def test_verified_token_cache(db, token, auth_request, auth0_keys, mocker):
+    """
+    Test that repeated tokens are only verified once
+    """
+    decode = mocker.spy(jwt, 'decode')
+    admin = auth_request(token(roles=['ADMIN']))
+    service = auth_request(jwt.encode(
+        {'gty': 'client-credentials', 'exp': time.time() + 60},
+        open('tests/keys/private_key.pem').read(),
+        algorithm='RS256',
+    ).decode('utf-8'))
+
+    for _ in range(3):
+        user = Auth0AuthenticationMiddleware.get_jwt_user(admin)
+        assert user.auth_roles == ['ADMIN']
+        user = Auth0AuthenticationMiddleware.get_jwt_user(service)
+        assert user.auth_roles == ['ADMIN']
+    assert decode.call_count == 2
+
+
+def test_verified_token_lru(mocker):
+    """
+    Test that only the most recently used, unexpired tokens are kept
+    """
+    tokens = VerifiedTokens(2)
+    exp = time.time() + 60
+    tokens.set('a', {'exp': exp})
+    tokens.set('b', {'exp': exp})
+    tokens.get('a')
+    tokens.set('c', {'exp': exp})
+
+    assert tokens.get('a') is not None
+    assert tokens.get('b') is None
+    assert tokens.get('c') is not None
+    # Tokens without an expiration are never kept
+    tokens.set('d', {})
+    assert tokens.get('d') is None
+
+    mocker.patch('coordinator.middleware.time.time', return_value=exp)
+    assert tokens.get('c') is None
+
+
+def test_user_cache(db, token, auth_request, auth0_keys):
+    """
+    Test that a returning user is only looked up and has their last login
+    saved once for many requests
+    """
+    request = auth_request(token())
+    user = Auth0AuthenticationMiddleware.get_jwt_user(request)
+    assert user.pk is not None
+    last_login = user.last_login
+
+    with CaptureQueriesContext(connection) as queries:
+        for _ in range(3):
+            user = Auth0AuthenticationMiddleware.get_jwt_user(request)
+    assert len(queries) == 0
+    assert user.last_login == last_login
+
+
+def test_new_user_in_background(db, token, auth_request, auth0_keys,
+                                sync_user_jobs):
+    """
+    Test that a new user is served without waiting on their profile and only
+    has one job queued to create them
+    """
+    sync_user_jobs.enqueue.side_effect = None
+    sync_user_jobs.enqueue.return_value = Mock(result=None)
+    request = auth_request(token(roles=['ADMIN']))
+
+    for _ in range(3):
+        user = Auth0AuthenticationMiddleware.get_jwt_user(request)
+        assert user.pk is None
+        assert user.auth_roles == ['ADMIN']
+
+    assert sync_user_jobs.enqueue.call_count == 1
+    assert User.objects.count() == 0
+    # Only the user's sub is queued, never their token or any Auth0 data
+    args = sync_user_jobs.enqueue.call_args[0]
+    assert args[1:] == (jwt.decode(request.META['HTTP_AUTHORIZATION'][7:],
+                                   verify=False)['sub'],)
+
+
+def test_new_user_profile(db, token, auth_request, auth0_keys,
+                          auth0_profile_mock):
+    """ Test that a new user's profile is fetched in the job by their sub """
+    auth0_profile_mock.reset_mock()
+    request = auth_request(token())
+
+    user = Auth0AuthenticationMiddleware.get_jwt_user(request)
+
+    sub = jwt.decode(request.META['HTTP_AUTHORIZATION'][7:],
+                     verify=False)['sub']
+    auth0_profile_mock.assert_called_once_with(sub)
+    assert user.sub == sub
+    assert user.email == 'bobbytables@example.com'
+
+
+@pytest.mark.parametrize('error', ['timeout', 'status', 'json'])
+def test_get_profile_errors(mocker, error):
+    """ Test that any problem getting a profile from Auth0 gives None """
+    mocker.patch('coordinator.authentication.management_token.get',
+                 return_value='abc')
+    get = mocker.patch('coordinator.authentication.requests.get')
+    resp = get.return_value
+    resp.json.return_value = {'email': 'bobbytables@example.com'}
+
+    assert get_profile('google-oauth2|123') == resp.json.return_value
+    assert get.call_args[0][0].endswith('/api/v2/users/google-oauth2%7C123')
+    assert get.call_args[1]['headers'] == {'Authorization': 'Bearer abc'}
+
+    if error == 'timeout':
+        get.side_effect = requests.exceptions.Timeout()
+    elif error == 'status':
+        resp.raise_for_status.side_effect = requests.exceptions.HTTPError()
+    else:
+        resp.json.side_effect = ValueError()
+    assert get_profile('google-oauth2|123') is None
+
+
+def test_deleted_user_uncached(db, token, auth_request, auth0_keys):
+    """ Test that a deleted user is no longer served from the cache """
+    request = auth_request(token())
+    user = Auth0AuthenticationMiddleware.get_jwt_user(request)
+    assert user.pk is not None
+
+    user.delete()
+    assert cache.get(User.cache_key(user.sub)) is None
+
+
+def test_service_token_cache(auth0_service_mock):
+    """
+    Test that the service token is only fetched from Auth0 once and is shared
+    with other processes through the cache
+    """
+    token = jwt.encode({'exp': time.time() + 3600}, 'secret').decode('utf-8')
+    auth0_service_mock.reset_mock()
+    auth0_service_mock.return_value = token
+
+    holder = ServiceToken()
+    for _ in range(5):
+        assert holder.get() == token
+    assert ServiceToken().get() == token
+    assert auth0_service_mock.call_count == 1
+
+
+def test_service_token_refresh(auth0_service_mock, service_token):
+    """
+    Test that a token close to expiring is still used while a new one is
+    fetched in the background
+    """
+    old = jwt.encode({'exp': time.time() + 60}, 'secret').decode('utf-8')
+    new = jwt.encode({'exp': time.time() + 3600}, 'secret').decode('utf-8')
+    auth0_service_mock.reset_mock()
+    auth0_service_mock.side_effect = [old, new]
+
+    holder = ServiceToken()
+    try:
+        assert holder.get() == old
+        assert holder.get() == old
+        # Wait for the refresh to finish
+        with holder._lock:
+            pass
+        assert holder.get() == new
+        assert auth0_service_mock.call_count == 2
+    finally:
+        auth0_service_mock.side_effect = None
+        auth0_service_mock.return_value = service_token
@@ -0,0 +1,39 @@
+import os
+import django_rq
+from coordinator import client
+from coordinator.worker import Worker
+
+
+def test_shared_session(settings):
+    """ Test that the same pooled session is used for every request """
+    session = client.session()
+    assert client.session() is session
+
+    adapter = session.get_adapter('http://ts.com')
+    assert adapter is session.get_adapter('https://ts.com')
+    assert adapter._pool_maxsize == settings.REQUESTS_POOL_MAXSIZE
+    assert adapter.max_retries.total == settings.REQUESTS_RETRIES
+
+
+def test_session_not_shared_after_fork():
+    """ Test that a forked process does not reuse the parent's session """
+    session = client.session()
+    pid = os.fork()
+    if pid == 0:
+        # Exit without running any of pytest's cleanup in the child
+        os._exit(0 if client.session() is not session else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+
+
+def test_worker_runs_jobs_in_process(transactional_db):
+    """
+    Check that the worker runs jobs in its own process so that the session
+    outlives each job
+    """
+    queue = django_rq.get_queue()
+    queue.empty()
+    job = queue.enqueue(os.getpid)
+    Worker([queue], connection=queue.connection).work(burst=True)
+
+    assert job.result == os.getpid()
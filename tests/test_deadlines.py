@@ -0,0 +1,111 @@
+import pytest
+from datetime import timedelta
+from django.utils import timezone
+from coordinator import deadlines
+from coordinator.api.models import Release, Task, Event
+from coordinator.tasks import reap_timeouts, cancel_release
+
+
+@pytest.fixture
+def index(db):
+    """ Start from an empty deadline index """
+    conn = deadlines._connection()
+    conn.delete(deadlines.TASKS, deadlines.RELEASES)
+    yield conn
+    conn.delete(deadlines.TASKS, deadlines.RELEASES)
+
+
+def test_transitions(index, task, settings):
+    """ Check that tasks are only indexed while they can time out """
+    task = Task.objects.get(kf_id=task['kf_id'])
+    task.state = 'initialized'
+    task.start()
+    task.save()
+
+    deadline = index.zscore(deadlines.TASKS, task.kf_id)
+    expected = task.last_activity_at.timestamp() + settings.TASK_TIMEOUT
+    assert deadline == pytest.approx(expected)
+
+    # New activity pushes the deadline back
+    ev = Event(task=task, release=task.release, message='test')
+    ev.save()
+    assert index.zscore(deadlines.TASKS, task.kf_id) > deadline
+
+    task.stage()
+    task.save()
+    assert index.zscore(deadlines.TASKS, task.kf_id) is None
+
+
+def test_reap_timeouts(index, task, settings, mocker):
+    """ Check that only expired tasks and releases are timed out """
+    mock_rq = mocker.patch('coordinator.api.models.release.django_rq')
+    release = Release.objects.first()
+    release.state = 'running'
+    release.save()
+    task = Task.objects.get(kf_id=task['kf_id'])
+    task.state = 'initialized'
+    task.start()
+    task.save()
+
+    reap_timeouts()
+    assert mock_rq.enqueue.call_count == 0
+    assert index.zscore(deadlines.TASKS, task.kf_id) is not None
+
+    # Expire the task
+    past = timezone.now() - timedelta(seconds=settings.TASK_TIMEOUT + 1)
+    Task.objects.filter(kf_id=task.kf_id).update(last_activity_at=past)
+    task.refresh_from_db()
+    deadlines.update(task)
+
+    reap_timeouts()
+    mock_rq.enqueue.assert_called_once_with(cancel_release, release.kf_id)
+    assert Release.objects.get(kf_id=release.kf_id).state == 'canceling'
+    assert index.zscore(deadlines.TASKS, task.kf_id) is None
+
+
+def test_reap_moved_deadline(index, task, settings, mocker):
+    """ Check that a deadline that moved since it was indexed is kept """
+    mock_rq = mocker.patch('coordinator.api.models.release.django_rq')
+    task = Task.objects.get(kf_id=task['kf_id'])
+    task.state = 'initialized'
+    task.start()
+    task.save()
+    index.zadd(deadlines.TASKS, {task.kf_id: 0})
+
+    reap_timeouts()
+    assert mock_rq.enqueue.call_count == 0
+    assert index.zscore(deadlines.TASKS, task.kf_id) > 0
+
+
+def test_rebuild(index, task):
+    """ Check that the index can be rebuilt from the database """
+    Task.objects.filter(kf_id=task['kf_id']).update(state='running')
+    deadlines.rebuild()
+    assert index.zscore(deadlines.TASKS, task['kf_id']) is not None
+
+
+def test_reap_failure_kept(index, task, settings, mocker):
+    """ Check that entries that couldn't be handled stay in the index """
+    mocker.patch('coordinator.api.models.release.django_rq')
+    release = Release.objects.first()
+    release.state = 'running'
+    release.save()
+    first = Task.objects.get(kf_id=task['kf_id'])
+    tasks = [first, Task(release=release, task_service=first.task_service)]
+    past = timezone.now() - timedelta(seconds=settings.TASK_TIMEOUT + 1)
+    for t in tasks:
+        t.state = 'running'
+        t.save()
+        Task.objects.filter(kf_id=t.kf_id).update(last_activity_at=past)
+        t.refresh_from_db()
+        deadlines.update(t)
+
+    time_out = mocker.patch.object(Release, 'time_out',
+                                   side_effect=[Exception('oops'), None])
+    reap_timeouts()
+
+    assert time_out.call_count == 2
+    failed = time_out.call_args_list[0][0][0].split()[1]
+    handled = time_out.call_args_list[1][0][0].split()[1]
+    assert index.zscore(deadlines.TASKS, failed) is not None
+    assert index.zscore(deadlines.TASKS, handled) is None
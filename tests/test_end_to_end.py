@@ -16,13 +16,13 @@ def test_full_release(client, admin_client, dev_client, transactional_db,
     2) Create release
     """
 
-    mock_task_requests = mocker.patch('coordinator.tasks.requests')
+    mock_task_requests = mocker.patch('coordinator.tasks.client')
     mock_task_action = mock.Mock()
     mock_task_action.status_code = 200
     mock_task_action.json.return_value = {'state': 'running'}
     mock_task_requests.post.return_value = mock_task_action
 
-    mock_service_requests = mocker.patch('coordinator.api.validators.requests')
+    mock_service_requests = mocker.patch('coordinator.api.validators.client')
     mock_service_resp = mock.Mock()
     mock_service_resp.status_code = 200
     mock_service_resp.content = str.encode('{"name": "test"}')
@@ -45,7 +45,7 @@ def test_full_release(client, admin_client, dev_client, transactional_db,
     resp = client.get('http://testserver/releases')
     assert resp.status_code == 200
 
-    mock_requests = mocker.patch('coordinator.api.models.taskservice.requests')
+    mock_requests = mocker.patch('coordinator.api.models.taskservice.client')
     mock_resp = mock.Mock()
     mock_resp.status_code = 200
     mock_requests.get.return_value = mock_resp
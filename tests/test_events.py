@@ -1,5 +1,7 @@
 import pytest
 from mock import Mock, patch
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from coordinator.api.models import Release, Task, TaskService, Event
 
 from coordinator.api.factories.event import EventFactory
@@ -118,3 +120,79 @@ def test_fail_event(client, db, task, worker):
     assert event.event_type == 'error'
     assert ('task {} changed from pending to failed'
             .format(task['kf_id']) in event.message)
+
+
+def test_cursor_pagination(client, db):
+    """
+    Test that events can be paged through with a cursor, newest first,
+    without any being skipped or repeated
+    """
+    release = Release(name='test')
+    release.save()
+    for i in range(25):
+        Event(message=f'event {i}', release=release).save()
+    expected = list(Event.objects.order_by('-created_at', '-kf_id')
+                                 .values_list('kf_id', flat=True))
+
+    seen = []
+    url = BASE_URL + '/events?cursor=&limit=10'
+    while url:
+        resp = client.get(url)
+        assert resp.status_code == 200
+        page = resp.json()
+        assert 'count' not in page
+        seen.extend(e['kf_id'] for e in page['results'])
+        url = page['next']
+    assert seen == expected
+
+    # Filters still apply
+    resp = client.get(BASE_URL + f'/events?cursor=&release={release.kf_id}')
+    assert len(resp.json()['results']) == 10
+
+    resp = client.get(BASE_URL + '/events?cursor=abc')
+    assert resp.status_code == 404
+
+    # Offsets are still used without a cursor
+    resp = client.get(BASE_URL + '/events?limit=10&offset=20')
+    assert resp.json()['count'] == 25
+    assert [e['kf_id'] for e in resp.json()['results']] == expected[20:]
+
+
+def test_approximate_count(client, db, settings):
+    """
+    Test that long lists are counted from the planner's estimate unless an
+    exact count is asked for
+    """
+    settings.APPROXIMATE_COUNT_THRESHOLD = 10
+    release = Release(name='test')
+    release.save()
+    for i in range(25):
+        Event(message=f'event {i}', release=release).save()
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE api_event')
+
+    with CaptureQueriesContext(connection) as ctx:
+        resp = client.get(BASE_URL + '/events?limit=10')
+    assert not any('COUNT(' in q['sql'] for q in ctx.captured_queries)
+    # The page is only fetched once
+    pages = [q for q in ctx.captured_queries
+             if q['sql'].startswith('SELECT') and 'LIMIT' in q['sql']]
+    assert len(pages) == 1
+    assert resp.json()['count'] > 10
+    assert len(resp.json()['results']) == 10
+    assert resp.json()['next']
+
+    # The count is exact once the last page is reached
+    resp = client.get(BASE_URL + '/events?limit=10&offset=20')
+    assert resp.json()['count'] == 25
+    assert len(resp.json()['results']) == 5
+    assert resp.json()['next'] is None
+
+    with CaptureQueriesContext(connection) as ctx:
+        resp = client.get(BASE_URL + '/events?limit=10&exact_count=true')
+    assert any('COUNT(' in q['sql'] for q in ctx.captured_queries)
+    assert resp.json()['count'] == 25
+
+    # Small tables are always counted
+    resp = client.get(BASE_URL + '/releases?limit=10')
+    assert resp.json()['count'] == 1
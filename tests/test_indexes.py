@@ -0,0 +1,47 @@
+import pytest
+from django.db import connection
+from coordinator.api.models import Release, Task, TaskService, Event, \
+    ReleaseNote
+
+
+def queries():
+    """ The hot queries and the index each should use """
+    return [
+        (Task.objects.filter(state__in=['running', 'publishing']),
+         'task_active_state'),
+        (Task.objects.order_by('-created_at'), 'task_created_at'),
+        (Release.objects.filter(state__in=['initializing', 'running',
+                                           'publishing', 'canceling']),
+         'release_active_state'),
+        (Release.objects.order_by('-created_at'), 'release_created_at'),
+        (Release.objects.filter(state='published').order_by('-created_at'),
+         'release_state_created_at'),
+        (Event.objects.order_by('-created_at', '-kf_id'),
+         'event_created_at_kf_id'),
+        (Event.objects.filter(release='RE_00000000').order_by('-created_at'),
+         'event_release_created_at'),
+        (Event.objects.filter(task='TA_00000000').order_by('-created_at'),
+         'event_task_created_at'),
+        (Event.objects.filter(task_service='TS_00000000')
+                      .order_by('-created_at'),
+         'event_service_created_at'),
+        (ReleaseNote.objects.order_by('-created_at'),
+         'releasenote_created_at'),
+        (TaskService.objects.order_by('-created_at'),
+         'taskservice_created_at'),
+    ]
+
+
+@pytest.mark.parametrize('index', range(len(queries())))
+def test_hot_query_uses_index(db, index):
+    """
+    Test that each hot query can be answered from its index rather than by
+    scanning the whole table
+    """
+    queryset, name = queries()[index]
+    with connection.cursor() as cursor:
+        # Make any sequential scan show up, even on the empty test tables
+        cursor.execute('SET LOCAL enable_seqscan = off')
+    plan = queryset.explain()
+    assert 'Seq Scan' not in plan
+    assert name in plan
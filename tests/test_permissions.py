@@ -222,7 +222,7 @@ def test_study_permissions(
 def test_task_service_permissions(
     mocker, test_client, user_type, endpoint, method, status_code
 ):
-    mock_requests = mocker.patch("coordinator.api.validators.requests")
+    mock_requests = mocker.patch("coordinator.api.validators.client")
     mock_resp = Mock()
     mock_resp.content = str.encode('{"name": "test"}')
     mock_resp.status_code = 200
@@ -262,7 +262,7 @@ def test_task_service_permissions(
 def test_status_permissions(
     mocker, test_client, user_type, endpoint, method, status_code
 ):
-    mock_requests = mocker.patch("coordinator.api.validators.requests")
+    mock_requests = mocker.patch("coordinator.api.validators.client")
     mock_resp = Mock()
     mock_resp.content = str.encode('{"name": "test"}')
     mock_resp.status_code = 200
@@ -1,6 +1,6 @@
 import json
 import pytest
-from coordinator.api.models import Release, Event
+from coordinator.api.models import Release, Event, Task, TaskService
 from coordinator.api.models.release import next_version
 
 
@@ -268,3 +268,100 @@ def test_release_relations(client, transactional_db, task):
     assert len(res['tasks']) == 1
     assert 'kf_id' in res['tasks'][0]
     assert res['tasks'][0]['progress'] == 0
+
+
+def test_task_counts(client, db, release, task_service):
+    """ Test that releases count their tasks in each state """
+    release = Release.objects.get(kf_id=release['kf_id'])
+    service = TaskService.objects.get(kf_id=task_service['kf_id'])
+    tasks = [Task(release=release, task_service=service) for _ in range(3)]
+    for task in tasks:
+        task.save()
+
+    release.refresh_from_db()
+    assert release.task_count == 3
+    assert release.task_counts['waiting'] == 3
+    assert not release.all_tasks('initialized')
+
+    for task in tasks:
+        task.initialize()
+        task.save()
+    # Saving the release must not overwrite the counts
+    release.save()
+
+    release.refresh_from_db()
+    assert release.all_tasks('initialized')
+    resp = client.get(f'http://testserver/releases/{release.kf_id}')
+    counts = resp.json()['task_counts']
+    assert counts['initialized'] == 3
+    assert counts['waiting'] == 0
+
+    tasks[0].delete()
+    release.refresh_from_db()
+    assert release.task_count == 2
+    assert release.task_counts['initialized'] == 2
+
+
+def test_advance_once(transactional_db, release, task_service):
+    """ Test that a release is advanced once when its tasks report at once """
+    from concurrent.futures import ThreadPoolExecutor
+    from django.db import connection
+
+    release = Release.objects.get(kf_id=release['kf_id'])
+    Release.objects.filter(kf_id=release.kf_id).update(state='running')
+    service = TaskService.objects.get(kf_id=task_service['kf_id'])
+    tasks = [Task(release=release, task_service=service, state='running')
+             for _ in range(4)]
+    for task in tasks:
+        task.save()
+
+    def stage(task):
+        try:
+            task.stage()
+            task.save()
+            return Release.advance(release.kf_id)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(stage, tasks))
+
+    assert results.count('staged') == 1
+    assert results.count(None) == 3
+    assert Release.objects.get(kf_id=release.kf_id).state == 'staged'
+
+
+def test_release_list_queries(client, db, studies, task_service):
+    """
+    Test that listing releases takes the same number of queries no matter
+    how many releases, tasks, and notes there are
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from coordinator.api.models import ReleaseNote
+    service = TaskService.objects.get(kf_id=task_service['kf_id'])
+    for study in studies.values():
+        release = Release(name='test')
+        release.save()
+        release.studies.set(studies.values())
+        for _ in range(3):
+            Task(release=release, task_service=service).save()
+        ReleaseNote(release=release, study=study, description='ipsum').save()
+
+    for url in ['/releases', '/studies/SD_00000000/releases']:
+        # Table sizes for the count are cached after the first request
+        client.get(f'http://testserver{url}?limit=1')
+        with CaptureQueriesContext(connection) as queries:
+            resp = client.get(f'http://testserver{url}?limit=1')
+        assert len(resp.json()['results']) == 1
+        expected = len(queries)
+
+        with CaptureQueriesContext(connection) as queries:
+            resp = client.get(f'http://testserver{url}')
+        results = resp.json()['results']
+        assert len(results) == 5
+        assert all(len(r['tasks']) == 3 for r in results)
+        assert all(r['tasks'][0]['service_name'] == 'test service'
+                   for r in results)
+        assert all(len(r['notes']) == 1 for r in results)
+        assert len(queries) == expected
@@ -0,0 +1,79 @@
+import pytest
+from coordinator import response_cache
+from coordinator.api.models import ReleaseNote
+from coordinator.api.factories.release import ReleaseFactory
+from coordinator.api.factories.study import StudyFactory
+
+
+BASE_URL = 'http://testserver'
+ALL_RELEASES = '{ allReleases { edges { node { kfId } } } }'
+
+
+def test_rest_cache(client, admin_client, db):
+    """
+    Test that anonymous reads of published releases are cached until the
+    generation is bumped
+    """
+    ReleaseFactory(state='published')
+    url = BASE_URL + '/releases?state=published'
+    assert client.get(url).json()['count'] == 1
+
+    ReleaseFactory(state='published')
+    assert client.get(url).json()['count'] == 1
+    # Users are never served from the cache
+    assert admin_client.get(url).json()['count'] == 2
+    # Other filters are never cached
+    resp = client.get(BASE_URL + '/releases?state=staged')
+    assert resp.json()['count'] == 0
+
+    response_cache.bump()
+    assert client.get(url).json()['count'] == 2
+
+
+def test_graphql_cache(client, db):
+    """
+    Test that anonymous queries for published data are cached until the
+    generation is bumped
+    """
+    ReleaseFactory(state='published')
+
+    def count():
+        resp = client.post('/graphql', data={'query': ALL_RELEASES})
+        return len(resp.json()['data']['allReleases']['edges'])
+
+    assert count() == 1
+    ReleaseFactory(state='published')
+    assert count() == 1
+    response_cache.bump()
+    assert count() == 2
+
+
+def test_graphql_not_cacheable(client, db):
+    """ Test that queries for anything other than the lists aren't cached """
+    query = '{ allReleases { edges { node { kfId } } } status { name } }'
+    ReleaseFactory(state='published')
+    resp = client.post('/graphql', data={'query': query})
+    assert len(resp.json()['data']['allReleases']['edges']) == 1
+
+    ReleaseFactory(state='published')
+    resp = client.post('/graphql', data={'query': query})
+    assert len(resp.json()['data']['allReleases']['edges']) == 2
+
+
+def test_invalidated(transactional_db):
+    """
+    Test that publishing a release and editing notes invalidate the cache
+    """
+    release = ReleaseFactory(state='publishing')
+    generation = response_cache.generation()
+
+    release.complete()
+    release.save()
+    assert response_cache.generation() == generation + 1
+
+    note = ReleaseNote(release=release, study=StudyFactory(),
+                       description='ipsum')
+    note.save()
+    assert response_cache.generation() == generation + 2
+    note.delete()
+    assert response_cache.generation() == generation + 3
@@ -0,0 +1,90 @@
+from mock import Mock
+from django.core.cache import cache
+from coordinator import scheduler
+from coordinator.api.models import Release, Task, TaskService, Event
+
+
+def test_backoff(db, task, settings):
+    """ Check that tasks are polled less often while they don't change """
+    settings.STATUS_CHECK_MIN_INTERVAL = 10
+    settings.STATUS_CHECK_MAX_INTERVAL = 30
+    task = Task.objects.get(kf_id=task['kf_id'])
+
+    # New tasks are always due
+    assert scheduler.due([task], now=0) == [task]
+
+    intervals = []
+    now = 0
+    for _ in range(4):
+        scheduler.reschedule([task], set(), now=now)
+        interval = cache.get(f'STATUS_CHECK_{task.kf_id}')['interval']
+        intervals.append(interval)
+        assert scheduler.due([task], now=now + interval - 1) == []
+        assert scheduler.due([task], now=now + interval) == [task]
+        now += interval
+    assert intervals == [10, 20, 30, 30]
+
+    # A change brings the task back to the minimum interval
+    scheduler.reschedule([task], {task.kf_id}, now=now)
+    assert cache.get(f'STATUS_CHECK_{task.kf_id}')['interval'] == 10
+
+
+def test_transition_resets(db, task):
+    """ Check that a task transition makes it due immediately """
+    task = Task.objects.get(kf_id=task['kf_id'])
+    scheduler.reschedule([task], set())
+    assert scheduler.due([task]) == []
+
+    task.failed()
+    assert scheduler.due([task]) == [task]
+
+
+def test_sweep_only_due(db, task, mocker):
+    """ Check that a sweep only polls tasks that are due unless forced """
+    from coordinator.tasks import status_sweep
+
+    release = Release.objects.first()
+    service = TaskService.objects.first()
+    tasks = [Task(release=release, task_service=service, state='running')
+             for _ in range(2)]
+    Task.objects.bulk_create(tasks)
+    Event.objects.bulk_create([Event(task=t, release=release)
+                               for t in tasks])
+    scheduler.reschedule(tasks[:1], set())
+
+    mock_client = mocker.patch('coordinator.tasks.client')
+    mock_resp = Mock()
+    mock_resp.json.return_value = {'state': 'running', 'progress': 0}
+    mock_client.post.return_value = mock_resp
+
+    status_sweep()
+    assert mock_client.post.call_count == 1
+
+    status_sweep(force=True)
+    assert mock_client.post.call_count == 3
+
+
+def test_tick(mocker):
+    """ Check that each sweep is only enqueued once per interval """
+    mock_rq = mocker.patch('django_rq.enqueue')
+    cache.clear()
+
+    assert set(scheduler.tick()) == {
+        'status_sweep', 'release_status_sweep', 'health_sweep',
+        'publish_events', 'reap_timeouts', 'sync_studies'
+    }
+    assert mock_rq.call_count == 6
+
+    assert scheduler.tick() == []
+    assert mock_rq.call_count == 6
+
+
+def test_status_checks_not_forced(client, db, mocker):
+    """ Check that the status_checks endpoint doesn't skip the backoff """
+    from coordinator.tasks import status_sweep
+
+    mock_rq = mocker.patch('coordinator.api.views.task.django_rq')
+    resp = client.post('http://testserver/tasks/status_checks')
+
+    assert resp.status_code == 200
+    mock_rq.enqueue.assert_called_once_with(status_sweep)
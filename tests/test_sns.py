@@ -1,25 +1,45 @@
-import boto3
 import json
 import pytest
-from mock import Mock, patch
-from django.conf import settings
-from coordinator.api.models import Release, Task, TaskService, Event
+from botocore.exceptions import ClientError
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+from coordinator.api.models import Event, OutboxMessage
+from coordinator.tasks import publish_events
 
 
 BASE_URL = 'http://testserver'
+ARN = 'arn:aws:sns:us-east-1:538745987955:kf-coord-api-us-east-1-dev'
 
 
-def test_new_general_event(client, transactional_db, mocker):
+@pytest.fixture
+def sns(settings, mocker):
+    """ Mock the SNS client and queue """
+    settings.SNS_ARN = ARN
+    cache.delete('PUBLISH_EVENTS_QUEUED')
+    mock_rq = mocker.patch('coordinator.api.models.django_rq')
+    mock_client = mocker.patch('coordinator.sns.client')
+    mock_client().publish_batch.return_value = {'Successful': [],
+                                                'Failed': []}
+    return mock_client(), mock_rq
+
+
+def test_new_general_event(client, transactional_db, sns):
     """ Test that createing a new event publishes to sns """
-    arn = 'arn:aws:sns:us-east-1:538745987955:kf-coord-api-us-east-1-dev'
-    settings.SNS_ARN = arn
-    mock = mocker.patch('coordinator.api.models.boto3.client')
+    mock_sns, mock_rq = sns
     assert Event.objects.count() == 0
 
     ev = Event(event_type='error', message='test error event')
     ev.save()
     assert Event.objects.count() == 1
-    assert mock().publish.call_count == 1
+    # The event is only published in the background
+    assert OutboxMessage.objects.count() == 1
+    assert mock_sns.publish_batch.call_count == 0
+    mock_rq.enqueue.assert_called_once_with(publish_events)
+
+    publish_events()
+
+    assert mock_sns.publish_batch.call_count == 1
     message = {
         'default': json.dumps({
             'event_type': 'error',
@@ -29,20 +49,110 @@ def test_new_general_event(client, transactional_db, mocker):
             'release': None
         })
     }
-    arn = 'arn:aws:sns:us-east-1:538745987955:kf-coord-api-us-east-1-dev'
-    mock().publish.assert_called_with(Message=json.dumps(message),
-                                      MessageStructure='json',
-                                      TopicArn=arn)
-    settings.SNS_ARN = None
+    kwargs = mock_sns.publish_batch.call_args[1]
+    assert kwargs['TopicArn'] == ARN
+    entry = kwargs['PublishBatchRequestEntries'][0]
+    assert entry['Message'] == json.dumps(message)
+    assert entry['MessageStructure'] == 'json'
+    assert OutboxMessage.objects.count() == 0
 
 
-def test_no_arn(client, transactional_db, mocker):
+def test_no_arn(client, transactional_db, sns, settings):
     """ Test that no message is sent if there is no setting present """
-    mock = mocker.patch('coordinator.api.models.boto3.client')
+    mock_sns, mock_rq = sns
+    settings.SNS_ARN = None
     assert Event.objects.count() == 0
 
     ev = Event(event_type='error', message='test error event')
     ev.save()
+    publish_events()
+
+    assert Event.objects.count() == 1
+    assert OutboxMessage.objects.count() == 0
+    assert mock_rq.enqueue.call_count == 0
+    assert mock_sns.publish_batch.call_count == 0
+
+
+def test_batch_publish(client, transactional_db, sns):
+    """ Test that messages are published in batches """
+    mock_sns, mock_rq = sns
+
+    for i in range(25):
+        Event(event_type='info', message=f'event {i}').save()
+    # Only one job should be waiting to publish at once
+    assert mock_rq.enqueue.call_count == 1
+
+    first = OutboxMessage.objects.order_by('id').first()
+    mock_sns.publish_batch.return_value = {
+        'Successful': [],
+        'Failed': [{'Id': str(first.id), 'Code': 'InternalError'}]
+    }
+    publish_events()
+
+    assert mock_sns.publish_batch.call_count == 3
+    sizes = [len(c[1]['PublishBatchRequestEntries'])
+             for c in mock_sns.publish_batch.call_args_list]
+    assert sizes == [10, 10, 5]
+    # Messages that SNS did not accept are left to retry
+    assert OutboxMessage.objects.count() == 1
+    assert OutboxMessage.objects.get().attempts == 1
+
+
+def test_sns_unavailable(client, transactional_db, sns):
+    """ Test that events are kept in the outbox while SNS is unavailable """
+    mock_sns, mock_rq = sns
+    error = ClientError({'Error': {'Code': 'InternalError'}}, 'PublishBatch')
+    mock_sns.publish_batch.side_effect = error
+
+    ev = Event(event_type='error', message='test error event')
+    ev.save()
+    publish_events()
+
+    assert Event.objects.count() == 1
+    assert OutboxMessage.objects.get().attempts == 1
+
+    mock_sns.publish_batch.side_effect = None
+    publish_events()
+    assert OutboxMessage.objects.count() == 0
+
+
+def test_claimed_before_publish(client, transactional_db, sns):
+    """ Test that a batch is claimed and committed before SNS is called """
+    mock_sns, mock_rq = sns
+
+    def publish_batch(**kwargs):
+        assert not connection.in_atomic_block
+        message = OutboxMessage.objects.get()
+        assert message.attempts == 1
+        assert message.claimed_until > timezone.now()
+        # Another publisher should skip the claimed message
+        with transaction.atomic():
+            publish_events()
+        return {'Successful': [], 'Failed': []}
+
+    mock_sns.publish_batch.side_effect = publish_batch
+
+    Event(event_type='error', message='test error event').save()
+    publish_events()
+
+    assert mock_sns.publish_batch.call_count == 1
+    assert OutboxMessage.objects.count() == 0
+
+
+def test_max_attempts(client, transactional_db, sns, settings):
+    """ Test that messages are dropped after too many attempts """
+    mock_sns, mock_rq = sns
+    settings.OUTBOX_MAX_ATTEMPTS = 2
+    error = ClientError({'Error': {'Code': 'InternalError'}}, 'PublishBatch')
+    mock_sns.publish_batch.side_effect = error
+
+    Event(event_type='error', message='test error event').save()
+    publish_events()
+    publish_events()
+    assert mock_sns.publish_batch.call_count == 2
+    assert OutboxMessage.objects.get().attempts == 2
 
+    publish_events()
+    assert mock_sns.publish_batch.call_count == 2
+    assert OutboxMessage.objects.count() == 0
     assert Event.objects.count() == 1
-    assert mock().publish.call_count == 0
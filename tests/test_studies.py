@@ -2,6 +2,9 @@ import pytest
 from datetime import datetime, timezone
 from requests.exceptions import ConnectionError, HTTPError
 from mock import Mock, patch
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from coordinator.api.models import Release, Study
 from coordinator.api.serializers import StudySerializer
 
@@ -58,87 +61,92 @@ def test_nested_releases(admin_client, transactional_db, release, studies):
     assert resp.json()['results'][-1]['kf_id'] == release['kf_id']
 
 
-def test_sync_studies_fail(client, db):
+def test_sync_studies_fail(admin_client, db, sync_study_jobs):
     """ Test that dataservice errors are returned when there is a problem  """
-    with patch('coordinator.dataservice.requests') as mock_requests:
-        mock_resp = Mock()
+    with patch('coordinator.dataservice.client') as mock_client:
+        mock_resp = Mock(headers={})
         mock_resp.json.return_value = {'message': 'server error'}
         mock_resp.status_code = 500
         mock_resp.raise_for_status.side_effect = HTTPError(response=mock_resp)
-        mock_requests.get.return_value = mock_resp
+        mock_client.get.return_value = mock_resp
 
-        resp = client.post(BASE_URL+'/studies/sync')
-        assert resp.status_code == 500
+        resp = admin_client.post(BASE_URL+'/studies/sync')
+        assert resp.status_code == 202
         res = resp.json()
+        assert res['status'] == 'error'
         assert "error getting studies from the dataservice" in res["message"]
+        assert admin_client.get(BASE_URL+'/studies/sync').json() == res
 
-        assert mock_requests.get.call_count == 1
+        assert mock_client.get.call_count == 1
         expected = 'http://dataservice/studies?limit=100'
-        mock_requests.get.assert_called_with(expected)
+        mock_client.get.assert_called_with(
+            expected, timeout=settings.REQUEST_TIMEOUT)
 
         mock_resp.json.return_value = {'<html>Server error</html>'}
-        mock_requests.get.return_value = mock_resp
-        mock_requests.get.return_value.status_code = 500
+        mock_client.get.return_value = mock_resp
+        mock_client.get.return_value.status_code = 500
 
-        resp = client.post(BASE_URL+'/studies/sync')
-        assert resp.status_code == 500
+        resp = admin_client.post(BASE_URL+'/studies/sync')
+        assert resp.status_code == 202
         res = resp.json()
-        assert res['message'].endswith('getting studies from the dataservice')
+        assert res['status'] == 'error'
+        assert 'getting studies from the dataservice' in res['message']
 
-        assert mock_requests.get.call_count == 2
+        assert mock_client.get.call_count == 2
         expected = 'http://dataservice/studies?limit=100'
-        mock_requests.get.assert_called_with(expected)
+        mock_client.get.assert_called_with(
+            expected, timeout=settings.REQUEST_TIMEOUT)
 
 
-def test_sync_studies_updated(client, db, studies):
+def test_sync_studies_updated(admin_client, db, studies, sync_study_jobs):
     """ Test that fields are updated on change in dataservice """
-    with patch('coordinator.dataservice.requests') as mock_requests:
-        mock_resp = Mock()
+    with patch('coordinator.dataservice.client') as mock_client:
+        mock_resp = Mock(headers={})
         mock_resp.json.return_value = {
             'results': [StudySerializer(v).data for v in studies.values()]
         }
         mock_resp.json.return_value['results'][-1]['name'] = 'Updated Name'
-        mock_requests.get.return_value = mock_resp
-        mock_requests.get.return_value.status_code = 200
+        mock_client.get.return_value = mock_resp
+        mock_client.get.return_value.status_code = 200
 
         assert Study.objects.count() == 5
 
-        resp = client.post(BASE_URL+'/studies/sync')
-        assert resp.status_code == 200
-        res = resp.json()
+        resp = admin_client.post(BASE_URL+'/studies/sync')
+        assert resp.status_code == 202
+        assert resp.json()['status'] == 'ok'
 
-        assert mock_requests.get.call_count == 1
+        assert mock_client.get.call_count == 1
         expected = 'http://dataservice/studies?limit=100'
-        mock_requests.get.assert_called_with(expected)
+        mock_client.get.assert_called_with(
+            expected, timeout=settings.REQUEST_TIMEOUT)
 
         assert Study.objects.count() == 5
         assert Study.objects.get(kf_id='SD_00000004').name == 'Updated Name'
 
 
-def test_sync_studies_deleted(client, db, studies):
+def test_sync_studies_deleted(admin_client, db, studies, sync_study_jobs):
     """ Test that studies are set as deleted when removed from dataservice """
-    with patch('coordinator.dataservice.requests') as mock_requests:
-        mock_resp = Mock()
+    with patch('coordinator.dataservice.client') as mock_client:
+        mock_resp = Mock(headers={})
         mock_resp.json.return_value = {
             'results': [StudySerializer(v).data for v in studies.values()]
         }
         mock_resp.json.return_value['results'][-1]['name'] = 'Updated Name'
-        mock_requests.get.return_value = mock_resp
-        mock_requests.get.return_value.status_code = 200
+        mock_client.get.return_value = mock_resp
+        mock_client.get.return_value.status_code = 200
 
         assert Study.objects.count() == 5
 
-        resp = client.post(BASE_URL+'/studies/sync')
-        assert resp.status_code == 200
-        res = resp.json()
+        resp = admin_client.post(BASE_URL+'/studies/sync')
+        assert resp.status_code == 202
 
         # Remove a study
         mock_resp.json.return_value = {
             'results': mock_resp.json.return_value['results'][:-1]
         }
 
-        resp = client.post(BASE_URL+'/studies/sync')
-        assert resp.status_code == 200
+        resp = admin_client.post(BASE_URL+'/studies/sync')
+        assert resp.status_code == 202
         assert resp.json()['new'] == 0
         assert resp.json()['deleted'] == 1
         assert Study.objects.count() == 5
@@ -262,10 +270,34 @@ def test_last_published_fields(admin_client, db, studies, worker):
     assert resp.json()['last_pub_date'] == created_at_2
 
 
-def test_new_study(client, db, studies):
+def test_list_studies_queries(admin_client, db, studies):
+    """
+    Test that listing studies takes the same number of queries no matter
+    how many studies there are
+    """
+    resp = admin_client.post(BASE_URL+'/releases',
+                             data={'name': 'test',
+                                   'studies': ['SD_00000000', 'SD_00000001']})
+    assert resp.status_code == 201
+
+    with CaptureQueriesContext(connection) as queries:
+        resp = admin_client.get(BASE_URL+'/studies?limit=1')
+    assert len(resp.json()['results']) == 1
+    expected = len(queries)
+
+    with CaptureQueriesContext(connection) as queries:
+        resp = admin_client.get(BASE_URL+'/studies')
+    assert len(resp.json()['results']) == 5
+    assert len(queries) == expected
+    versions = {s['kf_id']: s['version'] for s in resp.json()['results']}
+    assert versions['SD_00000000'] == '0.0.0'
+    assert versions['SD_00000002'] is None
+
+
+def test_new_study(admin_client, db, studies, sync_study_jobs):
     """ Test case that a new study has been added to the dataservice """
-    with patch('coordinator.dataservice.requests') as mock_requests:
-        mock_resp = Mock()
+    with patch('coordinator.dataservice.client') as mock_client:
+        mock_resp = Mock(headers={})
         mock_resp.json.return_value = {
             'results': [StudySerializer(v).data for v in studies.values()]
         }
@@ -277,25 +309,144 @@ def test_new_study(client, db, studies):
             'created_at': datetime(year=2019, month=6, day=6,
                                    tzinfo=timezone.utc),
         })
-        mock_requests.get.return_value = mock_resp
-        mock_requests.get.return_value.status_code = 200
+        mock_client.get.return_value = mock_resp
+        mock_client.get.return_value.status_code = 200
 
         assert Study.objects.count() == 5
 
-        resp = client.post(BASE_URL+'/studies/sync')
-        assert resp.status_code == 200
+        resp = admin_client.post(BASE_URL+'/studies/sync')
+        assert resp.status_code == 202
         res = resp.json()
         assert res['new'] == 1
         assert res['deleted'] == 0
 
-        assert mock_requests.get.call_count == 1
+        assert mock_client.get.call_count == 1
         expected = 'http://dataservice/studies?limit=100'
-        mock_requests.get.assert_called_with(expected)
+        mock_client.get.assert_called_with(
+            expected, timeout=settings.REQUEST_TIMEOUT)
 
         assert Study.objects.count() == 6
         assert Study.objects.get(kf_id='SD_XXXXXXXX').name == 'New Study'
 
 
+def test_sync_studies_pages(admin_client, db, sync_study_jobs):
+    """
+    Test that every page of studies is synced with a constant number of
+    queries
+    """
+    for i in range(150):
+        Study(kf_id='SD_{0:08d}'.format(i), name=f'Study {i}').save()
+
+    def page(start, end, next_url):
+        resp = Mock(headers={})
+        resp.json.return_value = {
+            'results': [{
+                'kf_id': 'SD_{0:08d}'.format(i),
+                'name': f'Study {i}',
+                'visible': i != 3,
+                'created_at': '2019-06-06T00:00:00+00:00',
+            } for i in range(start, end)],
+            '_links': {'next': next_url},
+        }
+        return resp
+
+    first = page(0, 100, '/studies?after=1&limit=100')
+    last = page(100, 201, None)
+    # Only count the sync's queries, not those to first look up the user
+    admin_client.get(BASE_URL+'/studies/sync')
+    with patch('coordinator.dataservice.client') as mock_client:
+        mock_client.get.side_effect = [first, last]
+        with CaptureQueriesContext(connection) as ctx:
+            resp = admin_client.post(BASE_URL+'/studies/sync')
+
+    assert resp.status_code == 202
+    assert resp.json()['status'] == 'ok'
+    assert resp.json()['pages'] == 2
+    assert resp.json()['studies'] == 201
+    assert resp.json()['new'] == 51
+    assert resp.json()['deleted'] == 0
+    assert [c[0][0] for c in mock_client.get.call_args_list] == [
+        'http://dataservice/studies?limit=100',
+        'http://dataservice/studies?after=1&limit=100',
+    ]
+    assert first.json.call_count == 1
+    assert last.json.call_count == 1
+    assert len(ctx.captured_queries) < 10
+
+    assert Study.objects.count() == 201
+    assert Study.objects.filter(deleted=True).count() == 0
+    assert Study.objects.get(kf_id='SD_00000003').visible is False
+    assert Study.objects.get(kf_id='SD_00000200').name == 'Study 200'
+
+
+def test_sync_studies_unchanged(admin_client, db, studies, sync_study_jobs):
+    """
+    Test that pages are fetched with their ETag and that nothing is written
+    when none have changed
+    """
+    mock_resp = Mock(status_code=200, headers={'ETag': '"v1"'})
+    mock_resp.json.return_value = {
+        'results': [StudySerializer(v).data for v in studies.values()]
+    }
+    with patch('coordinator.dataservice.client') as mock_client:
+        mock_client.get.return_value = mock_resp
+        resp = admin_client.post(BASE_URL+'/studies/sync')
+        assert resp.json()['status'] == 'ok'
+
+        mock_client.get.return_value = Mock(status_code=304, headers={})
+        with CaptureQueriesContext(connection) as ctx:
+            resp = admin_client.post(BASE_URL+'/studies/sync')
+
+    assert resp.json()['status'] == 'ok'
+    assert resp.json()['new'] == 0
+    assert resp.json()['deleted'] == 0
+    mock_client.get.assert_called_with(
+        'http://dataservice/studies?limit=100',
+        headers={'If-None-Match': '"v1"'},
+        timeout=settings.REQUEST_TIMEOUT,
+    )
+    assert not any('api_study' in q['sql'] for q in ctx.captured_queries)
+
+
+def test_sync_status(admin_client, db, mocker):
+    """ Test that a sync is only enqueued once while it's waiting to run """
+    mock_rq = mocker.patch('coordinator.dataservice.django_rq')
+
+    resp = admin_client.get(BASE_URL+'/studies/sync')
+    assert resp.status_code == 200
+    assert resp.json()['status'] == 'none'
+
+    resp = admin_client.post(BASE_URL+'/studies/sync')
+    assert resp.status_code == 202
+    assert resp.json()['status'] == 'queued'
+    resp = admin_client.post(BASE_URL+'/studies/sync')
+    assert resp.json()['status'] == 'queued'
+    assert mock_rq.enqueue.call_count == 1
+
+    resp = admin_client.get(BASE_URL+'/studies/sync')
+    assert resp.json()['status'] == 'queued'
+
+
+@pytest.mark.parametrize('user_type,response_code', [
+    ('admin_user', 200),
+    ('dev_user', 200),
+    ('user', 403),
+    ('unauthed_user', 403),
+])
+def test_sync_permissions(client, db, mocker, user_headers, user_type,
+                          response_code):
+    """ Test that only admins and developers may sync studies """
+    mock_rq = mocker.patch('coordinator.dataservice.django_rq')
+    headers = user_headers(user_type)
+
+    resp = client.get(BASE_URL+'/studies/sync', headers=headers)
+    assert resp.status_code == response_code
+
+    resp = client.post(BASE_URL+'/studies/sync', headers=headers)
+    assert resp.status_code == (202 if response_code == 200 else 403)
+    assert mock_rq.enqueue.call_count == (response_code == 200)
+
+
 def test_get_study(client, db):
     """ Test that dataservice is called for studies """
     return
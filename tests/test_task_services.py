@@ -1,5 +1,7 @@
 import pytest
 import time
+from datetime import timedelta
+from django.utils import timezone
 from requests.exceptions import ConnectionError
 from mock import Mock, patch
 from coordinator.api.models import TaskService, Task
@@ -41,7 +43,7 @@ def test_filters(client, transactional_db, task_service):
 def test_url_validation(admin_client, db, task_service):
     """ Test that urls are validated by pinging their status endpoint """
     orig = TaskService.objects.count()
-    with patch('coordinator.api.validators.requests.get') as mock_requests:
+    with patch('coordinator.api.validators.client.get') as mock_requests:
         mock_requests.get = Mock()
         mock_resp = Mock()
         mock_resp.content = str.encode('')
@@ -84,7 +86,7 @@ def test_url_validation(admin_client, db, task_service):
 
 def test_no_author(admin_client, db, task_service, mocker):
     """ Check that author default to the token's user's name """
-    mock_service_requests = mocker.patch('coordinator.api.validators.requests')
+    mock_service_requests = mocker.patch('coordinator.api.validators.client')
     mock_service_resp = Mock()
     mock_service_resp.status_code = 200
     mock_service_resp.content = str.encode('{"name": "test"}')
@@ -108,7 +110,7 @@ def test_no_author(admin_client, db, task_service, mocker):
 def test_disabled_task(admin_client, db, task_service, mocker, worker):
     orig = TaskService.objects.count()
 
-    mock_service_requests = mocker.patch('coordinator.api.validators.requests')
+    mock_service_requests = mocker.patch('coordinator.api.validators.client')
     mock_service_resp = Mock()
     mock_service_resp.status_code = 200
     mock_service_resp.content = str.encode('{"name": "test"}')
@@ -137,12 +139,12 @@ def test_disabled_task(admin_client, db, task_service, mocker, worker):
     worker.work(burst=True)
 
     # Run release
-    mock_requests = mocker.patch('coordinator.api.models.taskservice.requests')
+    mock_requests = mocker.patch('coordinator.api.models.taskservice.client')
     mock_resp = Mock()
     mock_resp.status_code = 200
     mock_requests.get.return_value = mock_resp
 
-    mock_tasks_requests = mocker.patch('coordinator.tasks.requests')
+    mock_tasks_requests = mocker.patch('coordinator.tasks.client')
     mock_task_resp = Mock()
     mock_task_resp.status_code = 200
     mock_task_resp.json.return_value = {'state': 'pending'}
@@ -187,7 +189,7 @@ def test_task_service_bad_status(client, db, task_service):
     """ Test that a non-200 response increases task's last_ok_status count """
     kf_id = task_service['kf_id']
     ts = TaskService.objects.get(kf_id=kf_id)
-    with patch('coordinator.api.models.taskservice.requests') as mock_requests:
+    with patch('coordinator.api.models.taskservice.client') as mock_requests:
         mock_resp = Mock()
         mock_resp.raise_for_status.side_effect = ConnectionError()
         mock_requests.get.return_value = mock_resp
@@ -208,3 +210,76 @@ def test_task_service_bad_status(client, db, task_service):
         ts.health_check()
         assert ts.last_ok_status == 4
         assert ts.health_status == 'down'
+
+
+def test_health_sweep_backoff(db, task_service, settings, mocker):
+    """ Test that services that are down are checked with backoff """
+    from coordinator.tasks import health_sweep
+    settings.HEALTH_SWEEP_INTERVAL = 10
+    settings.HEALTH_BACKOFF_MAX = 40
+    ts = TaskService.objects.get(kf_id=task_service['kf_id'])
+    ts.last_ok_status = 4
+    ts.health_checked_at = timezone.now()
+    ts.save()
+
+    mock_client = mocker.patch('coordinator.tasks.client')
+    mock_client.get.side_effect = ConnectionError()
+
+    # Not due yet
+    health_sweep()
+    assert mock_client.get.call_count == 0
+    # Forced checks ignore the backoff
+    health_sweep(force=True)
+    assert mock_client.get.call_count == 1
+    ts.refresh_from_db()
+    assert ts.last_ok_status == 5
+
+    now = ts.health_checked_at
+    assert not ts.health_check_due(now + timedelta(seconds=19))
+    assert ts.health_check_due(now + timedelta(seconds=20))
+    ts.last_ok_status = 10
+    assert not ts.health_check_due(now + timedelta(seconds=39))
+    assert ts.health_check_due(now + timedelta(seconds=40))
+
+    # A service that comes back is ok again
+    mock_client.get.side_effect = None
+    health_sweep(force=True)
+    ts.refresh_from_db()
+    assert ts.health_status == 'ok'
+
+
+def test_dispatch_skips_down_services(db, task, mocker, settings):
+    """
+    Test that tasks of services that were just found down fail without a
+    request, unless the action is to cancel
+    """
+    from coordinator.tasks import dispatch, ServiceDown
+    settings.HEALTH_SWEEP_INTERVAL = 10
+    TaskService.objects.update(last_ok_status=4,
+                               health_checked_at=timezone.now())
+    task = Task.objects.select_related('task_service').get(
+        kf_id=task['kf_id'])
+
+    mock_client = mocker.patch('coordinator.tasks.client')
+    results = dispatch(task.release, [task], 'start', [])
+
+    assert mock_client.post.call_count == 0
+    assert isinstance(results[0][2], ServiceDown)
+
+    dispatch(task.release, [task], 'cancel', [], skip_down=False)
+    assert mock_client.post.call_count == 1
+
+    # The service may have recovered since it was last checked
+    task.task_service.health_checked_at -= timedelta(seconds=10)
+    results = dispatch(task.release, [task], 'start', [])
+    assert mock_client.post.call_count == 2
+    assert results[0][2] is None
+
+
+def test_accepted_bad_body(mocker):
+    """ Test that a response that isn't json is not accepted """
+    from coordinator.tasks import accepted
+    resp = Mock(status_code=200, content=b'<html></html>')
+    resp.json.side_effect = ValueError()
+
+    assert not accepted('start', resp, None, 'running')
@@ -1,6 +1,9 @@
+import time
 import pytest
+from datetime import timedelta
+from django.utils import timezone
 from mock import Mock, patch
-from coordinator.api.models import Release, Task, TaskService
+from coordinator.api.models import Release, Task, TaskService, Event
 
 
 BASE_URL = 'http://testserver'
@@ -85,7 +88,7 @@ def test_task_relations(client, transactional_db, task):
 def test_status_check(client, transactional_db, task, worker):
     """ Check that task status are updated correctly """
     t = Task.objects.get(kf_id=task['kf_id'])
-    with patch('coordinator.api.models.task.requests') as mock_requests:
+    with patch('coordinator.api.models.task.client') as mock_requests:
         mock_resp = Mock()
         mock_resp.json.return_value = {
             'task_id': t.kf_id,
@@ -122,3 +125,243 @@ def test_no_deletion(db, admin_client, task):
     resp = admin_client.delete(f"{BASE_URL}/tasks/{task['kf_id']}")
     assert resp.status_code == 405
     assert Task.objects.count() == 1
+
+
+def test_dispatch(db, task, mocker, settings):
+    """ Check that actions are sent to all tasks under a single deadline """
+    from coordinator.tasks import dispatch
+
+    settings.DISPATCH_TIMEOUT = 0.2
+    release = Release.objects.first()
+    service = TaskService.objects.first()
+    tasks = [Task(release=release, task_service=service) for _ in range(3)]
+    Task.objects.bulk_create(tasks)
+    slow = tasks[0].kf_id
+
+    def post(url, headers, json, timeout):
+        if json['task_id'] == slow:
+            time.sleep(0.5)
+        resp = Mock()
+        resp.status_code = 200
+        return resp
+
+    mocker.patch('coordinator.tasks.client.post', side_effect=post)
+
+    start = time.time()
+    results = dispatch(release, tasks, 'start', ['SD_00000001'])
+    assert time.time() - start < 0.5
+
+    assert [t.kf_id for t, _, _ in results] == [t.kf_id for t in tasks]
+    # Only the slow service should have missed the deadline
+    for task, resp, err in results:
+        if task.kf_id == slow:
+            assert resp is None and err is not None
+        else:
+            assert resp.status_code == 200 and err is None
+
+
+def test_status_sweep(db, task, mocker):
+    """ Check that all running tasks are checked and updated in one sweep """
+    from coordinator.tasks import status_sweep
+
+    release = Release.objects.first()
+    service = TaskService.objects.first()
+    tasks = [Task(release=release, task_service=service, state='running')
+             for _ in range(3)]
+    Task.objects.bulk_create(tasks)
+    Event.objects.bulk_create([Event(task=t, release=release)
+                               for t in tasks])
+
+    mock_client = mocker.patch('coordinator.tasks.client')
+    mock_resp = Mock()
+    mock_resp.json.return_value = {'state': 'running', 'progress': 50}
+    mock_client.post.return_value = mock_resp
+
+    status_sweep()
+
+    assert mock_client.post.call_count == 3
+    for t in Task.objects.filter(state='running'):
+        assert t.progress == 50
+    # The pending task should not have been checked
+    assert Task.objects.get(kf_id=task['kf_id']).progress == 0
+
+
+def test_status_sweep_service_down(db, task, mocker):
+    """
+    Check that tasks aren't failed when their service is marked down and
+    was never asked for their status
+    """
+    from coordinator.tasks import status_sweep
+
+    release = Release.objects.first()
+    release.state = 'running'
+    release.save()
+    TaskService.objects.update(last_ok_status=4,
+                               health_checked_at=timezone.now())
+    t = Task(release=release, task_service=TaskService.objects.first(),
+             state='running')
+    t.save()
+
+    mock_client = mocker.patch('coordinator.tasks.client')
+    mock_rq = mocker.patch('coordinator.api.models.release.django_rq')
+
+    status_sweep(force=True)
+
+    assert mock_client.post.call_count == 0
+    assert mock_rq.enqueue.call_count == 0
+    assert Task.objects.get(kf_id=t.kf_id).state == 'running'
+    assert Release.objects.get(kf_id=release.kf_id).state == 'running'
+
+
+def test_status_sweep_cancels_once(db, task, mocker):
+    """
+    Check that a release is only canceled once when several of its tasks
+    fail in the same sweep
+    """
+    from coordinator.tasks import status_sweep, cancel_release
+
+    release = Release.objects.first()
+    release.state = 'running'
+    release.save()
+    service = TaskService.objects.first()
+    tasks = [Task(release=release, task_service=service, state='running')
+             for _ in range(2)]
+    Task.objects.bulk_create(tasks)
+
+    mock_client = mocker.patch('coordinator.tasks.client')
+    mock_resp = Mock()
+    mock_resp.json.return_value = {'state': 'failed'}
+    mock_client.post.return_value = mock_resp
+    mock_rq = mocker.patch('coordinator.api.models.release.django_rq')
+
+    status_sweep(force=True)
+
+    mock_rq.enqueue.assert_called_once_with(cancel_release, release.kf_id,
+                                            fail=True)
+    assert Release.objects.get(kf_id=release.kf_id).state == 'canceling'
+    assert Event.objects.filter(
+        task=None, message__contains='from running to canceling'
+    ).count() == 1
+
+
+@pytest.mark.parametrize('state', ['failed', 'canceled'])
+def test_reported_state_counted(db, task, mocker, state):
+    """
+    Check that a task that reports it failed or was canceled is saved, so
+    its release's counters see it, before the release is canceled
+    """
+    release = Release.objects.first()
+    release.state = 'running'
+    release.save()
+    t = Task(release=release, task_service=TaskService.objects.first())
+    t.save()
+    Task.objects.filter(kf_id=t.kf_id).update(state='running')
+    t.refresh_from_db()
+    mock_rq = mocker.patch('coordinator.api.models.release.django_rq')
+
+    t.update_status({'state': state})
+
+    assert Task.objects.get(kf_id=t.kf_id).state == state
+    release.refresh_from_db()
+    assert getattr(release, f'{state}_tasks') == 1
+    assert release.state == 'canceling'
+    assert mock_rq.enqueue.call_count == 1
+
+
+@pytest.mark.parametrize('state', ['failed', 'canceled'])
+def test_reported_state_cancels_once(admin_client, db, task, mocker, state):
+    """
+    Check that tasks reporting to the coordinator only cancel their release
+    once
+    """
+    release = Release.objects.first()
+    release.state = 'running'
+    release.save()
+    service = TaskService.objects.first()
+    tasks = [Task(release=release, task_service=service, state='running')
+             for _ in range(2)]
+    Task.objects.bulk_create(tasks)
+    mock_rq = mocker.patch('coordinator.api.models.release.django_rq')
+
+    for t in tasks:
+        resp = admin_client.patch(BASE_URL + f'/tasks/{t.kf_id}',
+                                  data={'state': state})
+        assert resp.status_code == 200
+
+    assert mock_rq.enqueue.call_count == 1
+    assert Release.objects.get(kf_id=release.kf_id).state == 'canceling'
+    assert Event.objects.filter(
+        task=None, message__contains='from running to canceling'
+    ).count() == 1
+
+
+def test_status_sweep_bad_response(db, task, mocker):
+    """
+    Check that a task whose service gives a bad response doesn't stop the
+    rest of the sweep
+    """
+    from coordinator.tasks import status_sweep
+
+    release = Release.objects.first()
+    service = TaskService.objects.first()
+    tasks = [Task(release=release, task_service=service, state='running')
+             for _ in range(3)]
+    Task.objects.bulk_create(tasks)
+
+    good = Mock()
+    good.json.return_value = {'state': 'running', 'progress': 50}
+    bad = Mock()
+    bad.json.side_effect = ValueError('not json')
+    mock_client = mocker.patch('coordinator.tasks.client')
+    mock_client.post.side_effect = lambda url, json, **kwargs: (
+        bad if json['task_id'] == tasks[0].kf_id else good
+    )
+    mock_reschedule = mocker.patch('coordinator.tasks.scheduler.reschedule')
+
+    status_sweep(force=True)
+
+    assert mock_client.post.call_count == 3
+    assert Task.objects.get(kf_id=tasks[0].kf_id).progress == 0
+    for t in tasks[1:]:
+        assert Task.objects.get(kf_id=t.kf_id).progress == 50
+    assert mock_reschedule.call_count == 1
+
+
+def test_last_activity(db, task):
+    """ Check that new events are recorded as activity on the task """
+    task = Task.objects.get(kf_id=task['kf_id'])
+    release = task.release
+    before = task.last_activity_at
+
+    ev = Event(task=task, release=release, message='test')
+    ev.save()
+
+    assert task.last_activity_at == ev.created_at > before
+    assert Task.objects.get(kf_id=task.kf_id).last_activity_at == \
+        ev.created_at
+    assert Release.objects.get(kf_id=release.kf_id).last_activity_at == \
+        ev.created_at
+
+
+def test_task_timeout(db, task, settings, mocker):
+    """ Check that a task with no recent activity times out its release """
+    from coordinator.tasks import cancel_release
+    settings.TASK_TIMEOUT = 60
+    mock_rq = mocker.patch('coordinator.api.models.release.django_rq')
+    release = Release.objects.first()
+    release.state = 'running'
+    release.save()
+    task = Task.objects.get(kf_id=task['kf_id'])
+    task.state = 'running'
+    task.save()
+
+    assert task.update_status({'state': 'running', 'progress': 10})
+    assert mock_rq.enqueue.call_count == 0
+
+    Task.objects.filter(kf_id=task.kf_id).update(
+        last_activity_at=timezone.now() - timedelta(seconds=61)
+    )
+    task.refresh_from_db()
+    assert not task.update_status({'state': 'running', 'progress': 10})
+    mock_rq.enqueue.assert_called_once_with(cancel_release, release.kf_id)
+    assert Release.objects.get(kf_id=release.kf_id).state == 'canceling'